@@ -0,0 +1,179 @@
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from pyzbar.locations import Point, Rect
+from pyzbar.pyzbar import ZBarSymbol, decode
+
+# Groceries only carry these; telling zbar saves it trying every symbology
+RETAIL_SYMBOLS = [ZBarSymbol.EAN13, ZBarSymbol.EAN8, ZBarSymbol.UPCA, ZBarSymbol.UPCE]
+
+# Same fields pyzbar's Decoded has that the rest of the app reads
+Barcode = namedtuple('Barcode', 'data type rect polygon')
+
+
+def to_gray(image):
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def _scaled(result, scale, dx=0, dy=0):
+    """Map a pyzbar result from a resized/cropped image back to full-res coordinates."""
+    r = result.rect
+    rect = Rect(int(r.left / scale) + dx, int(r.top / scale) + dy,
+                int(r.width / scale), int(r.height / scale))
+    polygon = [Point(int(p.x / scale) + dx, int(p.y / scale) + dy) for p in result.polygon]
+    return Barcode(result.data, result.type, rect, polygon)
+
+
+def localize(gray, max_regions=20, min_area_fraction=0.0005, min_coherence=0.8, min_energy=8.0):
+    """Find likely barcode regions with a gradient structure tensor.
+
+    Barcodes are patches with a lot of gradient energy all pointing the same
+    way (high coherence), whatever angle they are held at. Paper texture and
+    sensor noise have little energy, text has no single direction. Returns
+    cv2.minAreaRect boxes, largest first. `min_energy` is relative to the
+    image's median gradient energy.
+    """
+    grad_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    window = (15, 15)
+    jxx = cv2.blur(grad_x * grad_x, window)
+    jyy = cv2.blur(grad_y * grad_y, window)
+    jxy = cv2.blur(grad_x * grad_y, window)
+    energy = jxx + jyy
+    coherence = cv2.sqrt((jxx - jyy) ** 2 + 4 * jxy ** 2) / (energy + 1e-6)
+    mask = ((coherence > min_coherence) & (energy > min_energy * np.median(energy))).astype(np.uint8) * 255
+
+    kernel_size = max(7, int(min(gray.shape) / 60) | 1)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+    closed = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    closed = cv2.erode(closed, None, iterations=4)
+    closed = cv2.dilate(closed, None, iterations=4)
+
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_fraction * gray.shape[0] * gray.shape[1]
+    contours = sorted((c for c in contours if cv2.contourArea(c) >= min_area),
+                      key=cv2.contourArea, reverse=True)
+    return [cv2.minAreaRect(c) for c in contours[:max_regions]]
+
+
+def _crop(gray, box, scale, pad=0.25):
+    """Full-resolution crop around a box found on the downscaled image."""
+    (cx, cy), (w, h), angle = box
+    cx, cy, w, h = cx / scale, cy / scale, w / scale, h / scale
+    half = max(w, h) * (1 + pad) / 2
+    x0, y0 = max(int(cx - half), 0), max(int(cy - half), 0)
+    x1, y1 = min(int(cx + half), gray.shape[1]), min(int(cy + half), gray.shape[0])
+    return gray[y0:y1, x0:x1], x0, y0, angle
+
+
+def _deskew(crop, angle):
+    """Rotate a crop so the region's long side is horizontal."""
+    h, w = crop.shape
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(crop, m, (w, h), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+def _box_bounds(box, scale):
+    """Full-resolution (x0, y0, x1, y1) of a box found on the downscaled image, unpadded."""
+    points = cv2.boxPoints(box) / scale
+    (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+    return x0, y0, x1, y1
+
+
+def _already_read(bounds, found, share=0.5):
+    """True if a code already found covers at least `share` of the region.
+
+    A region that only touches a found code (a neighbour printed next to
+    it, or a box merging both) still gets decoded.
+    """
+    x0, y0, x1, y1 = bounds
+    area = max(x1 - x0, 1) * max(y1 - y0, 1)
+    for other in found:
+        w = min(x1, other.rect.left + other.rect.width) - max(x0, other.rect.left)
+        h = min(y1, other.rect.top + other.rect.height) - max(y0, other.rect.top)
+        if w > 0 and h > 0 and w * h >= share * area:
+            return True
+    return False
+
+
+def _same_spot(a, b):
+    """True if two results are the same printed code: same data, about the same place."""
+    if a.data != b.data:
+        return False
+    size = max(a.rect.width, a.rect.height, b.rect.width, b.rect.height)
+    dx = (a.rect.left + a.rect.width / 2) - (b.rect.left + b.rect.width / 2)
+    dy = (a.rect.top + a.rect.height / 2) - (b.rect.top + b.rect.height / 2)
+    return np.hypot(dx, dy) < size / 2
+
+
+def _add(found, barcode):
+    """Keep `barcode` unless it is a code already found at the same spot.
+
+    Two identical products in one photo are two rows, like plain pyzbar
+    returns them; the same code read again by a later pass is one.
+    """
+    if not any(_same_spot(barcode, other) for other in found):
+        found.append(barcode)
+
+
+def decode_barcodes(image, symbols=RETAIL_SYMBOLS, max_side=1280, full_frame_fallback=True,
+                    fallback_symbols=None):
+    """Decode barcodes from a photo without running zbar on all 12MP.
+
+    1. decode a downscaled grayscale copy, restricted to `symbols`
+    2. localize candidate regions on that copy and decode, at full
+       resolution, those not mostly covered by a code already found,
+       deskewing a crop only when it doesn't decode straight
+    3. if still nothing was found, fall back to a full-frame decode with
+       `fallback_symbols` (default: every symbology pyzbar knows, so QR and
+       CODE128 labels still read)
+
+    Returns (barcodes, timings): Barcode tuples in full-resolution
+    coordinates, and seconds spent per stage plus 'total'.
+    """
+    start = time.perf_counter()
+    timings = {}
+    gray = to_gray(image)
+
+    scale = min(1.0, max_side / max(gray.shape))
+    small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale,
+                                                 interpolation=cv2.INTER_AREA)
+    found = []
+    for result in decode(small, symbols=symbols):
+        _add(found, _scaled(result, scale))
+    timings['downscaled'] = time.perf_counter() - start
+
+    t = time.perf_counter()
+    boxes = localize(small)
+    timings['localize'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for box in boxes:
+        if _already_read(_box_bounds(box, scale), found):
+            continue
+        crop, x0, y0, angle = _crop(gray, box, scale)
+        if crop.size == 0:
+            continue
+        results = decode(crop, symbols=symbols)
+        if not results and angle % 90:
+            # Rotation retry: only for tilted regions that didn't decode
+            for r in decode(_deskew(crop, angle), symbols=symbols):
+                # Deskewed coordinates don't map back exactly; use the crop bounds
+                _add(found, Barcode(r.data, r.type, Rect(x0, y0, crop.shape[1], crop.shape[0]), []))
+            continue
+        for r in results:
+            _add(found, _scaled(r, 1.0, x0, y0))
+    timings['regions'] = time.perf_counter() - t
+
+    if not found and full_frame_fallback:
+        t = time.perf_counter()
+        for result in decode(gray, symbols=fallback_symbols):
+            _add(found, _scaled(result, 1.0))
+        timings['full_frame'] = time.perf_counter() - t
+
+    timings['total'] = time.perf_counter() - start
+    return found, timings
@@ -0,0 +1,56 @@
+"""Serial vs batched barcode lookups against a local mock OpenFoodFacts.
+
+    python benchmarks/bench_batch_lookup.py --barcodes 10 --delay 0.2
+
+With N barcodes and per-request latency d, the serial loop takes about N*d
+while the batched lookup should take about d (the slowest single lookup).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import online_barcode_search
+from online_barcode_search import lookup_product, lookup_products_batch
+from product_cache import ProductCache
+from mock_openfoodfacts import MockOpenFoodFacts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--barcodes', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    codes = [f'84{i:011d}' for i in range(1, args.barcodes + 1)]
+
+    with MockOpenFoodFacts(delay=args.delay) as mock:
+        online_barcode_search.OPENFOODFACTS_URL = mock.url
+
+        cache = ProductCache(':memory:')
+        start = time.perf_counter()
+        for code in codes:
+            lookup_product(code, cache=cache)
+        serial = time.perf_counter() - start
+
+        cache = ProductCache(':memory:')
+        start = time.perf_counter()
+        results = lookup_products_batch(codes, max_workers=args.workers, cache=cache)
+        batched = time.perf_counter() - start
+
+        start = time.perf_counter()
+        lookup_products_batch(codes, cache=cache)
+        warm = time.perf_counter() - start
+
+    found = sum(1 for r in results.values() if r and 'error' not in r)
+    print(f'{len(codes)} barcodes, {args.delay * 1000:.0f} ms per lookup, {found} found')
+    print(f'serial:        {serial * 1000:8.1f} ms')
+    print(f'batched:       {batched * 1000:8.1f} ms  ({serial / batched:.1f}x)')
+    print(f'batched, warm: {warm * 1000:8.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
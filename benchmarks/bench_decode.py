@@ -0,0 +1,72 @@
+"""Barcode decode cost per photo: full-frame pyzbar vs barcode_decoder's pipeline.
+
+    python benchmarks/bench_decode.py --photos 10 --codes 3 --runs 3
+
+Photos are synthetic 12MP scenes with EAN-13 codes at random angles (see
+synthetic_barcodes.py). Reports latency and how many of the printed codes
+each variant read. Needs the zbar library for pyzbar.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyzbar.pyzbar import decode  # noqa: E402
+
+from barcode_decoder import decode_barcodes  # noqa: E402
+from synthetic_barcodes import random_ean13, synthetic_scene  # noqa: E402
+
+
+def full_frame(img):
+    return decode(img)
+
+
+def pipeline(img):
+    return decode_barcodes(img)[0]
+
+
+VARIANTS = {'full-frame pyzbar (old)': full_frame, 'downscale + regions (new)': pipeline}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--photos', type=int, default=10)
+    parser.add_argument('--codes', type=int, default=3)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--max-angle', type=float, default=40.0)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    photos = []
+    for i in range(args.photos):
+        codes = [random_ean13(rng) for _ in range(args.codes)]
+        angles = list(rng.uniform(-args.max_angle, args.max_angle, args.codes))
+        photos.append((set(codes), synthetic_scene(codes, args.width, args.height,
+                                                   angles=angles, seed=i)))
+    print(f'{args.photos} photos {args.width}x{args.height}, {args.codes} codes each')
+
+    for name, fn in VARIANTS.items():
+        fn(photos[0][1])  # warm up
+        timings, found = [], 0
+        for codes, img in photos:
+            best = None
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                results = fn(img)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+            found += len(codes & {r.data.decode('utf-8') for r in results})
+        timings.sort()
+        print(f'{name:26s} median {timings[len(timings) // 2] * 1000:7.1f} ms  '
+              f'max {timings[-1] * 1000:7.1f} ms  read {found}/{args.photos * args.codes}')
+
+
+if __name__ == '__main__':
+    main()
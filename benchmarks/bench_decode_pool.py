@@ -0,0 +1,72 @@
+"""Concurrent upload decoding: request threads vs DecodePool worker processes.
+
+    python benchmarks/bench_decode_pool.py --clients 4 --photos 8
+
+Each client thread submits JPEG bytes of synthetic 12MP photos, like phones
+uploading at once. Reports photos/second and per-photo latency. Needs the
+zbar library for pyzbar.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decode_pool import DecodePool  # noqa: E402
+from synthetic_barcodes import random_ean13, synthetic_scene  # noqa: E402
+
+
+def photos(count, width, height):
+    rng = np.random.default_rng(0)
+    out = []
+    for i in range(count):
+        img = synthetic_scene([random_ean13(rng) for _ in range(3)], width, height,
+                              angles=list(rng.uniform(-30, 30, 3)), seed=i)
+        out.append(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return out
+
+
+def run(pool, clients, data):
+    pool.warm_up()
+    pool.decode(data[0])
+    latencies = []
+
+    def client(i):
+        for photo in data[i::clients]:
+            start = time.perf_counter()
+            pool.decode(photo)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(data) / elapsed, latencies[len(latencies) // 2], latencies[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--photos', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    args = parser.parse_args()
+
+    data = photos(args.photos, args.width, args.height)
+    print(f'{args.clients} clients, {args.photos} photos {args.width}x{args.height}')
+    for name, workers in [('request threads (old)', 0), (f'{args.workers} processes (new)', args.workers)]:
+        pool = DecodePool(workers=workers, max_pending=args.clients)
+        rate, median, worst = run(pool, args.clients, data)
+        pool.shutdown()
+        print(f'{name:24s} {rate:5.2f} photos/s  median {median * 1000:7.1f} ms  max {worst * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Per-pair thefuzz loop vs the batched score matrix in match_engine.
+
+    python benchmarks/bench_matching.py --products 500 --receipt-lines 2000
+
+The old loop is timed on a sample of products (it is slow) and extrapolated;
+the sampled rows are also checked for identical best matches and scores.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from thefuzz import fuzz
+
+from match_engine import assign_optimal, best_matches, score_matrix
+from match_prices import preprocess_name
+
+WORDS = ['llet', 'semi', 'sense', 'lactosa', 'farina', 'blat', 'xocolata', 'negre',
+         'formatge', 'ratllat', 'crema', 'cacauet', 'proteina', 'natural', 'cafe',
+         'soluble', 'guacamole', 'fresc', 'coriandre', 'salmo', 'verdures', 'pit',
+         'pollastre', 'arros', 'integral', 'iogurt', 'grec', 'oli', 'oliva', 'verge',
+         'tonyina', 'pa', 'motlle', 'ous', 'gallina', 'pernil', 'cuit', 'tomaquet']
+
+
+def random_name(rng, unit=True):
+    name = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4)))
+    if unit and rng.random() < 0.5:
+        name += f' {rng.choice([250, 500, 1])}{rng.choice(["g", "kg", "ml", "l"])}'
+    return name
+
+
+def brute_force(product, receipt_names):
+    matches = []
+    for i, receipt_name in enumerate(receipt_names):
+        matches.append((receipt_name, fuzz.token_sort_ratio(product, receipt_name), i, 'token_sort'))
+        matches.append((receipt_name, fuzz.partial_ratio(product, receipt_name), i, 'partial'))
+        matches.append((receipt_name, fuzz.token_set_ratio(product, receipt_name), i, 'token_set'))
+    best = max(matches, key=lambda x: x[1])
+    return best[2], best[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--receipt-lines', type=int, default=2000)
+    parser.add_argument('--sample', type=int, default=25, help='products timed with the old loop')
+    parser.add_argument('--catalog', type=int, default=400,
+                        help='distinct products the receipt lines are drawn from')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    products = [preprocess_name(random_name(rng)) for _ in range(args.products)]
+    # A month of receipts repeats the same shop items many times
+    catalog = [random_name(rng).upper() for _ in range(args.catalog)]
+    receipts = [preprocess_name(rng.choice(catalog)) for _ in range(args.receipt_lines)]
+
+    start = time.perf_counter()
+    scores, _ = score_matrix(products, receipts)
+    best_idx, best_scores = best_matches(scores)
+    batched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assigned = assign_optimal(scores, 60)
+    optimal = time.perf_counter() - start
+
+    sample = products[:args.sample]
+    start = time.perf_counter()
+    expected = [brute_force(p, receipts) for p in sample]
+    loop = (time.perf_counter() - start) * len(products) / len(sample)
+
+    mismatches = sum(1 for row, (i, score) in enumerate(expected)
+                     if (int(best_idx[row]), int(best_scores[row])) != (i, score))
+
+    print(f'{args.products} products x {args.receipt_lines} receipt lines')
+    print(f'per-pair loop (extrapolated): {loop:8.2f} s')
+    print(f'score matrix:                 {batched:8.2f} s  ({loop / batched:.0f}x)')
+    print(f'optimal assignment:           {optimal:8.2f} s  ({(assigned >= 0).sum()} products matched)')
+    print(f'mismatches in {len(sample)} sampled products: {mismatches}')
+
+
+if __name__ == '__main__':
+    main()
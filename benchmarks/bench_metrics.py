@@ -0,0 +1,44 @@
+"""Cost of the metrics layer per timed stage, enabled vs FOOD_TRACKER_METRICS=0.
+
+    python benchmarks/bench_metrics.py --number 200000
+
+Times an empty `with metrics.timed(...)` block and a decorated no-op
+function, next to the bare call, so the numbers are pure overhead.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+
+
+def bare():
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    def with_block():
+        with metrics.timed('bench'):
+            pass
+
+    baseline = min(timeit.repeat(bare, number=args.number, repeat=5)) / args.number
+    print(f'bare call             {baseline * 1e9:8.0f} ns')
+    for enabled in (False, True):
+        metrics.ENABLED = enabled
+        decorated = metrics.timed('bench_decorated')(bare)
+        for label, fn in (('with timed()', with_block), ('@timed function', decorated)):
+            per_call = min(timeit.repeat(fn, number=args.number, repeat=5)) / args.number
+            print(f'{label:16s} {"on " if enabled else "off"}  {per_call * 1e9:8.0f} ns '
+                  f'(+{(per_call - baseline) * 1e9:.0f} ns)')
+        metrics.reset()
+
+
+if __name__ == '__main__':
+    main()
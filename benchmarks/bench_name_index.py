@@ -0,0 +1,86 @@
+"""Matching products against a long receipt history: all pairs vs name-index candidates.
+
+    python benchmarks/bench_name_index.py --products 60 --receipt-lines 20000 --catalog 4000
+
+Times brute-force score_matrix against NameIndex candidate retrieval +
+score_candidates, and checks recall: how many of the brute-force best
+matches (at or above --threshold) the candidate lists still contain, and
+whether the greedy assignment comes out the same.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_matching import random_name  # noqa: E402
+from match_engine import assign_greedy, score_candidates, score_matrix  # noqa: E402
+from match_prices import preprocess_name  # noqa: E402
+from name_index import NameIndex, recall  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=60)
+    parser.add_argument('--receipt-lines', type=int, default=20000)
+    parser.add_argument('--catalog', type=int, default=4000)
+    parser.add_argument('--candidates', type=int, default=50)
+    parser.add_argument('--threshold', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    catalog = [random_name(rng).upper() for _ in range(args.catalog)]
+    receipts = [rng.choice(catalog) for _ in range(args.receipt_lines)]
+    # Products are things that were bought; the receipt sometimes prints an extra word
+    products = []
+    for _ in range(args.products):
+        words = rng.choice(catalog).lower().split()
+        if len(words) > 2 and rng.random() < 0.3:
+            words.pop()
+        products.append(preprocess_name(' '.join(words)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'names.sqlite')
+
+        start = time.perf_counter()
+        processed = [preprocess_name(name) for name in receipts]
+        brute_scores, _ = score_matrix(products, processed)
+        brute = time.perf_counter() - start
+
+        index = NameIndex(path)
+        start = time.perf_counter()
+        index.ids(receipts)
+        build = time.perf_counter() - start
+
+        reopened = NameIndex(path)
+        start = time.perf_counter()
+        processed = reopened.processed(receipts)
+        candidates = reopened.candidates(products, receipts, args.candidates)
+        pruned_scores, _ = score_candidates(products, processed, candidates)
+        pruned = time.perf_counter() - start
+
+        rate, checked = recall(products, receipts, reopened, args.threshold, args.candidates)
+        # Equal-scoring receipt lines may be picked differently; compare what was matched at what score
+        rows = np.arange(args.products)
+        brute_pick = assign_greedy(brute_scores, args.threshold)
+        pruned_pick = assign_greedy(pruned_scores, args.threshold)
+        same = (np.array_equal(brute_pick >= 0, pruned_pick >= 0)
+                and np.array_equal(brute_scores[rows, brute_pick], pruned_scores[rows, pruned_pick]))
+        scored = sum(c.size for c in candidates)
+
+    print(f'{args.products} products x {args.receipt_lines} receipt lines ({args.catalog} distinct)')
+    print(f'all pairs:          {brute * 1000:8.1f} ms')
+    print(f'index build (once): {build * 1000:8.1f} ms')
+    print(f'candidates only:    {pruned * 1000:8.1f} ms  '
+          f'({scored / (args.products * args.receipt_lines):.1%} of cells scored)')
+    print(f'recall@{args.candidates}: {rate:.1%} of {checked} matches, greedy match scores identical: {same}')
+
+
+if __name__ == '__main__':
+    main()
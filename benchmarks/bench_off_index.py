@@ -0,0 +1,78 @@
+"""Local OpenFoodFacts index: import cost and lookup latency vs the API.
+
+    python benchmarks/bench_off_index.py --products 50000 200000 --delay 0.15
+
+For each dump size a synthetic JSONL.gz export is imported (Spain only) in
+a fresh process; its peak RSS should stay flat as the dump grows. Then
+lookups of indexed barcodes are timed against a mock API with `delay`
+seconds of latency.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_upload import peak_rss, peak_rss_reset  # noqa: E402
+from mock_openfoodfacts import MockOpenFoodFacts  # noqa: E402
+from synthetic_off_dump import ean13, main as write_dump  # noqa: E402
+import off_index  # noqa: E402
+
+
+def run_import(dump, index, results):
+    import off_index
+    before = peak_rss_reset()
+    start = time.perf_counter()
+    count = off_index.import_dump(dump, index, countries=['spain'], progress_every=10 ** 9)
+    results[dump] = (count, time.perf_counter() - start, peak_rss() - before)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, nargs='+', default=[50000, 200000])
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.15)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Manager().dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.products:
+            dump = os.path.join(tmp, f'off-{n}.jsonl.gz')
+            sys.argv = ['synthetic_off_dump.py', dump, '--products', str(n)]
+            write_dump()
+            index = os.path.join(tmp, f'off-{n}.sqlite')
+            p = ctx.Process(target=run_import, args=(dump, index, results))
+            p.start()
+            p.join()
+            count, elapsed, peak = results[dump]
+            index = off_index.current_index(index)
+            print(f'{n:8d} products ({os.path.getsize(dump) / 1e6:6.1f} MB gz): kept {count}, '
+                  f'{n / elapsed:8.0f} products/s, peak +{peak / 1024:5.1f} MiB, '
+                  f'index {os.path.getsize(index) / 1e6:5.1f} MB')
+
+        from online_barcode_search import lookup_product_openfoodfacts
+        import online_barcode_search
+
+        local = off_index.OffIndex(index)
+        codes = [ean13(i) for i in range(args.lookups)]
+        start = time.perf_counter()
+        hits = sum(local.get(code) is not None for code in codes)
+        elapsed = time.perf_counter() - start
+        print(f'local index:  {elapsed / len(codes) * 1e6:8.1f} us/lookup ({hits} hits)')
+
+        with MockOpenFoodFacts(delay=args.delay) as mock:
+            online_barcode_search.OPENFOODFACTS_URL = mock.url
+            sample = codes[:20]
+            start = time.perf_counter()
+            for code in sample:
+                lookup_product_openfoodfacts(code)
+            elapsed = time.perf_counter() - start
+        print(f'mock network: {elapsed / len(sample) * 1e6:8.1f} us/lookup ({args.delay * 1000:.0f} ms latency)')
+
+
+if __name__ == '__main__':
+    main()
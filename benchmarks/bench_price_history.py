@@ -0,0 +1,84 @@
+"""Price history queries over years of synthetic purchases.
+
+    python benchmarks/bench_price_history.py --rows 1000000 --saves 60
+
+Writes `rows` purchases of 500 products in 3 stores spread over 10 years,
+in `saves` appends, then times loading the history from disk (a fresh
+process after a restart) and the trend/cheapest queries /prices runs.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_history import PriceHistory  # noqa: E402
+from synthetic_off_dump import ean13  # noqa: E402
+
+STORES = ['Bonpreu', 'Mercadona', 'Condis']
+WORDS = ['FARINA', 'LLET', 'ARROS', 'OLI', 'TONYINA', 'IOGURT', 'PA', 'OUS', 'PERNIL', 'FORMATGE']
+
+
+def purchases(n, rng, start=1420070400, years=10):
+    products = 500
+    names = [f'{WORDS[i % len(WORDS)]} {i} {(i % 4 + 1) * 250}G' for i in range(products)]
+    base_price = rng.uniform(0.5, 8.0, products)
+    sizes = np.array([(i % 4 + 1) * 250 for i in range(products)], dtype=float)
+    kcal = rng.uniform(20, 900, products)
+    protein = rng.uniform(0, 30, products)
+    product = rng.integers(0, products, n)
+    dates = np.sort(rng.integers(start, start + years * 365 * 86400, n))
+    # 3% a year of inflation plus noise
+    prices = base_price[product] * (1 + 0.03 * (dates - start) / (365 * 86400)) * rng.uniform(0.9, 1.1, n)
+    store = rng.integers(0, len(STORES), n)
+    return [{'date': int(dates[i]), 'store': STORES[store[i]], 'barcode': ean13(int(product[i])),
+             'name': names[product[i]], 'price': round(float(prices[i]), 2), 'size': sizes[product[i]],
+             'calories': kcal[product[i]], 'protein': protein[product[i]], 'source': i}
+            for i in range(n)]
+
+
+def timed(label, fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f'{label:38s} {best * 1000:9.2f} ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--saves', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = purchases(args.rows, rng)
+    path = tempfile.mkdtemp(prefix='food-prices-')
+    history = PriceHistory(path)
+    start = time.perf_counter()
+    for chunk in np.array_split(np.arange(len(rows)), args.saves):
+        history.append(rows[chunk[0]:chunk[-1] + 1])
+    print(f'appended {len(history)} rows in {args.saves} saves: {time.perf_counter() - start:.2f}s')
+    print(f'again (all duplicates): {history.append(rows[:1000])} rows added')
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    print(f'on disk: {size / 1e6:.1f} MB in {len(os.listdir(path))} files')
+
+    timed('load from disk', lambda: len(PriceHistory(path)), repeat=3)
+    trend = timed('trend FARINA price_per_kg by month', lambda: history.trend(name='farina'))
+    timed('trend one barcode by week', lambda: history.trend(barcode=ean13(7), period='week', by='barcode'))
+    timed('trend all products by year', lambda: history.trend(period='year'))
+    top = timed('cheapest price_per_g_protein', lambda: history.cheapest())
+    timed('cheapest per 100 kcal, last year, 1 store',
+          lambda: history.cheapest('price_per_100kcal', since='2024-01-01', store='Bonpreu'))
+    print(f'{len(trend)} trend points, e.g. {trend[0]}')
+    print(f'cheapest protein: {top[0]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Building /upload's product rows: per-row pd.concat vs ProductRecord list.
+
+    python benchmarks/bench_product_rows.py --repeat 200
+
+Times turning N lookup results (1, 10, 100 barcodes in a photo) into the
+rows /upload stores and returns as JSON.
+"""
+import argparse
+import os
+import sys
+import timeit
+import warnings
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from online_barcode_search import ProductRecord  # noqa: E402
+
+COLUMNS = ['barcode', 'product_name', 'size', 'calories', 'fat', 'protein',
+           'carbohydrates', 'fiber', 'sugars']
+
+
+def lookups_for(n):
+    return {f'84{i:011d}': {'product_name': f'Product {i}', 'quantity': 500.0, 'size': 500.0,
+                            'macros_per100': {'calories': 350, 'fat': 1.2, 'protein': 10.0,
+                                              'carbohydrates': 72.0, 'fiber': 3.1, 'sugars': 0.5}}
+            for i in range(n)}
+
+
+def concat_rows(lookups):
+    """What upload_file used to do."""
+    products_df = pd.DataFrame(columns=COLUMNS)
+    for code, product_dict in lookups.items():
+        macro_values = product_dict.get('macros_per100', {})
+        product = [code, product_dict['product_name'], product_dict.get('quantity') or 1,
+                   macro_values.get('calories'), macro_values.get('fat'),
+                   macro_values.get('protein'), macro_values.get('carbohydrates'),
+                   macro_values.get('fiber'), macro_values.get('sugars')]
+        products_df = pd.concat([products_df, pd.DataFrame([product], columns=products_df.columns)],
+                                ignore_index=True)
+    return products_df.to_dict(orient='records')
+
+
+def record_rows(lookups):
+    return [ProductRecord.from_lookup(code, result).as_dict() for code, result in lookups.items()]
+
+
+def record_frame(lookups):
+    """Records converted to a DataFrame once, for callers that want one."""
+    return pd.DataFrame.from_records(record_rows(lookups), columns=COLUMNS)
+
+
+VARIANTS = {'pd.concat per row (old)': concat_rows, 'ProductRecord list (new)': record_rows,
+            'records -> one DataFrame': record_frame}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)  # pandas' empty-frame concat warning
+
+    for n in (1, 10, 100):
+        lookups = lookups_for(n)
+        assert record_rows(lookups) == concat_rows(lookups)
+        for name, fn in VARIANTS.items():
+            repeat = max(5, args.repeat // n)
+            best = min(timeit.repeat(lambda: fn(lookups), number=repeat, repeat=3)) / repeat
+            print(f'{n:4d} barcodes  {name:26s} {best * 1e6:10.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Accuracy and throughput of receipt_engine on synthetic receipts.
+
+    python benchmarks/bench_receipt_engine.py --receipts 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_engine import iter_parse
+from synthetic_receipts import generate_corpus
+
+FIELDS = ('original_name', 'price', 'quantity', 'unit_price')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receipts', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.receipts, seed=args.seed)
+    n_lines = sum(len(lines) for lines, _ in corpus)
+    n_items = sum(len(expected) for _, expected in corpus)
+
+    correct = 0
+    exact_receipts = 0
+    parsed_items = 0
+    start = time.perf_counter()
+    for lines, expected in corpus:
+        parsed = list(iter_parse(lines))
+        parsed_items += len(parsed)
+        matches = sum(1 for got, want in zip(parsed, expected)
+                      if all(got[f] == want[f] for f in FIELDS))
+        correct += matches
+        exact_receipts += matches == len(expected) == len(parsed)
+    elapsed = time.perf_counter() - start
+
+    print(f'{args.receipts} receipts, {n_lines} lines, {n_items} items')
+    print(f'item accuracy:    {correct / n_items:.2%} ({parsed_items} items parsed)')
+    print(f'exact receipts:   {exact_receipts / args.receipts:.2%}')
+    print(f'throughput:       {n_lines / elapsed:,.0f} lines/s')
+
+
+if __name__ == '__main__':
+    main()
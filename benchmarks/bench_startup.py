@@ -0,0 +1,98 @@
+"""Server cold start: import cost of server.py and time until the first request.
+
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --top 20     # heaviest imports only
+
+Runs `python -X importtime -c "import server"` and lists the modules that
+cost the most, then starts serve.py (with and without --lazy) on a free port
+and times how long until GET / answers. Each run is a fresh process, so the
+numbers include the interpreter itself; the OS file cache is warm after the
+first run.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def env_for(tmp):
+    env = dict(os.environ)
+    env.setdefault('FOOD_TRACKER_OFFLINE', '1')
+    env.setdefault('FOOD_TRACKER_CACHE_DIR', os.path.join(tmp, 'cache'))
+    env.setdefault('FOOD_TRACKER_DB', os.path.join(tmp, 'food_tracker.sqlite'))
+    return env
+
+
+def import_times(env):
+    """(module, self us, cumulative us, depth) for every import of `import server`."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import server'],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(own), int(cumulative), depth))
+    return rows
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_request(env, extra_args, timeout=60):
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+                             *extra_args], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError('server did not answer')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=12)
+    args = parser.parse_args()
+
+    env = env_for(tempfile.mkdtemp(prefix='food-startup-'))
+    import_times(env)  # warm the OS file cache
+    rows = import_times(env)
+    total = sum(own for _, own, _, _ in rows)
+    print(f'import server: {total / 1000:.0f} ms in {len(rows)} modules')
+    print('heaviest direct imports (cumulative):')
+    direct = [r for r in rows if r[3] == 1]
+    for name, _, cumulative, _ in sorted(direct, key=lambda r: -r[2])[:args.top]:
+        print(f'  {name:32s} {cumulative / 1000:8.1f} ms')
+    heavy = ('pandas', 'cv2', 'pyzbar', 'rapidfuzz', 'thefuzz', 'gspread', 'oauth2client', 'googletrans')
+    loaded = sorted({r[0] for r in rows if r[0].split('.')[0] in heavy and '.' not in r[0]})
+    print(f'heavy dependencies imported at startup: {", ".join(loaded) or "none"}')
+
+    for label, extra in (('serve.py', []), ('serve.py --lazy', ['--lazy'])):
+        times = [time_to_first_request(env, extra) for _ in range(args.repeat)]
+        print(f'{label:18s} first request after {min(times) * 1000:6.0f} ms (best of {args.repeat}), '
+              f'median {sorted(times)[len(times) // 2] * 1000:6.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Image handling cost per /upload: temp file + PIL vs in-memory cv2 decode.
+
+    python benchmarks/bench_upload.py --width 4000 --height 3000 --runs 5
+
+Each variant runs in a fresh process and reports its peak RSS growth over
+the process baseline (Linux; elsewhere the figure is only approximate). Add
+--zbar to include pyzbar.decode in the timing (needs the zbar library).
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+
+def synthetic_photo(width, height, seed=0):
+    """JPEG bytes of a noisy phone-photo-sized image."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+    img = cv2.add(img, rng.integers(0, 20, img.shape, dtype=np.uint8))
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def disk_pil(data, zbar):
+    from PIL import Image
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'image.jpg')
+        with open(path, 'wb') as f:
+            f.write(data)
+        img = Image.open(path)
+        img.load()
+        if zbar:
+            from pyzbar.pyzbar import decode
+            decode(img)
+        else:
+            img.convert('L')  # what pyzbar.decode does with a PIL image
+
+
+def memory_cv2(data, zbar):
+    buf = io.BytesIO(data).getbuffer()
+    img = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if zbar:
+        from pyzbar.pyzbar import decode
+        decode(img)
+
+
+VARIANTS = {'disk + PIL (old)': disk_pil, 'in-memory cv2 (new)': memory_cv2}
+
+
+def _rss_kib(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+def peak_rss_reset():
+    """Reset the peak-RSS mark (Linux) and return the current RSS in KiB."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _rss_kib('VmRSS:')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss():
+    try:
+        return _rss_kib('VmHWM:')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(name, data, runs, zbar, results):
+    fn = VARIANTS[name]
+    fn(data, zbar)  # warm up imports and allocator
+    before = peak_rss_reset()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(data, zbar)
+        timings.append(time.perf_counter() - start)
+    peak = peak_rss() - before
+    results[name] = (min(timings), sorted(timings)[len(timings) // 2], peak)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--zbar', action='store_true')
+    args = parser.parse_args()
+
+    data = synthetic_photo(args.width, args.height)
+    print(f'{args.width}x{args.height} JPEG, {len(data) / 1e6:.1f} MB')
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Manager().dict()
+    for name in VARIANTS:
+        p = ctx.Process(target=run, args=(name, data, args.runs, args.zbar, results))
+        p.start()
+        p.join()
+
+    for name, (best, median, peak) in results.items():
+        print(f'{name:22s} best {best * 1000:7.1f} ms  median {median * 1000:7.1f} ms  '
+              f'peak +{peak / 1024:6.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
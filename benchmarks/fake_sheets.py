@@ -0,0 +1,75 @@
+"""In-memory stand-in for the parts of gspread that SheetsSink uses.
+
+    sink = SheetsSink(client_factory=FakeSheetsClient)
+
+`latency` adds an artificial delay per API call; `fail_every` makes every
+n-th call raise a 429 so retries can be exercised.
+"""
+import re
+import time
+
+import gspread
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = f'{{"error": {{"code": {status_code}, "message": "fake", "status": "fake"}}}}'
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': 'fake', 'status': 'fake'}}
+
+
+class FakeWorksheet:
+    def __init__(self, client, rows=1000):
+        self.client = client
+        self.row_count = rows
+        self.cells = []
+
+    def get_all_values(self):
+        self.client.call('get_all_values')
+        width = max((len(r) for r in self.cells), default=0)
+        return [[str(v) for v in r] + [''] * (width - len(r)) for r in self.cells]
+
+    def add_rows(self, n):
+        self.client.call('add_rows')
+        self.row_count += n
+
+    def batch_update(self, data):
+        self.client.call('batch_update')
+        for update in data:
+            row = int(re.match(r'[A-Z]+(\d+)', update['range']).group(1)) - 1
+            for offset, values in enumerate(update['values']):
+                if row + offset >= self.row_count:
+                    raise ValueError('exceeds grid limits')
+                while len(self.cells) <= row + offset:
+                    self.cells.append([])
+                self.cells[row + offset] = list(values)
+
+
+class FakeSpreadsheet:
+    def __init__(self, client):
+        self.client = client
+        self.sheets = {}
+
+    def worksheet(self, name):
+        self.client.call('worksheet')
+        return self.sheets.setdefault(name, FakeWorksheet(self.client))
+
+
+class FakeSheetsClient:
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = []
+        self.books = {}
+
+    def call(self, name):
+        self.calls.append(name)
+        time.sleep(self.latency)
+        if self.fail_every and len(self.calls) % self.fail_every == 0:
+            raise gspread.exceptions.APIError(_Response(429))
+
+    def open(self, name):
+        self.call('open')
+        return self.books.setdefault(name, FakeSpreadsheet(self))
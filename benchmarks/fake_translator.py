@@ -0,0 +1,29 @@
+"""Stand-in for googletrans' Translator, used by the benchmarks.
+
+    translation._translator = FakeTranslator(latency=0.3)
+
+Answers with translation.translate_offline after `latency` seconds per
+call, like one Google Translate round trip per batch. `calls` and `strings`
+count what reached it, so cache hits can be told apart from translations.
+"""
+import time
+
+from translation import translate_offline
+
+
+class _Translated:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTranslator:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.strings = 0
+
+    def translate(self, texts, src='es', dest='ca'):
+        self.calls += 1
+        self.strings += len(texts)
+        time.sleep(self.latency)
+        return [_Translated(translate_offline(t, src, dest)) for t in texts]
@@ -0,0 +1,134 @@
+"""Load test: many phones using the server at once, against local stubs.
+
+    python benchmarks/load_test.py --clients 20 --rounds 5 --server waitress
+    python benchmarks/load_test.py --clients 20 --rounds 5 --server single
+
+Each client thread has its own session and repeats: upload a barcode photo,
+post a receipt, save to sheets (and poll the save job until it is done,
+reported as "(job)"). A 429 from /upload is retried after its
+Retry-After, like the page would, and counted in that upload's latency.
+OpenFoodFacts is the mock API with --lookup-delay latency, translation runs
+offline and Google Sheets is the fake client with --sheets-latency per call.
+Prints p50/p99 latency per endpoint. Needs the zbar library, like the server.
+
+--server waitress is what serve.py runs; "dev" is Flask's threaded dev
+server; "single" handles one request at a time, which is what a slow
+upstream call does to everyone when requests are not isolated.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+tmp = tempfile.mkdtemp(prefix='food-load-')
+os.environ.setdefault('FOOD_TRACKER_OFFLINE', '1')
+os.environ.setdefault('FOOD_TRACKER_CACHE_DIR', os.path.join(tmp, 'cache'))
+os.environ.setdefault('FOOD_TRACKER_DB', os.path.join(tmp, 'food_tracker.sqlite'))
+os.environ.setdefault('FOOD_TRACKER_NAME_INDEX', os.path.join(tmp, 'names.sqlite'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import requests  # noqa: E402
+
+import online_barcode_search  # noqa: E402
+import save_to_sheets  # noqa: E402
+import server  # noqa: E402
+from fake_sheets import FakeSheetsClient  # noqa: E402
+from mock_openfoodfacts import MockOpenFoodFacts  # noqa: E402
+from synthetic_barcodes import random_ean13, synthetic_scene  # noqa: E402
+from synthetic_receipts import generate_receipt  # noqa: E402
+
+
+def start_server(kind, threads):
+    """Run the app on an ephemeral port in a daemon thread; returns its URL."""
+    if kind == 'waitress':
+        from waitress.server import create_server
+        srv = create_server(server.app, host='127.0.0.1', port=0, threads=threads)
+        threading.Thread(target=srv.run, daemon=True).start()
+        return f'http://127.0.0.1:{srv.effective_port}'
+    from werkzeug.serving import make_server
+    srv = make_server('127.0.0.1', 0, server.app, threaded=(kind == 'dev'))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{srv.server_port}'
+
+
+def photo(rng):
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    codes = [random_ean13(np_rng) for _ in range(3)]
+    img = synthetic_scene(codes, 1600, 1200, module_px=3, seed=rng.randrange(1000))
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def client(url, rounds, seed, latencies, retries):
+    rng = random.Random(seed)
+    http = requests.Session()
+    http.headers['X-Session-Id'] = uuid.uuid4().hex
+    photos = [photo(rng) for _ in range(2)]
+    for i in range(rounds):
+        lines, _ = generate_receipt(rng)
+        calls = [
+            ('/upload', dict(files={'file': ('photo.jpg', photos[i % len(photos)])})),
+            ('/parse_receipt', dict(json={'text': '\n'.join(lines)})),
+            ('/save_to_sheets', {}),
+        ]
+        for path, kwargs in calls:
+            start = time.perf_counter()
+            response = http.post(url + path, timeout=300, **kwargs)
+            while response.status_code == 429:
+                retries.append(path)
+                time.sleep(float(response.headers.get('Retry-After', 1)) * rng.uniform(0.5, 1.0))
+                response = http.post(url + path, timeout=300, **kwargs)
+            latencies.append((path, time.perf_counter() - start, response.status_code))
+            if response.status_code == 202:
+                # Background job: also time how long until it has finished
+                status_url = url + response.json()['status_url']
+                while http.get(status_url, timeout=30).json()['status'] in ('queued', 'running'):
+                    time.sleep(0.1)
+                latencies.append((path + ' (job)', time.perf_counter() - start, 200))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--server', choices=['waitress', 'dev', 'single'], default='waitress')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--lookup-delay', type=float, default=0.2)
+    parser.add_argument('--sheets-latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake = FakeSheetsClient(latency=args.sheets_latency)
+    save_to_sheets._sinks[("Food Tracking", "Receipts")] = save_to_sheets.SheetsSink(
+        client_factory=lambda: fake)
+
+    with MockOpenFoodFacts(delay=args.lookup_delay) as mock:
+        online_barcode_search.OPENFOODFACTS_URL = mock.url
+        server.get_decode_pool().warm_up()
+        url = start_server(args.server, args.threads)
+        latencies, retries = [], []
+        threads = [threading.Thread(target=client, args=(url, args.rounds, i, latencies, retries))
+                   for i in range(args.clients)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+    print(f'{args.server}: {args.clients} clients x {args.rounds} rounds in {elapsed:.1f}s '
+          f'({len(latencies) / elapsed:.1f} req/s)')
+    for path in dict.fromkeys(p for p, _, _ in latencies):
+        times = np.array([t for p, t, _ in latencies if p == path]) * 1000
+        errors = sum(1 for p, _, status in latencies if p == path and status >= 500)
+        print(f'{path:22s} n={len(times):4d}  p50 {np.percentile(times, 50):8.1f} ms  '
+              f'p99 {np.percentile(times, 99):8.1f} ms  429s retried {retries.count(path):3d}  5xx {errors}')
+
+
+if __name__ == '__main__':
+    main()
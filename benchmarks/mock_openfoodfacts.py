@@ -0,0 +1,74 @@
+"""Local stand-in for the OpenFoodFacts product API, used by the benchmarks.
+
+Serves /api/v0/product/<barcode>.json with a configurable artificial latency.
+Barcodes ending in 0 are reported as not found.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PRODUCT_PATH = re.compile(r'^/api/v0/product/(\d+)\.json$')
+
+
+def fake_product(barcode):
+    return {
+        'product_name': f'Producte {barcode[-4:]}',
+        'quantity': '500 g',
+        'nutriments': {
+            'energy-kcal_100g': 350,
+            'proteins_100g': 12.5,
+            'fat_100g': 3.1,
+            'carbohydrates_100g': 70,
+            'fiber_100g': 2.7,
+            'sugars_100g': 1.2,
+        },
+    }
+
+
+class MockOpenFoodFacts:
+    """Threaded HTTP server answering product lookups after `delay` seconds."""
+
+    def __init__(self, delay=0.1, host='127.0.0.1', port=0):
+        self.delay = delay
+        self.requests = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                mock.requests += 1
+                match = PRODUCT_PATH.match(self.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                time.sleep(mock.delay)
+                barcode = match.group(1)
+                if barcode.endswith('0'):
+                    payload = {'status': 0, 'status_verbose': 'product not found'}
+                else:
+                    payload = {'status': 1, 'product': fake_product(barcode)}
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,154 @@
+"""Replay a recorded camera frame sequence against the live scan endpoints.
+
+    python benchmarks/replay_scan.py                      # synthetic shelf pan
+    python benchmarks/replay_scan.py --frames recorded/   # a directory of JPEG/PNG frames
+    python benchmarks/replay_scan.py --save recorded/     # write the synthetic pan out
+    python benchmarks/replay_scan.py --url http://phone-server:5000 --fps 15
+
+Frames are POSTed at --fps like the page does, while a second thread reads
+the events stream. Prints how many frames were accepted or dropped, when
+each barcode first showed up and whether every product arrived exactly once.
+Without --url the app runs in-process on waitress with the mock
+OpenFoodFacts server, like load_test.py. Needs the zbar library.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+tmp = tempfile.mkdtemp(prefix='food-scan-')
+os.environ.setdefault('FOOD_TRACKER_OFFLINE', '1')
+os.environ.setdefault('FOOD_TRACKER_CACHE_DIR', os.path.join(tmp, 'cache'))
+os.environ.setdefault('FOOD_TRACKER_DB', os.path.join(tmp, 'food_tracker.sqlite'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import requests  # noqa: E402
+
+from mock_openfoodfacts import MockOpenFoodFacts  # noqa: E402
+from synthetic_barcodes import random_ean13, synthetic_scene  # noqa: E402
+
+
+def shelf_pan(n_codes=6, frame_size=(640, 480), step=40, seed=0):
+    """(codes, frames): a camera panning along a shelf of `n_codes` products."""
+    rng = np.random.default_rng(seed)
+    codes = [random_ean13(rng) for _ in range(n_codes)]
+    width, height = frame_size
+    shelf = synthetic_scene(codes, width=n_codes * 420, height=2 * height, module_px=3, seed=seed)
+    frames = []
+    for x in range(0, shelf.shape[1] - 2 * width + 1, step):
+        crop = shelf[:, x:x + 2 * width]
+        frame = cv2.resize(crop, frame_size, interpolation=cv2.INTER_AREA)
+        frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
+    return codes, frames
+
+
+def load_frames(directory):
+    paths = sorted(p for p in glob.glob(os.path.join(directory, '*'))
+                   if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+    frames = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            frames.append(f.read())
+    return frames
+
+
+def start_local_server(threads=32):
+    import server
+    from waitress.server import create_server
+    srv = create_server(server.app, host='127.0.0.1', port=0, threads=threads)
+    threading.Thread(target=srv.run, daemon=True).start()
+    return f'http://127.0.0.1:{srv.effective_port}'
+
+
+def replay(url, frames, fps):
+    http = requests.Session()
+    scan = http.post(url + '/scan', timeout=10).json()
+    events, first_seen = [], {}
+    start = time.perf_counter()
+
+    def read_events():
+        cursor = 0
+        while True:
+            with http.get(url + scan['events_url'], params={'cursor': cursor}, stream=True, timeout=60) as r:
+                for line in r.iter_lines():
+                    event = json.loads(line)
+                    if event['type'] == 'end':
+                        cursor = event['cursor']
+                        if event['closed']:
+                            return
+                    elif event['type'] != 'ping':
+                        events.append(event)
+                        if event['type'] == 'barcode':
+                            first_seen[event['barcode']] = time.perf_counter() - start
+
+    reader = threading.Thread(target=read_events, daemon=True)
+    reader.start()
+
+    accepted = 0
+    for i, frame in enumerate(frames):
+        due = start + i / fps
+        time.sleep(max(0.0, due - time.perf_counter()))
+        response = http.post(url + scan['frame_url'], data=frame,
+                             headers={'Content-Type': 'image/jpeg'}, timeout=10)
+        accepted += response.json()['accepted']
+    # Let the last decodes and lookups finish before closing
+    time.sleep(2.0)
+    summary = http.delete(url + f"/scan/{scan['scan_id']}", timeout=10).json()
+    reader.join(timeout=10)
+    return summary, accepted, events, first_seen, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', help='directory of recorded frames (sorted by name)')
+    parser.add_argument('--save', help='write the synthetic frames to this directory and exit')
+    parser.add_argument('--url', help='scan against a running server instead of an in-process one')
+    parser.add_argument('--fps', type=float, default=10)
+    parser.add_argument('--codes', type=int, default=6)
+    parser.add_argument('--lookup-delay', type=float, default=0.2)
+    args = parser.parse_args()
+
+    expected = None
+    if args.frames:
+        frames = load_frames(args.frames)
+    else:
+        expected, frames = shelf_pan(args.codes)
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for i, frame in enumerate(frames):
+            with open(os.path.join(args.save, f'frame{i:04d}.jpg'), 'wb') as f:
+                f.write(frame)
+        print(f'Wrote {len(frames)} frames to {args.save}; codes: {", ".join(expected)}')
+        return
+
+    if args.url:
+        summary, accepted, events, first_seen, elapsed = replay(args.url, frames, args.fps)
+    else:
+        import online_barcode_search
+        with MockOpenFoodFacts(delay=args.lookup_delay) as mock:
+            online_barcode_search.OPENFOODFACTS_URL = mock.url
+            import server
+            server.get_decode_pool().warm_up()
+            summary, accepted, events, first_seen, elapsed = replay(start_local_server(), frames, args.fps)
+
+    print(f'{len(frames)} frames at {args.fps:g} fps in {elapsed:.1f}s: {accepted} decoded, '
+          f'{len(frames) - accepted} dropped while a decode was running')
+    for code, t in sorted(first_seen.items(), key=lambda item: item[1]):
+        print(f'  {code} first seen after {t:5.2f}s')
+    resolved = [e.get('barcode') or e['product']['barcode'] for e in events if e['type'] != 'barcode']
+    duplicates = len(resolved) - len(set(resolved))
+    print(f'{len(summary["barcodes"])} barcodes, {len(resolved)} resolved ({duplicates} duplicates)')
+    if expected is not None:
+        missing = set(expected) - set(summary['barcodes'])
+        print(f'missed: {", ".join(sorted(missing)) or "none"}')
+
+
+if __name__ == '__main__':
+    main()
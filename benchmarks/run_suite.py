@@ -0,0 +1,449 @@
+"""Benchmark suite: decode, parse, lookup, translate, match and export at several scales.
+
+    python benchmarks/run_suite.py                          # small + medium, all stages
+    python benchmarks/run_suite.py --scales large --stages match,export
+    python benchmarks/run_suite.py --output before.json
+    python benchmarks/run_suite.py --compare before.json    # exit 1 on a regression
+
+Everything runs on synthetic data against local stand-ins: photos of
+rendered EAN-13s at several resolutions and angles (synthetic_barcodes.py),
+Catalan/Spanish receipts in both layouts (synthetic_receipts.py), the mock
+OpenFoodFacts server, a fake Google Translate client and a fake Sheets
+client. Each stage reports the best of --repeat runs, its throughput, and
+a quality figure (codes found, items parsed exactly, products matched to
+the right line) so a change that gets faster by doing less shows up too.
+
+Peak memory is tracemalloc's peak over one extra run: Python and NumPy
+allocations, not buffers allocated inside OpenCV or zbar. The decode stage
+needs the zbar library and is skipped without it.
+
+--output saves the results as JSON, together with the git revision and the
+machine they ran on; --compare flags stages that got more than --tolerance
+slower, hungrier or less accurate than a saved run, beyond how much each
+run's repeats varied; it needs --repeat 3 or more. Compare runs from the
+same machine only.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+tmp = tempfile.mkdtemp(prefix='food-suite-')
+os.environ.setdefault('FOOD_TRACKER_CACHE_DIR', os.path.join(tmp, 'cache'))
+os.environ.setdefault('FOOD_TRACKER_DB', os.path.join(tmp, 'food_tracker.sqlite'))
+os.environ.setdefault('FOOD_TRACKER_NAME_INDEX', os.path.join(tmp, 'names.sqlite'))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+import online_barcode_search  # noqa: E402
+import translation  # noqa: E402
+from fake_sheets import FakeSheetsClient  # noqa: E402
+from fake_translator import FakeTranslator  # noqa: E402
+from mock_openfoodfacts import MockOpenFoodFacts  # noqa: E402
+from synthetic_receipts import PRODUCTS, generate_corpus  # noqa: E402
+
+# Items per stage at each scale: photos, receipts, barcodes, receipts,
+# products (matched against 4x as many receipt lines) and sheet rows
+SCALES = {
+    'small': {'decode': 6, 'parse': 500, 'parse_smart': 500, 'lookup': 50, 'lookup_cached': 50,
+              'translate': 50, 'match': 50, 'export': 100, 'export_update': 100},
+    'medium': {'decode': 18, 'parse': 5000, 'parse_smart': 5000, 'lookup': 200, 'lookup_cached': 200,
+               'translate': 200, 'match': 200, 'export': 1000, 'export_update': 1000},
+    'large': {'decode': 48, 'parse': 50000, 'parse_smart': 50000, 'lookup': 1000, 'lookup_cached': 1000,
+              'translate': 1000, 'match': 800, 'export': 5000, 'export_update': 5000},
+}
+RESOLUTIONS = [(1280, 960), (2592, 1944), (4000, 3000)]
+ANGLES = [0.0, 8.0, -20.0, 45.0, 90.0]
+
+
+def decode_stage(n, seed, args):
+    import cv2
+    from pyzbar.pyzbar import decode  # noqa: F401  (fails early without zbar)
+
+    from decode_pool import decode_image_bytes
+    from synthetic_barcodes import random_ean13, synthetic_scene
+
+    rng = np.random.default_rng(seed)
+    photos = []
+    for i in range(n):
+        width, height = RESOLUTIONS[i % len(RESOLUTIONS)]
+        codes = [random_ean13(rng) for _ in range(3)]
+        img = synthetic_scene(codes, width, height, module_px=max(2, width // 1000),
+                              angles=[float(rng.choice(ANGLES)) for _ in codes], seed=seed + i)
+        photos.append((cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes(), codes))
+
+    def run():
+        read = 0
+        for data, codes in photos:
+            barcodes, _ = decode_image_bytes(data)
+            read += len(set(codes) & {b.data.decode('utf-8') for b in barcodes})
+        return {'read_rate': read / (3 * n)}
+    return run, 'photos'
+
+
+def _parse_run(corpus, parse):
+    fields = ('original_name', 'price', 'quantity', 'unit_price')
+    n_items = sum(len(expected) for _, expected in corpus)
+
+    def run():
+        correct = 0
+        for lines, expected in corpus:
+            parsed = parse(lines)
+            correct += sum(1 for got, want in zip(parsed, expected)
+                           if all(got.get(f, want[f]) == want[f] for f in fields))
+        return {'accuracy': correct / n_items}
+    return run
+
+
+def parse_stage(n, seed, args):
+    from receipt_parser import extract_items
+    return _parse_run(generate_corpus(n, seed=seed), extract_items), 'receipts'
+
+
+def parse_smart_stage(n, seed, args):
+    """SmartReceiptParser gets the pasted text and only gives names and line totals."""
+    from smart_receipt_parser import SmartReceiptParser
+
+    def parse(lines):
+        items = SmartReceiptParser('\n'.join(lines)).parse()
+        return [{'original_name': name, 'price': float(price)} for name, price in items.items()]
+    corpus = generate_corpus(n, seed=seed)
+    # parse() is a dict by name, so a receipt listing a product twice can't be exact
+    corpus = [(lines, list({item['original_name']: item for item in expected}.values()))
+              for lines, expected in corpus]
+    return _parse_run(corpus, parse), 'receipts'
+
+
+def _barcodes(n, seed, not_found=0.1):
+    rng = random.Random(seed)
+    # Codes ending in 0 are "not found" on the mock server
+    return [f'84{rng.randrange(10 ** 10):010d}{0 if rng.random() < not_found else rng.randrange(1, 10)}'
+            for _ in range(n)]
+
+
+def lookup_stage(n, seed, args):
+    from product_cache import ProductCache
+    codes = _barcodes(n, seed)
+
+    def run():
+        cache = ProductCache(os.path.join(tmp, f'products-{uuid.uuid4().hex}.sqlite'))
+        results = online_barcode_search.lookup_products_batch(codes, deadline=60, cache=cache)
+        return {'found': sum(1 for r in results.values() if r and 'error' not in r) / n}
+    return run, 'barcodes'
+
+
+def lookup_cached_stage(n, seed, args):
+    from product_cache import ProductCache
+    codes = _barcodes(n, seed)
+    cache = ProductCache(os.path.join(tmp, f'products-{uuid.uuid4().hex}.sqlite'))
+    online_barcode_search.lookup_products_batch(codes, deadline=60, cache=cache)
+
+    def run():
+        results = online_barcode_search.lookup_products_batch(codes, deadline=60, cache=cache)
+        return {'found': sum(1 for r in results.values() if r and 'error' not in r) / n}
+    return run, 'barcodes'
+
+
+def translate_stage(n, seed, args):
+    """One batch per receipt, like /parse_receipt, into an empty cache."""
+    from receipt_parser import extract_items, translate_items
+    receipts = [extract_items(lines) for lines, _ in generate_corpus(n, seed=seed)]
+
+    def run():
+        cache = translation.TranslationCache(os.path.join(tmp, f'translations-{uuid.uuid4().hex}.sqlite'))
+        fake = FakeTranslator(latency=args.translate_latency)
+        translation._translator = fake
+        original = translation.get_translation_cache
+        translation.get_translation_cache = lambda: cache
+        try:
+            for items in receipts:
+                translate_items([dict(item) for item in items])
+        finally:
+            translation.get_translation_cache = original
+        return {'translator_calls': fake.calls}
+    return run, 'receipts'
+
+
+def _receipt_line(rng, name):
+    price = round(rng.uniform(0.5, 9.5), 2)
+    return {'simple_name': name.lower(), 'price': price, 'original_name': name,
+            'quantity': 1, 'unit_price': price}
+
+
+def _products_and_receipt_lines(n, seed, missing=0.1):
+    """n products, 4n shuffled receipt lines, and the receipt name each product should match.
+
+    Each product is bought under its own name, except a `missing` share
+    that isn't on the receipt at all and should stay unmatched (None);
+    the other lines are random products.
+    """
+    rng = random.Random(seed)
+    products, lines, truth = [], [], {}
+    for i in range(n):
+        barcode = f'84{i:011d}'
+        if rng.random() < missing:
+            products.append({'barcode': barcode, 'product_name': f'Producte sense tiquet {i}',
+                             'size': 500, 'calories': rng.uniform(20, 900), 'protein': rng.uniform(0, 30)})
+            truth[barcode] = None
+            continue
+        name = rng.choice(PRODUCTS)
+        products.append({'barcode': barcode, 'product_name': f'{name.title()} {rng.choice([250, 500, 1000])}g',
+                         'size': 500, 'calories': rng.uniform(20, 900), 'protein': rng.uniform(0, 30)})
+        lines.append(_receipt_line(rng, name))
+        truth[barcode] = name
+    while len(lines) < 4 * n:
+        lines.append(_receipt_line(rng, rng.choice(PRODUCTS)))
+    rng.shuffle(lines)
+    return products, lines, truth
+
+
+def match_stage(n, seed, args):
+    """A fresh session with n products and 4n receipt lines, matched once.
+
+    `correct` is the share of products matched to a line with their own
+    name, or left unmatched when they aren't on the receipt.
+    """
+    from match_prices import IncrementalMatcher
+    from storage import Store
+    store = Store(os.path.join(tmp, 'match.sqlite'))
+    products, lines, truth = _products_and_receipt_lines(n, seed)
+
+    def run():
+        session_id = uuid.uuid4().hex
+        store.add_barcodes(session_id, products)
+        store.add_receipt_items(session_id, 'bench', lines)
+        result = IncrementalMatcher(store).match(session_id, threshold=60, assignment='optimal')
+        matched = result['matched_receipt_name'].where(result['matched_price'].notna(), None)
+        correct = sum(truth[barcode] == name for barcode, name in zip(result.attrs['barcodes'], matched))
+        return {'matched': float(result['matched_price'].notna().mean()), 'correct': correct / n}
+    return run, 'products'
+
+
+def _match_frame(n, seed):
+    import pandas as pd
+    from storage import MATCH_COLUMNS
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'product_name': [f'Producte {i}' for i in range(n)],
+        'english_name': [f'Product {i}' for i in range(n)],
+        'calories': rng.uniform(20, 900, n).round(1),
+        'protein': rng.uniform(0, 30, n).round(1),
+        'fat': rng.uniform(0, 40, n).round(1),
+        'portion_size': rng.choice([250, 500, 1000], n),
+        'num_servings': rng.integers(1, 10, n),
+        'matched_price': rng.uniform(0.5, 9.5, n).round(2),
+        'match_score': rng.integers(60, 101, n),
+        'matched_receipt_name': [f'PRODUCTE {i}' for i in range(n)],
+    }, columns=MATCH_COLUMNS)
+
+
+def _sink(args):
+    from save_to_sheets import SheetsSink
+    fake = FakeSheetsClient(latency=args.sheets_latency)
+    return SheetsSink(client_factory=lambda: fake), fake
+
+
+def export_stage(n, seed, args):
+    """The first save of a session: every row goes to an empty sheet."""
+    df = _match_frame(n, seed)
+
+    def run():
+        sink, fake = _sink(args)
+        sink.write(df)
+        return {'api_calls': len(fake.calls)}
+    return run, 'rows'
+
+
+def export_update_stage(n, seed, args):
+    """Saving again after 5% of the rows changed; only those are sent."""
+    df = _match_frame(n, seed)
+    changed = df.copy()
+    rows = np.random.default_rng(seed).choice(n, max(1, n // 20), replace=False)
+    changed.loc[rows, 'matched_price'] += 0.1
+
+    sink, fake = _sink(args)
+    sink.write(df)
+    frames = [changed, df]
+
+    def run():
+        # Alternate between the two frames so every run has the same rows to send
+        frames.reverse()
+        calls = len(fake.calls)
+        sent = sink.write(frames[-1])
+        return {'api_calls': len(fake.calls) - calls, 'rows_sent': sent}
+    return run, 'rows'
+
+
+STAGES = {
+    'decode': decode_stage,
+    'parse': parse_stage,
+    'parse_smart': parse_smart_stage,
+    'lookup': lookup_stage,
+    'lookup_cached': lookup_cached_stage,
+    'translate': translate_stage,
+    'match': match_stage,
+    'export': export_stage,
+    'export_update': export_update_stage,
+}
+# Higher is better for every quality figure except these
+LOWER_IS_BETTER = {'api_calls', 'rows_sent', 'translator_calls'}
+# Best-of-one timings vary by tens of percent from run to run
+MIN_COMPARE_REPEAT = 3
+
+
+def measure(run, repeat):
+    """(best seconds, spread, peak MB of a traced run, quality dict of the last run).
+
+    `spread` is how much slower the median run was than the best one, as a
+    fraction: how noisy this stage's timing is on this machine. What the
+    app prints while a stage runs is swallowed.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            quality = run()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    best = min(times)
+    return best, statistics.median(times) / best - 1, peak / 1e6, quality
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + ('-dirty' if dirty else '')
+
+
+def machine():
+    return {'platform': platform.platform(), 'python': platform.python_version(),
+            'processor': platform.processor() or platform.machine(), 'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, tolerance):
+    """Print new vs saved figures per stage; returns the list of regressions."""
+    if baseline.get('machine') != machine():
+        print('warning: the baseline was recorded on a different machine')
+    old = {(r['stage'], r['scale']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'stage':14s} {'scale':7s} {'before':>11s} {'after':>11s} {'change':>8s}")
+    for r in results:
+        before = old.get((r['stage'], r['scale']))
+        if before is None:
+            continue
+        change = r['seconds'] / before['seconds'] - 1
+        problems = []
+        # A few milliseconds either way is noise on a busy machine, and so is
+        # however much the two runs' own repeats varied
+        noise = r.get('spread', 0) + before.get('spread', 0)
+        if change > tolerance + noise and r['seconds'] - before['seconds'] > 0.005:
+            problems.append(f'{change:+.0%} time')
+        if r['peak_mb'] > before['peak_mb'] * (1 + tolerance) and r['peak_mb'] - before['peak_mb'] > 1:
+            problems.append(f"peak {before['peak_mb']:.1f} -> {r['peak_mb']:.1f} MB")
+        for key, value in r['quality'].items():
+            was = before['quality'].get(key)
+            if was is None:
+                continue
+            worse = value > was if key in LOWER_IS_BETTER else value < was - 0.01
+            if worse:
+                problems.append(f'{key} {was:g} -> {value:g}')
+        flag = '  REGRESSION: ' + ', '.join(problems) if problems else ''
+        print(f"{r['stage']:14s} {r['scale']:7s} {before['seconds'] * 1000:9.1f}ms "
+              f"{r['seconds'] * 1000:9.1f}ms {change:+8.0%}{flag}")
+        if problems:
+            regressions.append((r['stage'], r['scale'], problems))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', default='small,medium', help=f"comma-separated: {', '.join(SCALES)}")
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated stage names')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--lookup-delay', type=float, default=0.02, help='mock OpenFoodFacts latency (s)')
+    parser.add_argument('--translate-latency', type=float, default=0.05, help='per translation batch (s)')
+    parser.add_argument('--sheets-latency', type=float, default=0.0, help='per Sheets API call (s)')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', help='a JSON file from an earlier --output run')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown / memory growth before flagging (0.25 = 25%%)')
+    args = parser.parse_args()
+    if args.compare and args.repeat < MIN_COMPARE_REPEAT:
+        parser.error(f'--compare needs --repeat {MIN_COMPARE_REPEAT} or more: one run is too noisy to compare')
+
+    scales = args.scales.split(',')
+    stages = args.stages.split(',')
+    unknown = [s for s in scales if s not in SCALES] + [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown scale/stage: {', '.join(unknown)}")
+
+    # Every stage that translates (parsing, matching) uses the fake client
+    translation.OFFLINE = False
+    translation._translator = FakeTranslator(latency=args.translate_latency)
+    results, skipped = [], {}
+    print(f"{'stage':14s} {'scale':7s} {'items':>7s} {'best':>10s} {'throughput':>18s} {'peak':>9s}  quality")
+    with MockOpenFoodFacts(delay=args.lookup_delay) as mock:
+        online_barcode_search.OPENFOODFACTS_URL = mock.url
+        for stage in stages:
+            for scale in scales:
+                n = SCALES[scale][stage]
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        run, unit = STAGES[stage](n, args.seed, args)
+                except ImportError as e:
+                    skipped[stage] = str(e)
+                    print(f'{stage:14s} skipped: {e}')
+                    break
+                seconds, spread, peak_mb, quality = measure(run, args.repeat)
+                results.append({'stage': stage, 'scale': scale, 'items': n, 'unit': unit,
+                                'seconds': seconds, 'spread': spread, 'throughput': n / seconds,
+                                'peak_mb': peak_mb, 'quality': quality})
+                shown = ', '.join(f'{k} {v:.3g}' for k, v in quality.items())
+                print(f'{stage:14s} {scale:7s} {n:7d} {seconds * 1000:8.1f}ms '
+                      f'{n / seconds:9.1f} {unit + "/s":8s} {peak_mb:7.2f}MB  {shown}')
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': git_revision(),
+              'machine': machine(), 'settings': {k: v for k, v in vars(args).items()
+                                                  if k not in ('output', 'compare')},
+              'results': results, 'skipped': skipped}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved {len(results)} results to {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regressions against {args.compare}')
+            sys.exit(1)
+        print(f'No regressions against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
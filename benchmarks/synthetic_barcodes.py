@@ -0,0 +1,81 @@
+"""Render EAN-13 barcodes into synthetic phone-photo-like images."""
+import cv2
+import numpy as np
+
+L_CODES = ['0001101', '0011001', '0010011', '0111101', '0100011',
+           '0110001', '0101111', '0111011', '0110111', '0001011']
+G_CODES = ['0100111', '0110011', '0011011', '0100001', '0011101',
+           '0111001', '0000101', '0010001', '0001001', '0010111']
+R_CODES = ['1110010', '1100110', '1101100', '1000010', '1011100',
+           '1001110', '1010000', '1000100', '1001000', '1110100']
+PARITY = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+          'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL']
+
+
+def ean13_check_digit(digits12):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits12))
+    return str((10 - total % 10) % 10)
+
+
+def random_ean13(rng, prefix='84'):
+    body = prefix + ''.join(str(rng.integers(0, 10)) for _ in range(12 - len(prefix)))
+    return body + ean13_check_digit(body)
+
+
+def ean13_modules(code):
+    """The 95 bar/space modules of an EAN-13 code as a '0'/'1' string."""
+    first, left, right = code[0], code[1:7], code[7:]
+    bits = '101'
+    for digit, parity in zip(left, PARITY[int(first)]):
+        bits += (L_CODES if parity == 'L' else G_CODES)[int(digit)]
+    bits += '01010'
+    for digit in right:
+        bits += R_CODES[int(digit)]
+    return bits + '101'
+
+
+def render_ean13(code, module_px=3, height_px=None, quiet=10):
+    """Grayscale image of one barcode with a white quiet zone."""
+    modules = ean13_modules(code)
+    height_px = height_px or module_px * 60
+    row = np.array([0 if m == '1' else 255 for m in '0' * quiet + modules + '0' * quiet],
+                   dtype=np.uint8)
+    row = np.repeat(row, module_px)
+    return np.tile(row, (height_px, 1))
+
+
+def place(canvas, patch, center, angle=0.0):
+    """Paste `patch` rotated by `angle` degrees onto `canvas` around `center`."""
+    h, w = patch.shape
+    side = int(np.hypot(h, w)) + 2
+    square = np.full((side, side), 255, dtype=np.uint8)
+    y0, x0 = (side - h) // 2, (side - w) // 2
+    square[y0:y0 + h, x0:x0 + w] = patch
+    mask = np.zeros_like(square)
+    mask[y0:y0 + h, x0:x0 + w] = 255
+    m = cv2.getRotationMatrix2D((side / 2, side / 2), angle, 1.0)
+    square = cv2.warpAffine(square, m, (side, side), borderValue=255)
+    mask = cv2.warpAffine(mask, m, (side, side), borderValue=0)
+
+    cx, cy = center
+    top, left = int(cy - side / 2), int(cx - side / 2)
+    region = canvas[top:top + side, left:left + side]
+    sel = mask[:region.shape[0], :region.shape[1]] > 127
+    region[sel] = square[:region.shape[0], :region.shape[1]][sel]
+    return canvas
+
+
+def synthetic_scene(codes, width=4000, height=3000, module_px=4, angles=None, seed=0):
+    """A textured background with the given EAN-13 codes spread over it."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(60, 200, (height // 32 + 1, width // 32 + 1), dtype=np.uint8)
+    canvas = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    angles = angles or [0.0] * len(codes)
+    cols = int(np.ceil(np.sqrt(len(codes))))
+    rows = int(np.ceil(len(codes) / cols))
+    for i, (code, angle) in enumerate(zip(codes, angles)):
+        cx = int((i % cols + 0.5) * width / cols)
+        cy = int((i // cols + 0.5) * height / rows)
+        place(canvas, render_ean13(code, module_px=module_px), (cx, cy), angle)
+    noise = rng.normal(0, 6, canvas.shape)
+    return np.clip(canvas + noise, 0, 255).astype(np.uint8)
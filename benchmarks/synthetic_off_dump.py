@@ -0,0 +1,65 @@
+"""Write a fake OpenFoodFacts export (JSONL or tab-separated CSV, optionally gzipped).
+
+    python benchmarks/synthetic_off_dump.py /tmp/off.jsonl.gz --products 200000
+
+Products look like the real export's: barcode, name, quantity, countries
+and a spread of _100g nutriments, plus the bulky fields (ingredients,
+images...) the importer has to skip over. About a quarter are Spanish.
+"""
+import argparse
+import csv
+import gzip
+import json
+import random
+
+COUNTRIES = ['en:spain', 'en:france', 'en:germany', 'en:italy', 'en:united-states']
+NUTRIMENTS = ['energy-kcal_100g', 'proteins_100g', 'fat_100g', 'carbohydrates_100g',
+              'fiber_100g', 'sugars_100g', 'salt_100g', 'saturated-fat_100g']
+WORDS = ['llet', 'leche', 'pa', 'arros', 'tomaquet', 'formatge', 'oli', 'pasta', 'iogurt',
+         'galetes', 'xocolata', 'cafe', 'suc', 'taronja', 'pollastre', 'pernil']
+
+
+def ean13(i):
+    body = f'84{i:010d}'
+    total = sum(int(d) * (3 if n % 2 else 1) for n, d in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def products(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            'code': ean13(i),
+            'product_name': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title(),
+            'quantity': f'{rng.choice([100, 250, 500, 750, 1000])} g',
+            'countries_tags': [rng.choice(COUNTRIES)] if rng.random() < 0.9 else ['en:spain', 'en:andorra'],
+            'nutriments': {k: round(rng.uniform(0, 60), 1) for k in NUTRIMENTS},
+            'ingredients_text': ', '.join(rng.choice(WORDS) for _ in range(40)),
+            'image_url': f'https://images.example/{i}.jpg',
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output', help='.jsonl or .csv, add .gz to compress')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    opener = gzip.open if args.output.endswith('.gz') else open
+    with opener(args.output, 'wt', encoding='utf-8', newline='') as f:
+        if '.csv' in args.output:
+            columns = ['code', 'product_name', 'quantity', 'countries_tags', 'ingredients_text', *NUTRIMENTS]
+            writer = csv.writer(f, delimiter='\t', quoting=csv.QUOTE_NONE, escapechar='\\')
+            writer.writerow(columns)
+            for p in products(args.products, args.seed):
+                writer.writerow([p['code'], p['product_name'], p['quantity'], ','.join(p['countries_tags']),
+                                 p['ingredients_text'], *(p['nutriments'][k] for k in NUTRIMENTS)])
+        else:
+            for p in products(args.products, args.seed):
+                f.write(json.dumps(p) + '\n')
+    print(f'Wrote {args.products} products to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
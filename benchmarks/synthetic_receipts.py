@@ -0,0 +1,91 @@
+"""Synthetic Catalan/Spanish supermarket receipts with known contents.
+
+Two layouts, matching what iPhone text capture gives us:
+
+* "scan":  name line, price line with "€" and a VAT code, stray lines
+* "ticket": "<qty> NAME" lines, price below, unit price + total for qty > 1,
+  closed by a TOTAL / TARGETA BANCARA footer
+"""
+import random
+
+PRODUCTS = [
+    'LLET SEMI S/LACTOSA', 'DET. PELLS SENSIBLES', 'CLARA LÍQUIDA PASTEU', 'MINESTRA',
+    'BLAT DE MORO', 'F. RATLLAT S/LACTOSA', 'CREMA 100% CACAUET', 'PROTEINA 0% NAT',
+    'CAFÉ SOLUBLE CLASSIC', 'GUACAMOLE FRESC', 'CORIANDRE', 'SALMO AMB VERDURES',
+    'CONTRACUIXA S/PELL', 'PIT FAM.', 'P. HIGIENIC COMPACTE', 'LLIMA SAFATA',
+    'CORIANDRE FRESC ECO', 'XOCOLATA NEGRE REBOSTE', 'FARINA 1KG', 'MEL DE FLORS',
+    'OUS GALLINA L', 'PERNIL CUIT', 'IOGURT GREC', 'OLI OLIVA VERGE', 'TONYINA CLARA',
+    'PA DE MOTLLE', 'ARRÒS INTEGRAL', 'TOMÀQUET TRITURAT', 'HARINA DE TRIGO',
+    'LECHE ENTERA', 'QUESO RALLADO', 'PECHUGA DE POLLO',
+]
+
+
+def _euros(value):
+    return f'{value:.2f}'.replace('.', ',')
+
+
+def random_items(rng, n_items):
+    items = []
+    for _ in range(n_items):
+        quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+        unit_price = round(rng.uniform(0.5, 9.5), 2)
+        items.append({
+            'original_name': rng.choice(PRODUCTS),
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'price': round(unit_price * quantity, 2),
+        })
+    return items
+
+
+def render_scan(items, rng):
+    lines = []
+    for item in items:
+        lines.append(item['original_name'])
+        if rng.random() < 0.5:
+            lines.append('')
+        style = rng.randrange(3)
+        if style == 0:
+            lines.append(f"{_euros(item['price'])} € {rng.randint(1, 4)}")
+        elif style == 1:
+            lines += [_euros(item['price']), f'€ {rng.randint(1, 4)}']
+        else:
+            lines += [_euros(item['price']), '€', str(rng.randint(1, 4))]
+    return lines
+
+
+def render_ticket(items, rng):
+    lines = []
+    for item in items:
+        lines.append(f"{item['quantity']} {item['original_name']}")
+        if item['quantity'] > 1:
+            if rng.random() < 0.5:
+                lines[-1] += f" {_euros(item['unit_price'])} {_euros(item['price'])}"
+            else:
+                lines += [_euros(item['unit_price']), _euros(item['price'])]
+        else:
+            if rng.random() < 0.5:
+                lines.append('')
+            lines.append(_euros(item['price']))
+    total = sum(item['price'] for item in items)
+    lines += ['', f'TOTAL (€) {_euros(total)}', 'TARGETA BANCARA', _euros(total)]
+    return lines
+
+
+def generate_receipt(rng, n_items=None, layout=None):
+    """Return (text lines, expected items) for one random receipt."""
+    n_items = n_items or rng.randint(5, 30)
+    layout = layout or rng.choice(['scan', 'ticket'])
+    items = random_items(rng, n_items)
+    if layout == 'scan':
+        # The scan layout never shows quantities, only the line total
+        for item in items:
+            item['quantity'] = 1
+            item['unit_price'] = item['price']
+        return render_scan(items, rng), items
+    return render_ticket(items, rng), items
+
+
+def generate_corpus(n_receipts, seed=0):
+    rng = random.Random(seed)
+    return [generate_receipt(rng) for _ in range(n_receipts)]
@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# FOOD_TRACKER_DECODE_WORKERS=0 decodes on the request thread like before
+DECODE_WORKERS = int(os.environ.get('FOOD_TRACKER_DECODE_WORKERS', os.cpu_count() or 1))
+# Photos allowed in flight (running + waiting) before uploads get a 429
+DECODE_QUEUE = int(os.environ.get('FOOD_TRACKER_DECODE_QUEUE', 2 * max(DECODE_WORKERS, 1)))
+
+
+class PoolBusy(Exception):
+    """Raised when the decode queue is full. The client should retry later."""
+
+
+def _init_worker():
+    import cv2
+    # One process per core already; OpenCV's own threads would just fight them
+    cv2.setNumThreads(1)
+
+
+def decode_image_bytes(data):
+    """Decode an encoded photo (JPEG/PNG bytes) and read its barcodes.
+
+    Runs in a worker process. Returns (barcodes, timings), or (None, timings)
+    if the bytes are not an image. OpenCV and zbar are imported here rather
+    than at module level so the web server starts without them.
+    """
+    import cv2
+    import numpy as np
+    from barcode_decoder import decode_barcodes
+
+    start = time.perf_counter()
+    arr = np.frombuffer(data, np.uint8)
+    img = cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE) if arr.size else None
+    timings = {'imdecode': time.perf_counter() - start}
+    if img is None:
+        return None, timings
+    barcodes, decode_timings = decode_barcodes(img)
+    timings.update(decode_timings)
+    timings['total'] = time.perf_counter() - start
+    return barcodes, timings
+
+
+class DecodePool:
+    """Decodes uploaded photos in worker processes.
+
+    Image conversion and zbar hold the GIL, so on the request thread one
+    slow photo stalls every other client of the worker. Here each photo
+    goes to a process of its own and throughput scales with cores. At most
+    `max_pending` photos are accepted at once; past that `decode` raises
+    PoolBusy instead of queueing forever. With workers=0 photos are decoded
+    inline on the calling thread.
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = DECODE_WORKERS if workers is None else workers
+        self.max_pending = max_pending or DECODE_QUEUE
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded server is asking for trouble (and Windows has no fork)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker)
+            return self._executor
+
+    def decode(self, data, timeout=None, wait=None):
+        """Decode `data` (encoded image bytes). Returns (barcodes, timings).
+
+        timings also has 'queued': seconds spent waiting for a free worker.
+        Raises PoolBusy when the queue is full, right away or after waiting
+        `wait` seconds for a slot.
+        """
+        acquired = (self._slots.acquire(blocking=False) if wait is None
+                    else self._slots.acquire(timeout=wait))
+        if not acquired:
+            raise PoolBusy(f'{self.max_pending} images already being decoded')
+        submitted = time.perf_counter()
+        if self.workers == 0:
+            try:
+                barcodes, timings = decode_image_bytes(data)
+            finally:
+                self._slots.release()
+        else:
+            try:
+                barcodes, timings = self._submit(data).result(timeout=timeout)
+            except BrokenProcessPool:
+                # A worker died (out of memory on a huge photo?); start fresh and retry once.
+                # The dead future gave its slot back (its callback may still be on its way)
+                self._reset()
+                if not self._slots.acquire(timeout=5):
+                    raise PoolBusy(f'{self.max_pending} images already being decoded')
+                barcodes, timings = self._submit(data).result(timeout=timeout)
+        elapsed = time.perf_counter() - submitted
+        timings['queued'] = max(0.0, elapsed - timings.get('total', elapsed))
+        return barcodes, timings
+
+    def _submit(self, data):
+        """Hand `data` to a worker. Its slot is released when the decode ends.
+
+        Not when the caller gives up: after a timeout the worker keeps
+        decoding, and counting it as free would let slow photos occupy
+        every worker while new uploads are still accepted.
+        """
+        try:
+            future = self._get_executor().submit(decode_image_bytes, data)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _reset(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def warm_up(self):
+        """Start the worker processes now rather than on the first upload."""
+        if self.workers:
+            executor = self._get_executor()
+            for future in [executor.submit(_init_worker) for _ in range(self.workers)]:
+                future.result()
+        else:
+            import barcode_decoder  # noqa: F401
+
+    def shutdown(self):
+        self._reset()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_decode_pool():
+    """Return the process-wide DecodePool, creating it on first use."""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = DecodePool()
+    return _default_pool
@@ -0,0 +1,154 @@
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class Job:
+    """One unit of background work and what became of it."""
+
+    def __init__(self, key, fn, owner=None, max_retries=3, is_transient=None, serial=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.serial = key if serial is None else serial
+        self.fn = fn
+        self.owner = owner
+        self.max_retries = max_retries
+        self.is_transient = is_transient or (lambda e: False)
+
+        self.status = QUEUED
+        self.attempts = 0
+        self.coalesced = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'coalesced': self.coalesced,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Runs submitted functions on background worker threads.
+
+    Submitting a job whose `key` matches one that is still queued returns the
+    queued job instead of adding another, so ten clicks on "save" while the
+    first save runs cause one more save, not ten. Jobs with the same
+    `serial` (default: their key) never run at the same time; a later one
+    waits, still queued, until the running one has finished. Failures the job's
+    `is_transient` accepts are retried with exponential backoff, up to
+    `max_retries` times. The last `keep` finished jobs stay queryable.
+    """
+
+    def __init__(self, workers=2, keep=1000, backoff=2.0):
+        self.keep = keep
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._pending = {}
+        self._running = set()
+        self._held = {}
+        self._queue = queue.Queue()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, key, fn, owner=None, max_retries=3, is_transient=None, serial=None):
+        """Queue `fn()` unless an identical job (same `key`) is already waiting."""
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.coalesced += 1
+                return pending
+            job = Job(key, fn, owner, max_retries, is_transient, serial)
+            self._jobs[job.id] = job
+            self._pending[key] = job
+            self._trim()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(self._jobs) - self.keep)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.serial in self._running:
+                    # Requeued by the running job when it finishes
+                    self._held.setdefault(job.serial, deque()).append(job)
+                    self._queue.task_done()
+                    continue
+                self._running.add(job.serial)
+                # From here on a new submit with this key queues a fresh job,
+                # since this one may already have read the data it is about
+                if self._pending.get(job.key) is job:
+                    del self._pending[job.key]
+                job.status = RUNNING
+                job.started_at = time.time()
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running.discard(job.serial)
+                    held = self._held.get(job.serial)
+                    if held:
+                        self._queue.put(held.popleft())
+                        if not held:
+                            del self._held[job.serial]
+                self._queue.task_done()
+
+    def _run(self, job):
+        while True:
+            job.attempts += 1
+            try:
+                job.result = job.fn()
+                job.status = DONE
+                break
+            except Exception as e:
+                job.error = f'{type(e).__name__}: {e}'
+                if job.attempts > job.max_retries or not job.is_transient(e):
+                    print(f"Job {job.key} failed after {job.attempts} attempts: {job.error}")
+                    job.status = FAILED
+                    break
+                delay = self.backoff * 2 ** (job.attempts - 1) * (1 + random.random())
+                print(f"Job {job.key} failed ({job.error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        job.finished_at = time.time()
+        job.done.set()
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide JobQueue, creating it on first use."""
+    global _default_queue
+    if _default_queue is None:
+        with _default_queue_lock:
+            if _default_queue is None:
+                _default_queue = JobQueue()
+    return _default_queue
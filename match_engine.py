@@ -0,0 +1,186 @@
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz.process import cdist
+from rapidfuzz.utils import default_process
+
+# Same scorers (and the same preference order on ties) fuzzy_match_prices has
+# always used. thefuzz runs the token scorers on fully processed, ascii-only
+# strings and partial_ratio on the raw strings, so we do the same here.
+SCORERS = (
+    ('token_sort', fuzz.token_sort_ratio, True),
+    ('partial', fuzz.partial_ratio, False),
+    ('token_set', fuzz.token_set_ratio, True),
+)
+METHODS = tuple(name for name, _, _ in SCORERS)
+
+
+# What thefuzz strips for force_ascii (accented Latin-1 letters and symbols)
+_LATIN1 = {i: None for i in range(128, 256)}
+
+
+def _ascii_process(s):
+    # Same as thefuzz's full_process(s, force_ascii=True): drop chars 128-255, then clean up
+    return default_process(s.translate(_LATIN1))
+
+
+def _unique(strings):
+    """Distinct strings plus, for each input, the index of its distinct copy."""
+    positions = {}
+    inverse = np.fromiter((positions.setdefault(s, len(positions)) for s in strings),
+                          dtype=np.intp, count=len(strings))
+    return list(positions), inverse
+
+
+def score_matrix(queries, choices, workers=-1):
+    """Score every query against every choice in one batched pass.
+
+    Returns (scores, methods): two int arrays of shape
+    (len(queries), len(choices)) holding the best score over all scorers and
+    the index into METHODS of the scorer that produced it. Scores are rounded
+    to ints exactly like thefuzz does. Repeated strings (the same product on
+    several receipts) are only scored once.
+    """
+    queries = [str(q) for q in queries]
+    choices = [str(c) for c in choices]
+    if not queries or not choices:
+        empty = np.zeros((len(queries), len(choices)), dtype=np.int16)
+        return empty, empty.copy()
+
+    unique_queries, query_inverse = _unique(queries)
+    unique_choices, choice_inverse = _unique(choices)
+    processed_queries = [_ascii_process(q) for q in unique_queries]
+    processed_choices = [_ascii_process(c) for c in unique_choices]
+
+    per_method = []
+    for _, scorer, processed in SCORERS:
+        if processed:
+            q, c = processed_queries, processed_choices
+        else:
+            q, c = unique_queries, unique_choices
+        scores = cdist(q, c, scorer=scorer, dtype=np.float32, workers=workers)
+        per_method.append(np.rint(scores).astype(np.int16))
+
+    stacked = np.stack(per_method)
+    # argmax returns the first maximum, i.e. the earliest scorer in SCORERS
+    best = stacked.max(axis=0)
+    method = stacked.argmax(axis=0).astype(np.int16)
+    rows = np.ix_(query_inverse, choice_inverse)
+    return best[rows], method[rows]
+
+
+def score_candidates(queries, choices, candidates, workers=1):
+    """Like score_matrix, but only score each query against its candidates.
+
+    `candidates[i]` holds the choice indices worth scoring for query i (see
+    name_index.NameIndex.candidates). Other cells are left at 0, which no
+    threshold accepts. Identical candidate strings are scored once per query.
+    """
+    queries = [str(q) for q in queries]
+    choices = [str(c) for c in choices]
+    scores = np.zeros((len(queries), len(choices)), dtype=np.int16)
+    methods = np.zeros((len(queries), len(choices)), dtype=np.int16)
+    processed = {}
+    for row, (query, columns) in enumerate(zip(queries, candidates)):
+        columns = np.asarray(columns, dtype=np.intp)
+        if columns.size == 0:
+            continue
+        unique_choices, inverse = _unique([choices[c] for c in columns])
+        processed_query = _ascii_process(query)
+        for c in unique_choices:
+            if c not in processed:
+                processed[c] = _ascii_process(c)
+        processed_choices = [processed[c] for c in unique_choices]
+        per_method = []
+        for _, scorer, use_processed in SCORERS:
+            q, c = ([processed_query], processed_choices) if use_processed else ([query], unique_choices)
+            per_method.append(np.rint(cdist(q, c, scorer=scorer, dtype=np.float32,
+                                            workers=workers)[0]).astype(np.int16))
+        stacked = np.stack(per_method)
+        scores[row, columns] = stacked.max(axis=0)[inverse]
+        methods[row, columns] = stacked.argmax(axis=0).astype(np.int16)[inverse]
+    return scores, methods
+
+
+def extend_score_matrix(scores, methods, queries, choices, new_queries, new_choices):
+    """Grow a (scores, methods) pair computed for queries x choices.
+
+    Only the new cells are scored: new queries against every choice, and the
+    existing queries against the new choices.
+    """
+    right = score_matrix(queries, new_choices)
+    bottom = score_matrix(new_queries, list(choices) + list(new_choices))
+    return grow_score_matrix(scores, methods, right, bottom)
+
+
+def grow_score_matrix(scores, methods, right, bottom):
+    """Attach already-scored blocks to a (scores, methods) pair.
+
+    `right` holds (scores, methods) for the existing queries against the new
+    choices, `bottom` the new queries against all choices.
+    """
+    rows = right[0].shape[0]
+    cols = scores.size // rows if rows else bottom[0].shape[1] - right[0].shape[1]
+    scores = np.vstack([np.hstack([scores.reshape(rows, cols), right[0]]), bottom[0]])
+    methods = np.vstack([np.hstack([methods.reshape(rows, cols), right[1]]), bottom[1]])
+    return scores, methods
+
+
+def best_matches(scores):
+    """Best choice for each query row: (indices, scores).
+
+    Ties go to the lowest choice index, like max() over the row did.
+    """
+    if scores.shape[1] == 0:
+        empty = np.full(scores.shape[0], -1, dtype=np.intp)
+        return empty, np.zeros(scores.shape[0], dtype=scores.dtype)
+    indices = scores.argmax(axis=1)
+    return indices, scores[np.arange(scores.shape[0]), indices]
+
+
+def assign_greedy(scores, threshold):
+    """Each query independently takes its best choice if it reaches threshold.
+
+    Returns an array with the assigned choice index per query, or -1.
+    Several queries may end up on the same choice.
+    """
+    indices, best = best_matches(scores)
+    return np.where(best >= threshold, indices, -1)
+
+
+def assign_optimal(scores, threshold):
+    """One-to-one assignment maximising the total score of accepted pairs.
+
+    Pairs below `threshold` are never used. Only queries and choices joined by
+    an above-threshold pair can influence each other, so the problem is split
+    into the connected components of that sparse graph and each block is
+    solved separately with the Hungarian algorithm. Returns an array with the
+    assigned choice index per query, or -1.
+    """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n_queries, n_choices = scores.shape
+    assigned = np.full(n_queries, -1, dtype=np.intp)
+    rows, cols = np.nonzero(scores >= threshold)
+    if rows.size == 0:
+        return assigned
+
+    # Bipartite graph: queries are nodes 0..n-1, choices n..n+m-1
+    graph = coo_matrix((np.ones(rows.size, dtype=np.int8), (rows, cols + n_queries)),
+                       shape=(n_queries + n_choices,) * 2)
+    _, labels = connected_components(graph, directed=False)
+
+    query_labels = labels[:n_queries]
+    choice_labels = labels[n_queries:]
+    for label in np.unique(query_labels[rows]):
+        block_rows = np.flatnonzero(query_labels == label)
+        block_cols = np.flatnonzero(choice_labels == label)
+        block = scores[np.ix_(block_rows, block_cols)].astype(np.int32)
+        # Sub-threshold pairs weigh nothing, so picking one is the same as
+        # leaving both sides unmatched
+        block[block < threshold] = 0
+        r, c = linear_sum_assignment(block, maximize=True)
+        keep = block[r, c] > 0
+        assigned[block_rows[r[keep]]] = block_cols[c[keep]]
+    return assigned
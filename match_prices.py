@@ -1,9 +1,23 @@
+import numpy as np
 import pandas as pd
-from thefuzz import fuzz
-from thefuzz import process
-from googletrans import Translator
+from translation import translate, translate_batch
+from match_engine import METHODS, assign_greedy, assign_optimal, grow_score_matrix, score_candidates, score_matrix
+from name_index import get_name_index
+from storage import BARCODE_COLUMNS, RECEIPT_COLUMNS, get_store
+import metrics
+import contextlib
+import hashlib
+import marshal
 import re
+import threading
 import unicodedata
+from collections import OrderedDict
+
+# Above this many receipt lines, only score each product against the
+# candidates the name index retrieves instead of against every line
+PRUNE_ABOVE = 2000
+# Sessions whose match state IncrementalMatcher keeps in memory
+CACHED_SESSIONS = 64
 
 
 def preprocess_name(name):
@@ -26,7 +40,9 @@ def preprocess_name(name):
 def fuzzy_match_prices(decoded_csv='receipts/decoded_barcodes.csv', 
                        parsed_csv='receipts/parsed_receipt.csv',
                        output_csv='receipts/matched_products.csv',
-                       threshold=50):
+                       threshold=50,
+                       assignment='greedy',
+                       unmatched_csv='receipts/unmatched_receipt_lines.csv'):
     """
     Fuzzy matches products from decoded barcodes with parsed receipt items
     and adds prices to the barcode data.
@@ -36,6 +52,13 @@ def fuzzy_match_prices(decoded_csv='receipts/decoded_barcodes.csv',
         parsed_csv: Path to parsed receipt CSV
         output_csv: Path to save matched results
         threshold: Minimum fuzzy matching score (0-100)
+        assignment: 'greedy' lets every product take its best receipt line on
+            its own; 'optimal' matches products and receipt lines one-to-one,
+            maximising the total score
+        unmatched_csv: Path to save receipt lines no product matched
+
+    The receipt lines left unmatched are also returned in the result's
+    attrs['unmatched_receipt_lines'].
     """
     
     # Read both CSV files
@@ -45,70 +68,124 @@ def fuzzy_match_prices(decoded_csv='receipts/decoded_barcodes.csv',
     except FileNotFoundError as e:
         print(f"Error: Could not find file - {e}")
         return None
-    
+
+    cleaned_barcodes_df = match_frames(barcodes_df, receipt_df, threshold=threshold,
+                                       assignment=assignment)
+
+    # Save the matched results
+    cleaned_barcodes_df.to_csv(output_csv, index=False)
+    print(f"\nSaved matched results to {output_csv}")
+    if unmatched_csv:
+        unmatched = cleaned_barcodes_df.attrs['unmatched_receipt_lines']
+        pd.DataFrame(unmatched, columns=receipt_df.columns).to_csv(unmatched_csv, index=False)
+
+    return cleaned_barcodes_df
+
+
+def match_frames(barcodes_df, receipt_df, threshold=50, assignment='greedy', name_index=None):
+    """Match already-loaded barcode and receipt frames (see fuzzy_match_prices).
+
+    Returns the cleaned match frame, with the receipt lines left unmatched in
+    attrs['unmatched_receipt_lines']. With more than PRUNE_ABOVE receipt
+    lines (a long receipt history), products are only scored against the
+    candidates `name_index` (default: the shared NameIndex) retrieves.
+    """
     print(f"Loaded {len(barcodes_df)} barcode products")
     print(f"Loaded {len(receipt_df)} receipt items")
-    
+
+    receipt_names = receipt_names_of(receipt_df)
+    print("List of receipt names:", receipt_names)
+
+    # Translate and preprocess every product up front so the whole batch can
+    # be scored in one pass
+    products = prepare_products(barcodes_df)
+
+    # Preprocess receipt names for better matching
+    if len(receipt_names) > PRUNE_ABOVE:
+        if name_index is None:
+            name_index = get_name_index()
+        with metrics.timed('match_prune'):
+            preprocessed_receipt_names = name_index.processed(receipt_names)
+            candidates = name_index.candidates(products['processed'], receipt_names)
+        with metrics.timed('match_score'):
+            scores, methods = score_candidates(products['processed'], preprocessed_receipt_names, candidates)
+    else:
+        with metrics.timed('match_score'):
+            preprocessed_receipt_names = [preprocess_name(name) for name in receipt_names]
+            scores, methods = score_matrix(products['processed'], preprocessed_receipt_names)
+    assigned = assign(scores, threshold, assignment)
+
+    return build_match_result(barcodes_df, receipt_df, products, receipt_names,
+                              preprocessed_receipt_names, scores, methods, assigned)
+
+
+def receipt_names_of(receipt_df):
+    """Receipt line names to match against."""
+    # Try multiple name columns that might exist in parsed_receipt
+    if 'original_name' in receipt_df.columns:
+        return receipt_df['original_name'].tolist()
+    return receipt_df.iloc[:, 0].tolist()  # Use first column as fallback
+
+
+@metrics.timed('match_translate')
+def prepare_products(barcodes_df):
+    """Lowercased names, their Catalan/English translations and preprocessed form."""
+    names = [str(name).lower() for name in barcodes_df['product_name']]
+    names_ca = [name.lower() for name in translate_batch(names, src='es', dest='ca')]
+    names_en = [name.lower() for name in translate_batch(names, src='es', dest='en')]
+    return {
+        'names': names,
+        'names_ca': names_ca,
+        'names_en': names_en,
+        'processed': [preprocess_name(name) for name in names_ca],
+    }
+
+
+@metrics.timed('match_assign')
+def assign(scores, threshold, assignment):
+    if assignment == 'optimal':
+        return assign_optimal(scores, threshold)
+    if assignment == 'greedy':
+        return assign_greedy(scores, threshold)
+    raise ValueError(f"Unknown assignment mode: {assignment}")
+
+
+def unit_price(line):
+    """Price of one unit of a receipt line: its unit_price, else its total over its quantity."""
+    if pd.notna(line.get('unit_price')):
+        return float(line['unit_price'])
+    quantity = line.get('quantity')
+    return float(line['price']) / (quantity if pd.notna(quantity) and quantity > 0 else 1)
+
+
+def build_match_result(barcodes_df, receipt_df, products, receipt_names,
+                       preprocessed_receipt_names, scores, methods, assigned):
+    """Turn an assignment into the cleaned output frame."""
+    barcodes_df = barcodes_df.copy()
+    # Decoded products carry their size as 'size'; the sheet calls it num_servings
+    if 'num_servings' not in barcodes_df.columns:
+        barcodes_df['num_servings'] = barcodes_df['size'] if 'size' in barcodes_df.columns else None
+
     # Add price column to barcodes dataframe
     barcodes_df['matched_price'] = None
     barcodes_df['match_score'] = None
     barcodes_df['matched_receipt_name'] = None
     barcodes_df['english_name'] = None
     barcodes_df['portion_size'] = None
-    
-    # Create a list of receipt items to match against
-    # Try multiple name columns that might exist in parsed_receipt
-    if 'original_name' in receipt_df.columns:
-        receipt_names = receipt_df['original_name'].tolist()
-        name_col = 'original_name'
-    # elif 'translated_name' in receipt_df.columns:
-    #     receipt_names = receipt_df['translated_name'].tolist()
-    #     name_col = 'translated_name'
-    else:
-        receipt_names = receipt_df.iloc[:, 0].tolist()  # Use first column as fallback
-        name_col = receipt_df.columns[0]
-    
-    print("List of receipt names:", receipt_names)
-
-    # Preprocess receipt names for better matching
-    preprocessed_receipt_names = [preprocess_name(name) for name in receipt_names]
-
-    # For each barcode product, find best match in receipt
-    for idx, row in barcodes_df.iterrows():
-        product_name = str(row['product_name']).lower()
-        product_name_ca = translate_name(product_name, src='es', dest='ca').lower()
 
+    for row, idx in enumerate(barcodes_df.index):
+        product_name = products['names'][row]
+        product_name_ca = products['names_ca'][row]
         print(f"\nMatching for product: '{product_name}' (Catalan: '{product_name_ca}')")
-        
-        # Preprocess the product name
-        processed_product = preprocess_name(product_name_ca)
-        print(f"Preprocessed: '{processed_product}'")
-        
-        # Try multiple scoring methods and pick the best
-        matches = []
-        
-        # Method 1: Token sort ratio on preprocessed names
-        for i, receipt_name in enumerate(preprocessed_receipt_names):
-            score1 = fuzz.token_sort_ratio(processed_product, receipt_name)
-            matches.append((receipt_name, score1, i, 'token_sort'))
-            
-            score2 = fuzz.partial_ratio(processed_product, receipt_name)
-            matches.append((receipt_name, score2, i, 'partial'))
-            
-            score3 = fuzz.token_set_ratio(processed_product, receipt_name)
-            matches.append((receipt_name, score3, i, 'token_set'))
-        
-        # Pick the best match across all methods
-        if matches:
-            best_match = max(matches, key=lambda x: x[1])
-            matched_name_processed, score, matched_idx, method = best_match
-            
+        print(f"Preprocessed: '{products['processed'][row]}'")
+
+        barcodes_df.at[idx, 'english_name'] = products['names_en'][row]
+        matched_idx = int(assigned[row])
+        if matched_idx >= 0:
+            score = int(scores[row, matched_idx])
+            method = METHODS[methods[row, matched_idx]]
             print(f"Best match using {method}: '{preprocessed_receipt_names[matched_idx]}' (score: {score})")
-        
-        if matches and best_match[1] >= threshold:
-            matched_idx = best_match[2]
-            score = best_match[1]
-            
+
             # Get the original receipt name (not preprocessed)
             original_matched_name = receipt_names[matched_idx]
             
@@ -119,25 +196,26 @@ def fuzzy_match_prices(decoded_csv='receipts/decoded_barcodes.csv',
             barcodes_df.at[idx, 'matched_price'] = matched_price
             barcodes_df.at[idx, 'match_score'] = score
             barcodes_df.at[idx, 'matched_receipt_name'] = original_matched_name
-            product_name_en = translate_name(product_name, src='es', dest='en').lower()
-            barcodes_df.at[idx, 'english_name'] = product_name_en
 
-            
             print(f"✓ Matched '{product_name_ca}' with '{original_matched_name}' (score: {score}) - Price: €{matched_price}")
         else:
             print(f"✗ No match found for '{product_name_ca}'")
-            #still update the dataframe, just with None values
-            barcodes_df.at[idx, 'matched_price'] = None
-            barcodes_df.at[idx, 'match_score'] = None
-            barcodes_df.at[idx, 'matched_receipt_name'] = None
-            product_name_en = translate_name(product_name, src='es', dest='en').lower()
-            barcodes_df.at[idx, 'english_name'] = product_name_en
     
     clean_colums = ['product_name', 'english_name', "calories",	"protein",	"fat", "portion_size", "num_servings", 'matched_price', 'match_score', 'matched_receipt_name']
     cleaned_barcodes_df = barcodes_df[clean_colums]
-    # Save the matched results
-    cleaned_barcodes_df.to_csv(output_csv, index=False)
-    print(f"\nSaved matched results to {output_csv}")
+
+    matched_lines = set(int(i) for i in assigned if i >= 0)
+    unmatched_df = receipt_df[[i not in matched_lines for i in range(len(receipt_df))]]
+    cleaned_barcodes_df.attrs['unmatched_receipt_lines'] = unmatched_df.to_dict(orient='records')
+    # For the price history: which product and receipt line each row came from
+    if 'barcode' in barcodes_df.columns:
+        cleaned_barcodes_df.attrs['barcodes'] = barcodes_df['barcode'].astype(str).tolist()
+    cleaned_barcodes_df.attrs['matched_receipt_ids'] = [
+        int(receipt_df.index[i]) if i >= 0 else None for i in assigned]
+    # matched_price is the line total ("2 F. RATLLAT ... 3,60"); the history wants one pack's
+    cleaned_barcodes_df.attrs['matched_unit_prices'] = [
+        unit_price(receipt_df.iloc[i]) if i >= 0 else None for i in assigned]
+    print(f"{len(unmatched_df)} receipt lines left unmatched")
     
     # Print summary
     matched_count = barcodes_df['matched_price'].notna().sum()
@@ -145,14 +223,177 @@ def fuzzy_match_prices(decoded_csv='receipts/decoded_barcodes.csv',
     
     return cleaned_barcodes_df
 
+
+def _preprocessing_key():
+    """Fingerprint of everything the cached scores depend on.
+
+    Changing preprocess_name, the scorers or the translation targets changes
+    the key and throws away remembered scores.
+    """
+    digest = hashlib.sha1()
+    digest.update(marshal.dumps(preprocess_name.__code__))
+    digest.update(repr(METHODS).encode())
+    digest.update(b'es>ca')
+    return digest.hexdigest()
+
+
+class IncrementalMatcher:
+    """Matches a session's products and receipt lines without starting over.
+
+    Scores, translations and preprocessed names are remembered per session
+    (and persisted in the store as one delta per update), so each save only
+    scores new products against all receipt lines and old products against
+    new receipt lines. The assignment is redone when the matrix grows or the
+    threshold/mode changes; scores are dropped if preprocessing changes.
+    Past PRUNE_ABOVE receipt lines new cells are only scored for the
+    candidates `name_index` retrieves, like match_frames. Sessions are matched in parallel, each under its own lock; the last
+    `max_sessions` used stay in memory and older ones are reloaded from
+    their deltas.
+    """
+
+    def __init__(self, store=None, max_sessions=CACHED_SESSIONS, name_index=None):
+        self.store = store if store is not None else get_store()
+        self.name_index = name_index
+        self.max_sessions = max_sessions
+        self._states = OrderedDict()
+        self._session_locks = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _session_lock(self, session_id):
+        """Serialize matches of one session; the lock goes once nobody waits on it."""
+        with self._lock:
+            entry = self._session_locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._session_locks[session_id]
+
+    def match(self, session_id, threshold=60, assignment='optimal'):
+        with self._session_lock(session_id):
+            state = self._load(session_id)
+            self._update(session_id, state)
+
+            key = (threshold, assignment)
+            if key not in state['assignments']:
+                state['assignments'][key] = assign(state['scores'], threshold, assignment)
+
+            return build_match_result(
+                state['barcodes'], state['receipts'], state['products'], state['receipt_names'],
+                state['processed_receipts'], state['scores'], state['methods'],
+                state['assignments'][key])
+
+    def _load(self, session_id):
+        config = _preprocessing_key()
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is not None:
+                self._states.move_to_end(session_id)
+        if state is None or state['config'] != config:
+            state = self._restore(session_id, config)
+            with self._lock:
+                self._states[session_id] = state
+                while len(self._states) > self.max_sessions:
+                    self._states.popitem(last=False)
+        return state
+
+    def _restore(self, session_id, config):
+        """Rebuild a session's state by replaying its saved deltas."""
+        state = {
+            'config': config,
+            'last_barcode': 0,
+            'last_receipt': 0,
+            'barcodes': pd.DataFrame(columns=BARCODE_COLUMNS),
+            'receipts': pd.DataFrame(columns=RECEIPT_COLUMNS),
+            'products': {'names': [], 'names_ca': [], 'names_en': [], 'processed': []},
+            'receipt_names': [],
+            'processed_receipts': [],
+            'scores': np.zeros((0, 0), dtype=np.int16),
+            'methods': np.zeros((0, 0), dtype=np.int16),
+            'assignments': {},
+        }
+        deltas = self.store.match_deltas(session_id, config)
+        for delta in deltas:
+            self._apply(state, delta)
+        if deltas:
+            barcodes = self.store.barcodes(session_id)
+            receipts = self.store.receipt_items(session_id)
+            state['barcodes'] = barcodes[barcodes.index <= state['last_barcode']]
+            state['receipts'] = receipts[receipts.index <= state['last_receipt']]
+        return state
+
+    @staticmethod
+    def _apply(state, delta):
+        state['scores'], state['methods'] = grow_score_matrix(
+            state['scores'], state['methods'], delta['right'], delta['bottom'])
+        for field, values in delta['products'].items():
+            state['products'][field].extend(values)
+        state['receipt_names'].extend(delta['receipt_names'])
+        state['processed_receipts'].extend(delta['processed_receipts'])
+        state['last_barcode'] = delta['last_barcode']
+        state['last_receipt'] = delta['last_receipt']
+        state['assignments'] = {}
+
+    def _update(self, session_id, state):
+        """Pull rows added since the last match, score them and save the delta."""
+        new_barcodes = self.store.barcodes(session_id, since_id=state['last_barcode'])
+        new_receipts = self.store.receipt_items(session_id, since_id=state['last_receipt'])
+        if new_barcodes.empty and new_receipts.empty:
+            return False
+
+        new_products = prepare_products(new_barcodes)
+        new_receipt_names = receipt_names_of(new_receipts)
+        if len(state['receipt_names']) + len(new_receipt_names) > PRUNE_ABOVE:
+            right, bottom, new_processed = self._score_pruned(state, new_products, new_receipt_names)
+        else:
+            with metrics.timed('match_score'):
+                new_processed = [preprocess_name(name) for name in new_receipt_names]
+                right = score_matrix(state['products']['processed'], new_processed)
+                bottom = score_matrix(new_products['processed'], state['processed_receipts'] + new_processed)
+
+        delta = {
+            'last_barcode': int(new_barcodes.index.max()) if len(new_barcodes) else state['last_barcode'],
+            'last_receipt': int(new_receipts.index.max()) if len(new_receipts) else state['last_receipt'],
+            'products': new_products,
+            'receipt_names': new_receipt_names,
+            'processed_receipts': new_processed,
+            'right': right,
+            'bottom': bottom,
+        }
+        self.store.add_match_delta(session_id, state['config'], delta)
+        self._apply(state, delta)
+        state['barcodes'] = pd.concat([state['barcodes'], new_barcodes]) if len(state['barcodes']) else new_barcodes
+        state['receipts'] = pd.concat([state['receipts'], new_receipts]) if len(state['receipts']) else new_receipts
+        print(f"Scored {len(new_barcodes)} new products and {len(new_receipts)} new receipt lines")
+        return True
+
+    def _score_pruned(self, state, new_products, new_receipt_names):
+        """New score blocks, scoring each product only against its index candidates.
+
+        Old products get their best candidates among the new lines; together
+        with the candidates they were scored against before, that covers
+        their best candidates among all lines.
+        """
+        index = self.name_index if self.name_index is not None else get_name_index()
+        with metrics.timed('match_prune'):
+            new_processed = index.processed(new_receipt_names)
+            right_candidates = index.candidates(state['products']['processed'], new_receipt_names)
+            bottom_candidates = index.candidates(new_products['processed'],
+                                                 state['receipt_names'] + new_receipt_names)
+        with metrics.timed('match_score'):
+            right = score_candidates(state['products']['processed'], new_processed, right_candidates)
+            bottom = score_candidates(new_products['processed'],
+                                      state['processed_receipts'] + new_processed, bottom_candidates)
+        return right, bottom, new_processed
+
+
 def translate_name(item, src='es', dest='ca'):
-    translator = Translator()
-    try:
-        translated = translator.translate(item, src=src, dest=dest)
-        trans_item = translated.text
-    except Exception:
-        trans_item = item  # fallback
-    return trans_item
+    return translate(item, src=src, dest=dest)
 
 if __name__ == '__main__':
     # Run the matching
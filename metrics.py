@@ -0,0 +1,163 @@
+"""Stage timings and counters, exposed in Prometheus text format at /metrics.
+
+    with metrics.timed('translate'):
+        ...
+
+    @metrics.timed('parse_receipt')
+    def parse(...): ...
+
+Set FOOD_TRACKER_METRICS=0 to turn it off: decorated functions are then left
+as they are and `with timed(...)` blocks do nothing.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+
+ENABLED = os.environ.get('FOOD_TRACKER_METRICS', '1') != '0'
+PREFIX = 'food_tracker'
+# Seconds. From a cache hit (sub-millisecond) to a stuck upstream call
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_collectors = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(stage, seconds, **labels):
+    """Record one duration for `stage` (extra labels: e.g. endpoint=...)."""
+    if not ENABLED:
+        return
+    key = _key(stage, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+def inc(name, amount=1, **labels):
+    """Add to the counter `name` (exported as food_tracker_<name>_total)."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+class _Timer(ContextDecorator):
+    __slots__ = ('stage', 'labels', 'start')
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # Each call of a decorated function gets its own start time; the
+        # default reuses this instance, which concurrent calls would share
+        return _Timer(self.stage, self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    def __call__(self, fn):
+        # Decorating with metrics off leaves the function untouched
+        return fn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage, **labels):
+    """Context manager / decorator timing a stage into its histogram."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage, labels)
+
+
+def register_collector(fn):
+    """Add a function returning {metric name: value} gauges, read on each scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{str(v)}"' for k, v in pairs) + '}'
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    with _lock:
+        histograms = {k: (list(h.counts), h.sum, h.count) for k, h in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = [f'# HELP {PREFIX}_stage_seconds Time spent per stage.',
+             f'# TYPE {PREFIX}_stage_seconds histogram']
+    for (stage, labels), (counts, total, count) in sorted(histograms.items()):
+        pairs = (('stage', stage),) + labels
+        cumulative = 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append(f'{PREFIX}_stage_seconds_bucket{_labels(pairs, [("le", bound)])} {cumulative}')
+        lines.append(f'{PREFIX}_stage_seconds_bucket{_labels(pairs, [("le", "+Inf")])} {count}')
+        lines.append(f'{PREFIX}_stage_seconds_sum{_labels(pairs)} {total}')
+        lines.append(f'{PREFIX}_stage_seconds_count{_labels(pairs)} {count}')
+
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'{PREFIX}_{name}_total{_labels(labels)} {value}')
+
+    for collector in _collectors:
+        try:
+            gauges = collector()
+        except Exception as e:
+            print(f"Metrics collector {collector.__name__} failed: {e}")
+            continue
+        for name, value in gauges.items():
+            lines.append(f'# TYPE {PREFIX}_{name} gauge')
+            lines.append(f'{PREFIX}_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -0,0 +1,177 @@
+import hashlib
+import marshal
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from match_engine import _ascii_process, best_matches, score_matrix
+from product_cache import CACHE_DIR
+
+INDEX_PATH = os.environ.get('FOOD_TRACKER_NAME_INDEX', os.path.join(CACHE_DIR, 'name_index.sqlite'))
+NGRAM = 3
+# Candidates kept per product; the fuzzy scorers only run on these
+CANDIDATES = 50
+
+
+def ngrams(text, n=NGRAM):
+    """Character n-grams of each word (padded, so short words count) plus the words."""
+    grams = set()
+    for token in _ascii_process(text).split():
+        padded = f' {token} '
+        grams.update(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+        grams.add('#' + token)
+    return grams
+
+
+class NameIndex:
+    """Persistent index of receipt names for candidate retrieval.
+
+    Every name is normalized once (with `preprocess`, match_prices'
+    preprocess_name by default) and stored, so later match runs reuse the
+    normalized form instead of redoing the unicode/regex work. In memory the
+    index keeps n-gram -> name postings; `candidates` uses them to pick the
+    few receipt lines worth running the fuzzy scorers on for each product.
+    Stored names are dropped when `preprocess` or the n-gram size changes.
+    """
+
+    def __init__(self, path=None, preprocess=None):
+        if preprocess is None:
+            from match_prices import preprocess_name as preprocess
+        self.path = path or INDEX_PATH
+        self.preprocess = preprocess
+
+        digest = hashlib.sha1(marshal.dumps(preprocess.__code__))
+        digest.update(f'ngram={NGRAM}'.encode())
+        self.config = digest.hexdigest()
+
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._processed = []
+        self._grams = []
+        self._postings = defaultdict(list)
+        self._arrays = {}
+
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS names (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                processed TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+        with self._conn:
+            if row is None or row[0] != self.config:
+                self._conn.execute('DELETE FROM names')
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('config', ?)", (self.config,))
+        for name, processed in self._conn.execute('SELECT name, processed FROM names ORDER BY id'):
+            self._remember(name, processed)
+
+    def _remember(self, name, processed):
+        name_id = len(self._processed)
+        self._ids[name] = name_id
+        self._processed.append(processed)
+        grams = ngrams(processed)
+        self._grams.append(len(grams))
+        for gram in grams:
+            self._postings[gram].append(name_id)
+            self._arrays.pop(gram, None)
+        return name_id
+
+    def __len__(self):
+        return len(self._processed)
+
+    def ids(self, names):
+        """Index ids for `names`, normalizing and storing the unseen ones."""
+        names = [str(n) for n in names]
+        with self._lock:
+            new = [n for n in dict.fromkeys(names) if n not in self._ids]
+            if new:
+                rows = [(n, self.preprocess(n)) for n in new]
+                with self._conn:
+                    self._conn.executemany('INSERT OR IGNORE INTO names (name, processed) VALUES (?, ?)', rows)
+                for name, processed in rows:
+                    self._remember(name, processed)
+            return np.fromiter((self._ids[n] for n in names), dtype=np.intp, count=len(names))
+
+    def processed(self, names):
+        """Normalized form of each name (what preprocess returns)."""
+        ids = self.ids(names)
+        return [self._processed[i] for i in ids]
+
+    def _posting(self, gram):
+        array = self._arrays.get(gram)
+        if array is None:
+            array = self._arrays[gram] = np.asarray(self._postings.get(gram, ()), dtype=np.intp)
+        return array
+
+    def candidates(self, queries, choices, k=CANDIDATES):
+        """For each query, the positions in `choices` most worth scoring.
+
+        `queries` are already-normalized product names, `choices` raw receipt
+        names. Choices are ranked by the share of the shorter string's
+        n-grams the two have in common (so a name contained in a longer one
+        still ranks high, as partial_ratio would score it) and the best `k`
+        distinct names are kept, with every choice position holding them.
+        """
+        choice_ids = self.ids(choices)
+        with self._lock:
+            present = np.zeros(len(self._processed), dtype=bool)
+            present[choice_ids] = True
+            sizes = np.asarray(self._grams, dtype=np.float32)
+            result = []
+            for query in queries:
+                grams = ngrams(query)
+                hits = [h for h in map(self._posting, grams) if h.size]
+                if not hits:
+                    result.append(np.zeros(0, dtype=np.intp))
+                    continue
+                shared = np.bincount(np.concatenate(hits), minlength=len(sizes)).astype(np.float32)
+                shared[~present] = 0
+                overlap = shared / np.maximum(np.minimum(sizes, len(grams)), 1)
+                ranked = np.flatnonzero(overlap)
+                if ranked.size > k:
+                    ranked = ranked[np.argpartition(-overlap[ranked], k - 1)[:k]]
+                result.append(np.flatnonzero(np.isin(choice_ids, ranked)))
+            return result
+
+
+def recall(queries, choices, index, threshold, k=CANDIDATES):
+    """Share of brute-force matches the candidate lists still contain.
+
+    Scores every query against every choice, takes each query's best choice
+    at or above `threshold`, and checks that choice (or an equally scored
+    one) is among its candidates. Returns (recall, number of matches checked).
+    """
+    processed_choices = index.processed(choices)
+    scores, _ = score_matrix(queries, processed_choices)
+    _, best = best_matches(scores)
+    kept = index.candidates(queries, choices, k)
+    checked = found = 0
+    for row, (top, columns) in enumerate(zip(best, kept)):
+        if top < threshold:
+            continue
+        checked += 1
+        found += bool(columns.size) and scores[row, columns].max() == top
+    return (found / checked if checked else 1.0), checked
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_name_index():
+    """Return the process-wide NameIndex, creating it on first use."""
+    global _default_index
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = NameIndex()
+    return _default_index
@@ -0,0 +1,248 @@
+"""Local index of the OpenFoodFacts bulk export, for lookups without the network.
+
+Build it once from a dump (https://world.openfoodfacts.org/data):
+
+    python off_index.py openfoodfacts-products.jsonl.gz --country spain
+    python off_index.py en.openfoodfacts.org.products.csv.gz --country spain --country andorra
+
+Only the fields lookup_product_openfoodfacts keeps are stored, keyed by
+barcode, in an SQLite file next to the product cache. Each import writes a
+new numbered copy (off_index-<ms>.sqlite) instead of replacing the file a
+running server has open, which Windows doesn't allow; the server switches
+to the newest copy and older ones are deleted once nothing has them open.
+"""
+import argparse
+import csv
+import glob
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from product_cache import CACHE_DIR
+
+INDEX_PATH = os.environ.get('FOOD_TRACKER_OFF_INDEX', os.path.join(CACHE_DIR, 'off_index.sqlite'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    barcode TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def index_versions(path=None):
+    """Imported copies of the index at `path`, oldest first.
+
+    A plain `path` file (from before imports were numbered) counts as the
+    oldest.
+    """
+    path = path or INDEX_PATH
+    stem, ext = os.path.splitext(path)
+    versions = [(0, path)] if os.path.exists(path) else []
+    for candidate in glob.glob(glob.escape(stem) + '-*' + ext):
+        number = candidate[len(stem) + 1:len(candidate) - len(ext)]
+        if number.isdigit():
+            versions.append((int(number), candidate))
+    return [candidate for _, candidate in sorted(versions)]
+
+
+def current_index(path=None):
+    """The newest imported copy of the index at `path`, or None."""
+    versions = index_versions(path)
+    return versions[-1] if versions else None
+
+
+def _remove_old(paths):
+    for old in paths:
+        try:
+            os.remove(old)
+        except OSError:
+            # Still open in a server on Windows; the next import retries
+            pass
+
+
+def _open_text(path):
+    if path == '-':
+        return sys.stdin
+    raw = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+    return io.TextIOWrapper(raw, encoding='utf-8', errors='replace', newline='')
+
+
+def _country_tags(countries):
+    return {c.lower() if ':' in c else 'en:' + c.lower() for c in countries or []}
+
+
+def iter_jsonl(lines, countries=None):
+    """(code, product) from a JSONL export, one product per line."""
+    tags = _country_tags(countries)
+    for line in lines:
+        # Most lines are other countries' products; skip them before paying for json.loads
+        if tags and not any(tag in line for tag in tags):
+            continue
+        try:
+            p = json.loads(line)
+        except ValueError:
+            continue
+        if tags and not tags.intersection(p.get('countries_tags') or []):
+            continue
+        code = p.get('code') or p.get('_id')
+        if code:
+            yield str(code), p
+
+
+def iter_csv(lines, countries=None):
+    """(code, product) from the tab-separated CSV export."""
+    tags = _country_tags(countries)
+    csv.field_size_limit(2 ** 31 - 1)
+    for row in csv.DictReader(lines, delimiter='\t', quoting=csv.QUOTE_NONE):
+        if tags and not tags.intersection((row.get('countries_tags') or '').split(',')):
+            continue
+        code = row.get('code')
+        if not code:
+            continue
+        nutriments = {}
+        for key, value in row.items():
+            if key and key.endswith('_100g') and value:
+                try:
+                    nutriments[key] = float(value)
+                except ValueError:
+                    pass
+        yield code, {'product_name': row.get('product_name'), 'quantity': row.get('quantity'),
+                     'nutriments': nutriments}
+
+
+def import_dump(source, path=None, countries=None, fmt=None, batch_size=5000, progress_every=100000):
+    """Stream an OpenFoodFacts export into a fresh index at `path`.
+
+    `source` is a .jsonl/.csv file, optionally gzipped, or '-' for stdin.
+    Rows are read and written in batches, so memory stays flat whatever the
+    dump size. The index is built in a temporary file and renamed to a new
+    numbered copy of `path` at the end; a running server picks it up on its
+    next lookup. Returns the number of products stored.
+    """
+    from online_barcode_search import product_info
+
+    path = path or INDEX_PATH
+    fmt = fmt or ('csv' if '.csv' in source or '.tsv' in source else 'jsonl')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    stem, ext = os.path.splitext(path)
+    final_path = f'{stem}-{time.time_ns() // 1_000_000}{ext}'
+    tmp_path = final_path + '.importing'
+    _remove_old(glob.glob(glob.escape(stem) + '-*' + ext + '.importing'))
+
+    conn = sqlite3.connect(tmp_path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.executescript(SCHEMA)
+
+    start = time.time()
+    stored = 0
+    batch = []
+    with _open_text(source) as lines:
+        rows = iter_csv(lines, countries) if fmt == 'csv' else iter_jsonl(lines, countries)
+        for code, p in rows:
+            info = product_info(p)
+            if not info['product_name'] and not info['nutriments']:
+                continue
+            batch.append((code, json.dumps(info, separators=(',', ':'))))
+            if len(batch) >= batch_size:
+                conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?)', batch)
+                stored += len(batch)
+                batch = []
+                if stored % progress_every < batch_size:
+                    print(f"Indexed {stored} products ({time.time() - start:.0f}s)")
+    if batch:
+        conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?)', batch)
+        stored += len(batch)
+
+    conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [
+        ('source', os.path.basename(source)),
+        ('countries', ','.join(sorted(countries or []))),
+        ('imported_at', str(time.time())),
+    ])
+    conn.commit()
+    count = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+    conn.close()
+    os.replace(tmp_path, final_path)
+    _remove_old(index_versions(path)[:-1])
+    print(f"Indexed {count} products from {source} in {time.time() - start:.0f}s")
+    return count
+
+
+def _candidates(barcode):
+    # zbar reads UPC-A as a 13-digit EAN with a leading 0; the dump has both spellings
+    codes = [barcode]
+    if len(barcode) == 13 and barcode.startswith('0'):
+        codes.append(barcode[1:])
+    elif len(barcode) == 12:
+        codes.append('0' + barcode)
+    return codes
+
+
+class OffIndex:
+    """Read-only barcode -> product lookups against an imported dump."""
+
+    def __init__(self, path=None):
+        self.path = path or current_index()
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            self._local.conn = conn
+        return conn
+
+    def get(self, barcode):
+        """The product dict lookup_product_openfoodfacts would return, or None."""
+        codes = _candidates(barcode)
+        rows = self._conn().execute(
+            f"SELECT barcode, value FROM products WHERE barcode IN ({', '.join('?' * len(codes))})",
+            codes).fetchall()
+        if not rows:
+            return None
+        found = dict(rows)
+        return json.loads(next(found[code] for code in codes if code in found))
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_off_index():
+    """The process-wide OffIndex, or None if no dump has been imported.
+
+    Switches to the newest copy when one is imported, so a re-import is
+    picked up without a restart.
+    """
+    global _default_index
+    path = current_index()
+    if path is None:
+        return None
+    if _default_index is None or _default_index.path != path:
+        with _default_index_lock:
+            if _default_index is None or _default_index.path != path:
+                _default_index = OffIndex(path)
+    return _default_index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('source', help='OpenFoodFacts .jsonl/.csv export (gzipped is fine), or - for stdin')
+    parser.add_argument('--country', action='append', help='only keep products sold here (repeatable)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'])
+    parser.add_argument('--output', default=INDEX_PATH)
+    args = parser.parse_args()
+    import_dump(args.source, args.output, countries=args.country, fmt=args.format)
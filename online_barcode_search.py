@@ -1,17 +1,97 @@
-import requests
+import os
+import re
+import threading
+from dataclasses import dataclass, fields
+from concurrent.futures import ThreadPoolExecutor, wait
+import metrics
+from off_index import get_off_index
+from product_cache import MISS, get_product_cache
 
+# Override to point lookups at a local OpenFoodFacts stand-in
+OPENFOODFACTS_URL = os.environ.get('OPENFOODFACTS_URL', 'https://world.openfoodfacts.org')
+NOT_FOUND = 'Product not found'
+TIMED_OUT = 'Lookup timed out'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size=16):
+    """Shared keep-alive session so repeated lookups reuse TCP/TLS connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+# Grams (or ml) per unit of an OpenFoodFacts quantity
+UNITS = {'kg': 1000, 'g': 1, 'gr': 1, 'mg': 0.001, 'l': 1000, 'lt': 1000, 'dl': 100, 'cl': 10, 'ml': 1}
+# "500 g", "1,5 l", "2 x 125 g", "125g x 4"
+QUANTITY_RE = re.compile(r'(?:(\d+)\s*[x×]\s*)?(\d+(?:[.,]\d+)?)\s*(kg|mg|ml|cl|dl|lt|gr|g|l)\b(?:\s*[x×]\s*(\d+))?',
+                         re.IGNORECASE)
+
+
+def parse_quantity(text):
+    """Grams (or ml) in a pack from an OpenFoodFacts quantity, or None if unknown.
+
+    "1 kg" is 1000, "2 x 125 g" is 250 and "1,5 l" is 1500.
+    """
+    if isinstance(text, (int, float)):
+        return float(text) if text > 0 else None
+    match = QUANTITY_RE.search(text or '')
+    if not match:
+        return None
+    count = int(match.group(1) or match.group(4) or 1)
+    size = count * float(match.group(2).replace(',', '.')) * UNITS[match.group(3).lower()]
+    return size if size > 0 else None
+
+
+def product_info(p):
+    """The fields we keep from an OpenFoodFacts product record."""
+    nutriments = {k: v for k, v in (p.get('nutriments') or {}).items() if k.endswith('_100g')}
+    return {
+        'product_name': p.get('product_name'),
+        #'brands': p.get('brands'),
+        #'categories': p.get('categories'),
+        #'image_url': p.get('image_url'),
+        'quantity': p.get('quantity'),
+        'size': parse_quantity(p.get('quantity')),
+        'nutriments': nutriments,
+        'macros_per100': {
+            'calories': nutriments.get('energy-kcal_100g'),
+            'protein': nutriments.get('proteins_100g'),
+            'fat': nutriments.get('fat_100g'),
+            'carbohydrates': nutriments.get('carbohydrates_100g'),
+            'fiber': nutriments.get('fiber_100g'),
+            'sugars': nutriments.get('sugars_100g'),
+            }
+    }
+
+
+@metrics.timed('openfoodfacts_lookup')
 def lookup_product_openfoodfacts(barcode):
     """Lookup a barcode at OpenFoodFacts. Returns product info dict or None.
 
     Uses the public OpenFoodFacts API which works well for food items (EAN/UPC).
-    If the product isn't found, returns None. On network errors returns a dict
-    with an "error" key.
+    A 404 returns None and status != 1 an {"error": NOT_FOUND} dict; both
+    count as not found. Network errors, rate limits and server errors
+    return {"error": ...} too, but are not cached, so the code is retried on
+    the next scan.
     """
-    url = f'https://world.openfoodfacts.org/api/v0/product/{barcode}.json'
+    url = f'{OPENFOODFACTS_URL}/api/v0/product/{barcode}.json'
     try:
-        resp = requests.get(url, timeout=5)
-        if resp.status_code != 200:
+        resp = get_session().get(url, timeout=5)
+        if resp.status_code == 404:
             return None
+        if resp.status_code != 200:
+            return {'error': f'HTTP {resp.status_code}'}
 
         data = resp.json()
         # OpenFoodFacts returns status=1 when product found
@@ -21,43 +101,169 @@ def lookup_product_openfoodfacts(barcode):
                 raise ValueError("No product field in response")
             
 
-            nutriments = {k: v for k, v in p.get('nutriments', {}).items() if k.endswith('_100g')}
-            quantity = "".join(i for i in p.get('quantity', []) if i.isdigit() or i == '.')
-            return {
-                'product_name': p.get('product_name'),
-                #'brands': p.get('brands'),
-                #'categories': p.get('categories'),
-                #'image_url': p.get('image_url'),
-                'quantity': 0 if not quantity else float(quantity),
-                'nutriments': nutriments,
-                'macros_per100': {
-                    'calories': nutriments.get('energy-kcal_100g'),
-                    'protein': nutriments.get('proteins_100g'),
-                    'fat': nutriments.get('fat_100g'),
-                    'carbohydrates': nutriments.get('carbohydrates_100g'),
-                    'fiber': nutriments.get('fiber_100g'),
-                    'sugars': nutriments.get('sugars_100g'),
-                    }
-            }
-        raise ValueError("Product not found")
+            return product_info(p)
+        raise ValueError(NOT_FOUND)
     except Exception as e:
         return {'error': str(e)}
-    
+
+
+def is_not_found(result):
+    """True if a lookup result means the product doesn't exist upstream."""
+    return result is None or (isinstance(result, dict) and result.get('error') == NOT_FOUND)
+
+
+@dataclass(slots=True)
+class ProductRecord:
+    """One scanned product, in the barcodes table's column order.
+
+    Upload handlers collect these in a list and convert once at the end,
+    instead of growing a DataFrame a row at a time.
+    """
+    barcode: str
+    product_name: str
+    size: float
+    calories: float = None
+    fat: float = None
+    protein: float = None
+    carbohydrates: float = None
+    fiber: float = None
+    sugars: float = None
+
+    @classmethod
+    def from_lookup(cls, barcode, result):
+        """Record from a lookup result, or None if the product wasn't found."""
+        if not result or 'error' in result:
+            return None
+        macros = result.get('macros_per100', {})
+        # Entries cached before 'size' existed hold a garbled quantity: unknown
+        return cls(barcode, result['product_name'], result.get('size'),
+                   macros.get('calories'), macros.get('fat'), macros.get('protein'),
+                   macros.get('carbohydrates'), macros.get('fiber'), macros.get('sugars'))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in RECORD_FIELDS}
+
+
+RECORD_FIELDS = [f.name for f in fields(ProductRecord)]
+
+
+def lookup_local(barcode, index=None):
+    """Product from the imported OpenFoodFacts dump (see off_index.py), or None."""
+    if index is None:
+        # Not `index or ...`: OffIndex.__len__ is a COUNT(*) over the whole dump
+        index = get_off_index()
+    if index is None:
+        return None
+    try:
+        return index.get(barcode)
+    except Exception as e:
+        print(f"Local OpenFoodFacts index lookup failed: {e}")
+        return None
+
+
+def lookup_product(barcode, cache=None, lookup=None, index=None):
+    """Cached barcode lookup.
+
+    Checks the persistent product cache, then the local OpenFoodFacts index
+    if one has been imported, before calling `lookup` (defaults to
+    lookup_product_openfoodfacts). Found products and "not found" answers
+    are cached; network errors are not, so they get retried on the next
+    scan. A code missing from the local index still goes to the network,
+    since the dump may be filtered or out of date.
+    """
+    cache = cache or get_product_cache()
+    lookup = lookup or lookup_product_openfoodfacts
+
+    cached = cache.get(barcode)
+    if cached is not MISS:
+        metrics.inc('product_lookups', source='cache')
+        return cached
+
+    local = lookup_local(barcode, index)
+    if local is not None:
+        metrics.inc('product_lookups', source='local_index')
+        return local
+
+    return _lookup_network(barcode, cache, lookup)
+
+
+def _lookup_network(barcode, cache, lookup):
+    """The network part of lookup_product, for a code already missing from the cache and index."""
+    metrics.inc('product_lookups', source='network')
+    result = lookup(barcode)
+    if is_not_found(result):
+        cache.put(barcode, result, negative=True)
+    elif 'error' not in result:
+        cache.put(barcode, result)
+    return result
+
+
+def lookup_products_batch(barcodes, max_workers=8, deadline=10.0, cache=None, lookup=None, index=None):
+    """Look up several barcodes concurrently.
+
+    Duplicate codes are looked up once and cache hits and local index hits
+    are answered without touching the thread pool. Returns a dict of barcode -> result. Lookups
+    still running after `deadline` seconds are reported as
+    {'error': TIMED_OUT} so the caller gets partial results instead of
+    waiting on the slowest request.
+    """
+    cache = cache or get_product_cache()
+    lookup = lookup or lookup_product_openfoodfacts
+    if index is None:
+        index = get_off_index()
+    unique = list(dict.fromkeys(barcodes))
+
+    results = {}
+    pending = []
+    for code in unique:
+        cached = cache.get(code)
+        source = 'cache'
+        if cached is MISS:
+            cached = lookup_local(code, index)
+            source = 'local_index'
+            if cached is None:
+                pending.append(code)
+                continue
+        metrics.inc('product_lookups', source=source)
+        results[code] = cached
+
+    if not pending:
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(pending)))
+    try:
+        # Already checked against the cache and index above: straight to the network
+        futures = {executor.submit(_lookup_network, code, cache, lookup): code for code in pending}
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = {'error': str(e)}
+        for future in not_done:
+            results[futures[future]] = {'error': TIMED_OUT}
+    finally:
+        # Don't block on stragglers; they finish (and fill the cache) in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
 if __name__ == '__main__': 
     # Example usage
     barcode = '2350385002419'  # Example barcode for a food product
-    product_info = lookup_product_openfoodfacts(barcode)
-    if product_info:
-        print("Product found: ", product_info.get('product_name'))
-        print(product_info)
-        print(product_info.get('product_name', 'Name Field Missing'))
-        macros_per100 = product_info.get('macros_per100', 'nutrients missing')
+    product = lookup_product_openfoodfacts(barcode)
+    if product:
+        print("Product found: ", product.get('product_name'))
+        print(product)
+        print(product.get('product_name', 'Name Field Missing'))
+        macros_per100 = product.get('macros_per100', 'nutrients missing')
         print(macros_per100)
-        quantity = product_info.get('quantity')
-        print(quantity)
+        size = product.get('size')
+        print(product.get('quantity'), size)
         #format nutriments nicely
-        if quantity:
-            total_macros = {k: v * (float(quantity) / 100) for k, v in macros_per100.items()}
+        if size:
+            total_macros = {k: v * (size / 100) for k, v in macros_per100.items() if v is not None}
             print(total_macros)
 
     else:
@@ -0,0 +1,359 @@
+"""Append-only price history, stored column by column in NumPy files.
+
+Every matched purchase becomes one row: when, where, which barcode and
+receipt line, the price of one pack, the pack size and its calories/protein
+per 100 g. Rows are appended as small chunk files (one .npz per save, with the
+text columns dictionary-encoded) which are merged once there are many, and
+queries run as vectorized NumPy over the whole history held in memory.
+
+Add an existing matched_products.csv:
+
+    python price_history.py receipts/matched_products.csv --date 2024-05-03 --store Bonpreu
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+HISTORY_DIR = os.environ.get('FOOD_TRACKER_PRICE_HISTORY', os.path.join('receipts', 'price_history'))
+# Merge the chunk files into one when there are more than this many
+COMPACT_AFTER = 64
+
+TEXT_COLUMNS = ['store', 'barcode', 'name']
+NUMBER_COLUMNS = {
+    'date': np.int64,         # unix seconds
+    'source': np.int64,       # receipt line id in the store, -1 if unknown
+    'price': np.float64,      # one pack: the unit price of a "2 x" receipt line
+    'size': np.float32,       # grams (or ml) in the pack
+    'calories': np.float32,   # kcal per 100 g
+    'protein': np.float32,    # g per 100 g
+}
+METRICS = ('price', 'price_per_kg', 'price_per_100kcal', 'price_per_g_protein')
+PERIODS = {'day': 'D', 'week': 'W', 'month': 'M', 'year': 'Y'}
+# NumPy's weeks start on Thursday (1970-01-01 was one); shifting by this many
+# days makes them start on Monday
+MONDAY_SHIFT = np.timedelta64(3, 'D')
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return np.nan
+    return value
+
+
+def _timestamp(value):
+    """Unix seconds from a number, datetime or ISO date string."""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _group_order(groups, values):
+    """Indices sorting by group, then by value within each group.
+
+    Same as np.lexsort((values, groups)), but sorts one int64 key of
+    (group, rank of value), which is several times faster.
+    """
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[np.argsort(values)] = np.arange(len(values))
+    return np.argsort((groups.astype(np.int64) << 32) | ranks)
+
+
+class PriceHistory:
+    """Purchases over time, with price-per-unit trends and rankings."""
+
+    def __init__(self, path=None):
+        self.path = path or HISTORY_DIR
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._loaded = []
+        self._vocab = {c: [] for c in TEXT_COLUMNS}
+        self._index = {c: {} for c in TEXT_COLUMNS}
+        self._columns = {c: np.zeros(0, np.int32) for c in TEXT_COLUMNS}
+        self._columns.update({c: np.zeros(0, t) for c, t in NUMBER_COLUMNS.items()})
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._columns['date'])
+
+    def append(self, rows):
+        """Add purchases (dicts with the column names; missing numbers are NaN).
+
+        Rows whose `source` receipt line is already in the history are
+        skipped, so saving the same session again doesn't count a purchase
+        twice. Returns the number of rows added.
+        """
+        rows = [{**row, 'source': -1 if row.get('source') is None else int(row['source'])}
+                for row in rows]
+        with self._lock:
+            self._refresh()
+            sources = np.array([row['source'] for row in rows], dtype=np.int64)
+            known = np.isin(sources, self._columns['source']) & (sources >= 0)
+            seen = set()
+            fresh = []
+            for row, is_known in zip(rows, known):
+                if is_known or row['source'] in seen:
+                    continue
+                if row['source'] >= 0:
+                    seen.add(row['source'])
+                fresh.append(row)
+            rows = fresh
+            if not rows:
+                return 0
+
+            chunk = {}
+            for column in TEXT_COLUMNS:
+                values = [str(row.get(column) or '') for row in rows]
+                vocab, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+                chunk[column] = codes.astype(np.int32)
+                chunk[column + '_vocab'] = np.array(vocab.tolist(), dtype=str)
+            now = int(time.time())
+            chunk['date'] = np.array([_timestamp(row['date']) if row.get('date') is not None else now
+                                      for row in rows], dtype=np.int64)
+            chunk['source'] = np.array([row['source'] for row in rows], dtype=np.int64)
+            for column in ('price', 'size', 'calories', 'protein'):
+                chunk[column] = np.array([_number(row.get(column)) for row in rows],
+                                         dtype=NUMBER_COLUMNS[column])
+
+            self._write(chunk)
+            self._refresh()
+            if len(self._loaded) > COMPACT_AFTER:
+                self._compact()
+            return len(rows)
+
+    def columns(self):
+        """The whole history as {column: array}; text columns as strings."""
+        with self._lock:
+            self._refresh()
+            data = dict(self._columns)
+            for column in TEXT_COLUMNS:
+                data[column] = np.array(self._vocab[column], dtype=object)[data[column]]
+            return data
+
+    def trend(self, metric='price_per_kg', period='month', barcode=None, name=None, store=None,
+              since=None, until=None, by='name'):
+        """Mean/min/max of `metric` per period, for each product (`by` name or barcode).
+
+        `name` matches receipt names containing it, ignoring case. Rows whose
+        metric can't be computed (unknown size or nutrition) are left out.
+        Returns a list of {period, <by>, mean, min, max, count} sorted by
+        product and period.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        if by not in TEXT_COLUMNS:
+            raise ValueError(f"Can't group by {by}")
+        with self._lock:
+            self._refresh()
+            mask = self._filter(barcode, name, store, since, until)
+            values = self._metric(metric)[mask]
+            dates = self._columns['date'][mask]
+            products = self._columns[by][mask]
+            vocab = self._vocab[by]
+
+        valid = np.isfinite(values)
+        values, dates, products = values[valid], dates[valid], products[valid]
+        if not len(values):
+            return []
+        days = dates.astype('datetime64[s]').astype('datetime64[D]')
+        if period == 'week':
+            days = days + MONDAY_SHIFT
+        buckets = days.astype(f'datetime64[{PERIODS[period]}]').astype(np.int64)
+        first = buckets.min()
+        # One int64 key per (product, period), so grouping is a single np.unique
+        keys, inverse = np.unique((products.astype(np.int64) << 32) | (buckets - first),
+                                  return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse)
+        means = np.bincount(inverse, weights=values) / counts
+        order = _group_order(inverse, values)
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        mins = values[order][starts]
+        maxs = values[order][starts + counts - 1]
+        labels = ((keys & 0xFFFFFFFF) + first).astype(f'datetime64[{PERIODS[period]}]')
+        if period == 'week':
+            # Labelled by the Monday starting the week
+            labels = labels.astype('datetime64[D]') - MONDAY_SHIFT
+        labels = labels.astype(str)
+        columns = zip(labels.tolist(), [vocab[k] for k in (keys >> 32).tolist()],
+                      np.round(means, 4).tolist(), np.round(mins, 4).tolist(),
+                      np.round(maxs, 4).tolist(), counts.tolist())
+        return [{'period': p, by: product, 'mean': mean, 'min': low, 'max': high, 'count': n}
+                for p, product, mean, low, high, n in columns]
+
+    def cheapest(self, metric='price_per_g_protein', since=None, until=None, store=None,
+                 name=None, limit=10, by='name'):
+        """Products ranked by their median `metric`, cheapest first."""
+        if by not in TEXT_COLUMNS:
+            raise ValueError(f"Can't group by {by}")
+        with self._lock:
+            self._refresh()
+            mask = self._filter(None, name, store, since, until)
+            values = self._metric(metric)[mask]
+            products = self._columns[by][mask]
+            vocab = self._vocab[by]
+
+        valid = np.isfinite(values) & (values > 0)
+        values, products = values[valid], products[valid]
+        if not len(values):
+            return []
+        order = _group_order(products, values)
+        values, products = values[order], products[order]
+        keys, starts, counts = np.unique(products, return_index=True, return_counts=True)
+        # Median of each sorted run: average its two middle values
+        medians = (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+        ranked = np.argsort(medians, kind='stable')[:limit]
+        return [{by: vocab[keys[i]], 'median': round(float(medians[i]), 4),
+                 'min': round(float(values[starts[i]]), 4), 'count': int(counts[i])}
+                for i in ranked.tolist()]
+
+    def _metric(self, metric):
+        c = self._columns
+        price, size = c['price'], c['size'].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if metric == 'price':
+                return price
+            if metric == 'price_per_kg':
+                return price / size * 1000
+            if metric == 'price_per_100kcal':
+                return price / (size * c['calories'] / 100) * 100
+            if metric == 'price_per_g_protein':
+                return price / (size * c['protein'] / 100)
+        raise ValueError(f"Unknown metric: {metric} (expected one of {', '.join(METRICS)})")
+
+    def _filter(self, barcode, name, store, since, until):
+        c = self._columns
+        mask = np.ones(len(c['date']), dtype=bool)
+        if barcode:
+            mask &= c['barcode'] == self._index['barcode'].get(str(barcode), -1)
+        if store:
+            mask &= c['store'] == self._index['store'].get(store, -1)
+        if name:
+            needle = name.lower()
+            codes = [i for i, value in enumerate(self._vocab['name']) if needle in value.lower()]
+            mask &= np.isin(c['name'], codes)
+        if since is not None:
+            mask &= c['date'] >= _timestamp(since)
+        if until is not None:
+            mask &= c['date'] < _timestamp(until)
+        return mask
+
+    def _chunk_paths(self):
+        return sorted(glob.glob(os.path.join(self.path, 'chunk-*.npz')))
+
+    def _write(self, chunk):
+        name = f'chunk-{time.time_ns():020d}.npz'
+        tmp_path = os.path.join(self.path, name + '.writing')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **chunk)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def _refresh(self):
+        """Load chunk files written since the last call (by us or another process)."""
+        paths = self._chunk_paths()
+        if paths == self._loaded:
+            return
+        if not set(self._loaded) <= set(paths):
+            # Compacted by another process: start over
+            self._clear()
+        new = [p for p in paths if p not in set(self._loaded)]
+        parts = {c: [self._columns[c]] for c in self._columns}
+        for path in new:
+            with np.load(path) as chunk:
+                for column in TEXT_COLUMNS:
+                    parts[column].append(self._encode(column, chunk[column + '_vocab'])[chunk[column]])
+                for column in NUMBER_COLUMNS:
+                    parts[column].append(chunk[column])
+        self._columns = {c: np.concatenate(p) for c, p in parts.items()}
+        self._loaded = paths
+
+    def _encode(self, column, values):
+        """Global codes for a chunk's vocabulary, adding new values."""
+        index, vocab = self._index[column], self._vocab[column]
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values.tolist()):
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(vocab)
+                vocab.append(value)
+            codes[i] = code
+        return codes
+
+    def _compact(self):
+        old = self._loaded
+        chunk = {}
+        for column in TEXT_COLUMNS:
+            chunk[column] = self._columns[column]
+            chunk[column + '_vocab'] = np.array(self._vocab[column], dtype=str)
+        for column in NUMBER_COLUMNS:
+            chunk[column] = self._columns[column]
+        self._write(chunk)
+        for path in old:
+            os.remove(path)
+        self._loaded = self._chunk_paths()
+
+
+def rows_from_matches(result_df, date=None, store=''):
+    """History rows for the matched products in a match_frames/IncrementalMatcher result."""
+    barcodes = result_df.attrs.get('barcodes') or [None] * len(result_df)
+    sources = result_df.attrs.get('matched_receipt_ids') or [None] * len(result_df)
+    unit_prices = result_df.attrs.get('matched_unit_prices') or [None] * len(result_df)
+    rows = []
+    for (_, match), barcode, source, unit in zip(result_df.iterrows(), barcodes, sources, unit_prices):
+        if not np.isfinite(_number(match['matched_price'])):
+            continue
+        rows.append({
+            'date': date, 'store': store, 'barcode': barcode, 'source': source,
+            'name': match['matched_receipt_name'],
+            # matched_price is the receipt line's total, which may be several packs
+            'price': unit if np.isfinite(_number(unit)) else match['matched_price'],
+            'size': match.get('num_servings'), 'calories': match.get('calories'),
+            'protein': match.get('protein'),
+        })
+    return rows
+
+
+_default_history = None
+_default_history_lock = threading.Lock()
+
+
+def get_price_history():
+    """Return the process-wide PriceHistory, creating it on first use."""
+    global _default_history
+    if _default_history is None:
+        with _default_history_lock:
+            if _default_history is None:
+                _default_history = PriceHistory()
+    return _default_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add matched products to the price history.')
+    parser.add_argument('csv', help='a matched_products.csv written by match_prices.py')
+    parser.add_argument('--date', help='purchase date (YYYY-MM-DD), default today')
+    parser.add_argument('--store', default='')
+    parser.add_argument('--output', default=HISTORY_DIR)
+    args = parser.parse_args()
+
+    import pandas as pd
+    added = PriceHistory(args.output).append(
+        rows_from_matches(pd.read_csv(args.csv), date=args.date, store=args.store))
+    print(f"Added {added} purchases to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get('FOOD_TRACKER_CACHE_DIR', 'cache')
+
+# Returned by ProductCache.get when the barcode has no live entry
+MISS = object()
+
+
+class ProductCache:
+    """Persistent barcode -> product cache backed by SQLite.
+
+    Entries expire after `ttl` seconds ("product not found" results after
+    `negative_ttl`), and the least recently used rows are evicted once the
+    table grows past `max_entries`. A small in-memory LRU sits in front of
+    the database so repeat scans don't touch disk at all.
+    """
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600, negative_ttl=24 * 3600,
+                 max_entries=50000, memory_entries=1024):
+        self.path = path or os.path.join(CACHE_DIR, 'products.sqlite')
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._touched = {}
+
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                barcode TEXT PRIMARY KEY,
+                value TEXT,
+                negative INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_products_last_access ON products (last_access)')
+        self._conn.commit()
+
+    def get(self, barcode):
+        """Return the cached lookup result for `barcode`, or MISS."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(barcode)
+            if entry is not None and entry[2] > now:
+                self._memory.move_to_end(barcode)
+                self._touched[barcode] = now
+                return self._count_hit(entry)
+
+            row = self._conn.execute(
+                'SELECT value, negative, expires_at FROM products WHERE barcode = ?',
+                (barcode,)).fetchone()
+            if row is None or row[2] <= now:
+                self._memory.pop(barcode, None)
+                self.misses += 1
+                return MISS
+
+            entry = (json.loads(row[0]), bool(row[1]), row[2])
+            self._remember(barcode, entry)
+            self._touched[barcode] = now
+            return self._count_hit(entry)
+
+    def put(self, barcode, value, negative=False):
+        """Store a lookup result. Negative results use the shorter TTL."""
+        now = time.time()
+        expires_at = now + (self.negative_ttl if negative else self.ttl)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO products (barcode, value, negative, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (barcode, json.dumps(value), int(negative), expires_at, now))
+            self._touched.pop(barcode, None)
+            self._flush_touched()
+            self._evict()
+            self._conn.commit()
+            self._remember(barcode, (value, negative, expires_at))
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM products')
+            self._conn.commit()
+            self._memory.clear()
+            self._touched.clear()
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    def _count_hit(self, entry):
+        self.hits += 1
+        if entry[1]:
+            self.negative_hits += 1
+        return entry[0]
+
+    def _remember(self, barcode, entry):
+        self._memory[barcode] = entry
+        self._memory.move_to_end(barcode)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        # Memory hits only record their access time here; it is written back
+        # together with the next insert so reads stay off the disk.
+        if self._touched:
+            self._conn.executemany(
+                'UPDATE products SET last_access = ? WHERE barcode = ?',
+                [(t, b) for b, t in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        self._conn.execute('DELETE FROM products WHERE expires_at <= ?', (time.time(),))
+        count = self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            evicted = [r[0] for r in self._conn.execute(
+                'SELECT barcode FROM products ORDER BY last_access LIMIT ?', (overflow,))]
+            self._conn.executemany('DELETE FROM products WHERE barcode = ?',
+                                   [(b,) for b in evicted])
+            for barcode in evicted:
+                self._memory.pop(barcode, None)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_product_cache():
+    """Return the process-wide ProductCache, creating it on first use."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ProductCache()
+    return _default_cache
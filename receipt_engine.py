@@ -0,0 +1,124 @@
+import re
+
+# A price token: "1,62", "3.60", "-0,50" (discount). Must stand on its own,
+# so "1,5L" or "2x1,20" are not prices.
+PRICE = re.compile(r'(?<![\w.,])(-?\d{1,5}[.,]\d{1,2})(?![\w.,])')
+# Leading quantity: "2 F. RATLLAT S/LACTOSA"
+QUANTITY = re.compile(r'^(\d{1,3})\s+(?=\S)')
+# Trailing prices printed on the same line as the item
+TRAILING_PRICES = re.compile(r'(?:\s+-?\d{1,5}[.,]\d{1,2})+\s*€?\s*$')
+HAS_LETTER = re.compile(r'[^\W\d_]')
+FOOTER = re.compile(
+    r'\b(TOTAL|SUBTOTAL|TARGETA|TARJETA|BANCARIA|BANCARA|EFECTIU|EFECTIVO|CANVI|CAMBIO|'
+    r'IVA|IMPOSABLE|IMPONIBLE|ENTREGAT|ENTREGADO|PAGAT|PAGADO|VISA|MASTERCARD|'
+    r'DEVOLUCI[OÓ]|DATAFON|AUTORITZACI[OÓ]|AUTORIZACI[OÓ]N)\b',
+    re.IGNORECASE)
+
+ITEM, PRICES, FOOTER_LINE, NOISE = 'item', 'prices', 'footer', 'noise'
+
+
+def parse_price(token):
+    return float(token.replace(',', '.'))
+
+
+def classify(line):
+    """Tokenize one receipt line into (kind, payload).
+
+    item:   (quantity, name, [inline prices])
+    prices: [prices]
+    footer: None - totals/payment lines, their numbers are not items
+    noise:  None - blank lines, stray "€", VAT codes...
+    """
+    line = line.strip()
+    if not line:
+        return NOISE, None
+
+    if not HAS_LETTER.search(line.replace('€', '')):
+        prices = PRICE.findall(line)
+        if prices:
+            return PRICES, [parse_price(p) for p in prices]
+        return NOISE, None
+
+    if FOOTER.search(line):
+        return FOOTER_LINE, None
+
+    quantity = 1
+    match = QUANTITY.match(line)
+    if match and HAS_LETTER.search(line[match.end():]):
+        quantity = int(match.group(1))
+        line = line[match.end():]
+
+    inline = []
+    trailing = TRAILING_PRICES.search(line)
+    if trailing:
+        inline = [parse_price(p) for p in PRICE.findall(trailing.group(0))]
+        line = line[:trailing.start()]
+
+    return ITEM, (quantity, ' '.join(line.split()), inline)
+
+
+def _record(name, quantity, prices):
+    if quantity > 1 and len(prices) >= 2:
+        unit_price, total = prices[0], prices[1]
+    elif quantity > 1:
+        # Only one number printed: it is the line total
+        total = prices[0]
+        unit_price = round(total / quantity, 2)
+    else:
+        unit_price = total = prices[0]
+    return {
+        'original_name': name,
+        'price': total,
+        'quantity': quantity,
+        'unit_price': unit_price,
+    }
+
+
+def iter_parse(lines):
+    """Parse receipt lines in a single pass, yielding one record per item.
+
+    Each record has original_name, price (the line total), quantity and
+    unit_price. An item is emitted as soon as its prices are known: after one
+    price for a single unit, after unit price and line total when a quantity
+    prefix was printed. Works on any iterable of lines, so it can consume a
+    stream without reading the whole receipt first. Lines after a
+    total/payment line are skipped until the next item starts (which also
+    handles several receipts pasted one after another).
+    """
+    name = None
+    quantity = 1
+    prices = []
+
+    for line in lines:
+        kind, payload = classify(line)
+
+        if kind == ITEM:
+            if name is not None and prices:
+                yield _record(name, quantity, prices)
+            elif name is not None:
+                print(f"Could not find price for item: {name}")
+            quantity, name, prices = payload
+            if prices and (quantity == 1 or len(prices) >= 2):
+                yield _record(name, quantity, prices)
+                name, prices = None, []
+        elif kind == PRICES:
+            if name is None:
+                continue
+            prices.extend(payload)
+            if quantity == 1 or len(prices) >= 2:
+                yield _record(name, quantity, prices)
+                name, prices = None, []
+        elif kind == FOOTER_LINE:
+            if name is not None and prices:
+                yield _record(name, quantity, prices)
+            elif name is not None:
+                print(f"Could not find price for item: {name}")
+            name, prices = None, []
+
+    if name is not None and prices:
+        yield _record(name, quantity, prices)
+
+
+def parse(text):
+    """Parse a whole receipt string into a list of item records."""
+    return list(iter_parse(text.split('\n')))
@@ -1,6 +1,10 @@
+import codecs
+import contextlib
+import csv
 import re
-import pandas as pd
-from googletrans import Translator
+import metrics
+from receipt_engine import iter_parse
+from translation import translate_batch
 import unicodedata
 
 # ----------------------------
@@ -17,82 +21,118 @@ def simplify_name(name):
     name = re.sub(r'[^a-z0-9\s]', '', name)
     return ' '.join(name.split())
 
-def cleanup_text(text):
-    """Cleans up raw receipt text into a list of lines"""
-    lines = text.split('\n')
-    cleaned_lines = []
-    curr_line = ''
+def iter_lines(source, chunk_size=8192):
+    """Yield raw lines from receipt text as it arrives.
 
-    for line in lines:
-        line = line.strip()
-        if line:
-            if line[0].isalpha():
-                if curr_line:
-                    cleaned_lines.append(curr_line)
-                cleaned_lines.append(line)
-                curr_line = ""
+    `source` can be a string, an iterable of str/bytes chunks (e.g. a chunked
+    HTTP body) or a file-like object with read(). Chunks are split on newlines
+    without ever holding more than one partial line in memory.
+    """
+    if isinstance(source, str):
+        yield from source.split('\n')
+        return
+    if hasattr(source, 'read'):
+        source = _iter_chunks(source, chunk_size)
 
-            else:
-                 curr_line += line
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    for chunk in source:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        pending += chunk
+        *complete, pending = pending.split('\n')
+        yield from complete
+    yield pending + decoder.decode(b'', final=True)
 
-    if curr_line:
-        cleaned_lines.append(curr_line)
 
-    return cleaned_lines
+def _iter_chunks(stream, chunk_size):
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_items(lines):
+    """Yield item records as soon as each one is complete.
+
+    Thin wrapper over receipt_engine.iter_parse, which handles quantity
+    prefixes, unit price vs line total and total/payment lines.
+    """
+    return iter_parse(lines)
 
 
 def extract_items(lines):
     """Extract item names, prices, from messy receipt text"""
-    items = []
-    i = 0
-    while i < len(lines)-1:
-        name = lines[i]
-        price = None
-        #price is on next line
-        price_line = lines[i+1]
-        price_match = re.search(r'(\d+[.,]?\d{0,2})', price_line)
-        if price_match:
-            price_str = price_match.group(1).replace(',', '.')
-            try:
-                price = float(price_str)
-            except ValueError:
-                price = None
-
-            i += 2  # move to next item
-
-        if price is not None:
-            items.append({
-                'original_name': name,
-                'price': price
-            })
-        else:
-            print(f"Could not find price for item: {name}")
-
-       
-    return items
+    return list(iter_items(lines))
+
+
+def iter_receipt_items(source):
+    """Streaming parse: raw text/stream in, item records out."""
+    return iter_items(iter_lines(source))
 
+
+@metrics.timed('receipt_translate')
 def translate_items(items, src='ca', dest='en'):
-    translator = Translator()
-    for item in items:
-        try:
-            translated = translator.translate(item['original_name'], src=src, dest=dest)
-            item['translated_name'] = translated.text
-        except Exception:
-            item['translated_name'] = item['original_name']  # fallback
+    names = [item['original_name'] for item in items]
+    for item, translated in zip(items, translate_batch(names, src=src, dest=dest)):
+        item['translated_name'] = translated
         item['simple_name'] = simplify_name(item['translated_name'])
     return items
 
-def get_items_from_receipt_text(text):
-    lines = cleanup_text(text)
-    print("Cleaned lines:", lines)
+def translated_frame(items):
+    """Extracted items as a DataFrame, with their names translated and simplified."""
+    import pandas as pd
+    items = translate_items([dict(item) for item in items])
+    return pd.DataFrame(items, columns=['simple_name', 'price', 'original_name', 'quantity', 'unit_price'])
+
+def get_items_from_receipt_text(text, output_csv='receipts/parsed_receipt.csv'):
     # Extract + translate + simplify
-    items = extract_items(lines)
-    items = translate_items(items)
-    df = pd.DataFrame(items)[['simple_name','price','original_name']]
-    df.to_csv('receipts/parsed_receipt.csv', index=False)
+    with metrics.timed('receipt_parse'):
+        items = extract_items(text.split('\n'))
+    df = translated_frame(items)
+    if output_csv:
+        with metrics.timed('receipt_write'):
+            df[['simple_name','price','original_name']].to_csv(output_csv, index=False)
     return df
 
 
+def parse_receipt_stream(source, output_csv='receipts/parsed_receipt.csv', batch_size=10):
+    """Parse, translate and save a receipt incrementally.
+
+    Yields {simple_name, price, original_name, quantity, unit_price} records
+    in batches of `batch_size` (one translation request per batch), appending
+    them to `output_csv` if given, so memory stays flat on bulk imports and
+    the first items are available before the whole text has been read.
+    """
+    columns = ['simple_name', 'price', 'original_name', 'quantity', 'unit_price']
+    with contextlib.ExitStack() as stack:
+        writer = f = None
+        if output_csv:
+            f = stack.enter_context(open(output_csv, 'w', newline='', encoding='utf-8'))
+            writer = csv.DictWriter(f, fieldnames=columns[:3], extrasaction='ignore')
+            writer.writeheader()
+
+        batch = []
+        for item in iter_receipt_items(source):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield from _flush_batch(batch, writer, f, columns)
+                batch = []
+        if batch:
+            yield from _flush_batch(batch, writer, f, columns)
+
+
+def _flush_batch(batch, writer, f, columns):
+    translate_items(batch)
+    if writer:
+        with metrics.timed('receipt_write'):
+            writer.writerows(batch)
+            f.flush()
+    for item in batch:
+        yield {c: item[c] for c in columns}
+
+
 if __name__ == '__main__':
     # ----------------------------
     # Example usage
@@ -113,12 +153,11 @@ if __name__ == '__main__':
     € 
     3"""
 
-    lines = cleanup_text(raw_text)
-    print("Cleaned lines:", lines)
     # Extract + translate + simplify
-    items = extract_items(lines)
+    items = extract_items(raw_text.split('\n'))
     items = translate_items(items)
 
     # Convert to DataFrame for easy import into Google Sheets
+    import pandas as pd
     df = pd.DataFrame(items)[['simple_name','price','translated_name','original_name']]
     print(df.to_string(index=False))
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from product_cache import CACHE_DIR, MISS
+
+# Results kept before the least recently used are evicted
+MAX_ENTRIES = int(os.environ.get('FOOD_TRACKER_RESULT_CACHE_SIZE', 5000))
+# Set to 1 to also treat recompressed/resized copies of a photo as duplicates
+PERCEPTUAL = os.environ.get('FOOD_TRACKER_PERCEPTUAL_HASH', '0') == '1'
+# Bits (of 256) two photos' perceptual hashes may differ by and still count
+# as the same photo. Recompressed or resized copies differ by a handful, but
+# so do two photos of different products against the same background, which
+# is why a near match also needs the same barcodes.
+MAX_DISTANCE = 10
+HASH_SIZE = 16
+
+
+def image_key(data):
+    return 'image:' + hashlib.sha256(data).hexdigest()
+
+
+def normalize_receipt_text(text):
+    """Receipt text with the differences copy/paste introduces removed."""
+    text = unicodedata.normalize('NFC', text)
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def receipt_key(text):
+    return 'receipt:' + hashlib.sha256(normalize_receipt_text(text).encode('utf-8')).hexdigest()
+
+
+def image_dhash(data):
+    """256-bit difference hash of an encoded photo, or None if it isn't one.
+
+    JPEGs are decoded at 1/8 scale, which libjpeg does without producing
+    the full-size image.
+    """
+    import cv2
+    import numpy as np
+
+    arr = np.frombuffer(data, np.uint8)
+    img = cv2.imdecode(arr, cv2.IMREAD_REDUCED_GRAYSCALE_8) if arr.size else None
+    if img is None:
+        return None
+    small = cv2.resize(img, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+class ResultCache:
+    """Decode and parse results keyed by the content they were computed from.
+
+    Photos are keyed by the SHA-256 of their bytes; with perceptual
+    matching on, a photo whose perceptual hash is close to one already seen
+    and that decodes to the same barcodes takes that photo's key, so a phone
+    resending a recompressed copy isn't stored twice. Receipts are keyed by
+    their normalized text. The cache also remembers which sessions already
+    stored each receipt, and each code of each photo, so a resent photo or
+    receipt isn't added to the session twice.
+    Least recently used entries are evicted past `max_entries`.
+    """
+
+    def __init__(self, path=None, max_entries=None, perceptual=None, max_distance=MAX_DISTANCE):
+        self.path = path or os.path.join(CACHE_DIR, 'results.sqlite')
+        self.max_entries = max_entries or MAX_ENTRIES
+        self.perceptual = PERCEPTUAL if perceptual is None else perceptual
+        self.max_distance = max_distance
+
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                phash TEXT,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access);
+            CREATE TABLE IF NOT EXISTS stored (
+                key TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                PRIMARY KEY (key, session_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stored_codes (
+                key TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                code TEXT NOT NULL,
+                PRIMARY KEY (key, session_id, code)
+            ) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+        # Perceptual hashes are compared against all of them, so keep them in memory
+        self._phashes = {key: int(phash, 16) for key, phash in self._conn.execute(
+            'SELECT key, phash FROM results WHERE phash IS NOT NULL')}
+
+    def get(self, key):
+        """The result stored under `key`, or MISS."""
+        with self._lock:
+            value = self._get(key)
+            if value is MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def get_image(self, data):
+        """(key, result, phash) for a photo; result is MISS unless these exact bytes were seen.
+
+        On a miss `phash` is the photo's perceptual hash (None with
+        perceptual matching off): decode it, then pass the barcodes to
+        similar() before put().
+        """
+        key = image_key(data)
+        with self._lock:
+            value = self._get(key)
+            if value is not MISS:
+                self.hits += 1
+                return key, value, None
+        phash = image_dhash(data) if self.perceptual else None
+        with self._lock:
+            self.misses += 1
+        return key, MISS, phash
+
+    def similar(self, phash, value):
+        """Key of a stored photo that looks like this one and read the same `value`, or None.
+
+        A hash this close alone isn't proof: photos of different products in
+        the same spot differ by as few bits as a recompressed copy.
+        """
+        with self._lock:
+            similar = self._nearest(phash)
+            if similar is None or self._get(similar) != value:
+                return None
+            # get_image counted it as a miss
+            self.misses -= 1
+            self.similar_hits += 1
+            return similar
+
+    def put(self, key, value, phash=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (key, value, phash, last_access) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), None if phash is None else f'{phash:x}', time.time()))
+            if phash is not None:
+                self._phashes[key] = phash
+            self._evict()
+            self._conn.commit()
+
+    def mark_stored(self, key, session_id):
+        """Record that `session_id` stored the result for `key`.
+
+        Returns False if it already had, i.e. the upload is a duplicate.
+        """
+        with self._lock:
+            added = self._conn.execute('INSERT OR IGNORE INTO stored (key, session_id) VALUES (?, ?)',
+                                       (key, session_id)).rowcount
+            self._conn.commit()
+        return bool(added)
+
+    def unmark_stored(self, key, session_id):
+        """Undo mark_stored, when storing the result failed."""
+        with self._lock:
+            self._conn.execute('DELETE FROM stored WHERE key = ? AND session_id = ?', (key, session_id))
+            self._conn.commit()
+
+    def claim_codes(self, key, session_id, codes):
+        """Record that `session_id` stored the products of photo `key` for `codes`.
+
+        Returns the codes it hadn't yet, so a photo resent after some of its
+        lookups failed stores just the products that were missing.
+        """
+        claimed = []
+        with self._lock:
+            for code in codes:
+                if self._conn.execute('INSERT OR IGNORE INTO stored_codes (key, session_id, code) '
+                                      'VALUES (?, ?, ?)', (key, session_id, code)).rowcount:
+                    claimed.append(code)
+            self._conn.commit()
+        return claimed
+
+    def release_codes(self, key, session_id, codes):
+        """Undo claim_codes, when storing the products failed."""
+        with self._lock:
+            self._conn.executemany('DELETE FROM stored_codes WHERE key = ? AND session_id = ? AND code = ?',
+                                   [(key, session_id, code) for code in codes])
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            'hits': self.hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+            'entries': size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM results')
+            self._conn.execute('DELETE FROM stored')
+            self._conn.execute('DELETE FROM stored_codes')
+            self._conn.commit()
+            self._phashes.clear()
+
+    def _get(self, key):
+        row = self._conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return MISS
+        self._conn.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def _nearest(self, phash):
+        best, best_distance = None, self.max_distance + 1
+        for key, other in self._phashes.items():
+            distance = (phash ^ other).bit_count()
+            if distance < best_distance:
+                best, best_distance = key, distance
+        return best
+
+    def _evict(self):
+        count = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            evicted = [(r[0],) for r in self._conn.execute(
+                'SELECT key FROM results ORDER BY last_access LIMIT ?', (overflow,))]
+            self._conn.executemany('DELETE FROM results WHERE key = ?', evicted)
+            self._conn.executemany('DELETE FROM stored WHERE key = ?', evicted)
+            self._conn.executemany('DELETE FROM stored_codes WHERE key = ?', evicted)
+            for (key,) in evicted:
+                self._phashes.pop(key, None)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide ResultCache, creating it on first use."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ResultCache()
+    return _default_cache
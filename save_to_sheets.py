@@ -1,18 +1,193 @@
+import math
+import queue
+import random
+import threading
+import time
+
 import gspread
+import requests
 from oauth2client.service_account import ServiceAccountCredentials
 
-def save_to_google_sheets(df, workbook_name="Food Tracking", sheet_name="Receipts"):
-    # Authenticate
-    scope = ["https://spreadsheets.google.com/feeds",'https://www.googleapis.com/auth/spreadsheets',
-            "https://www.googleapis.com/auth/drive.file","https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name("service_account.json", scope)
-    client = gspread.authorize(creds)
+SCOPE = ["https://spreadsheets.google.com/feeds",'https://www.googleapis.com/auth/spreadsheets',
+         "https://www.googleapis.com/auth/drive.file","https://www.googleapis.com/auth/drive"]
+# Sheets API answers these when we go over quota or it is having a bad moment
+RETRY_STATUS = {429, 500, 502, 503}
+
+
+def authorize(keyfile="service_account.json"):
+    creds = ServiceAccountCredentials.from_json_keyfile_name(keyfile, SCOPE)
+    return gspread.authorize(creds)
+
+
+def is_transient_error(e):
+    """True for failures worth retrying later: quota/server errors, network trouble."""
+    if isinstance(e, gspread.exceptions.APIError):
+        return getattr(getattr(e, 'response', None), 'status_code', None) in RETRY_STATUS
+    return isinstance(e, (requests.RequestException, ConnectionError, TimeoutError))
+
+
+def _cell(value):
+    # gspread sends JSON: no NaN, no numpy scalars
+    if value is None:
+        return ''
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return ''
+    return value
+
+
+class SheetsSink:
+    """Writes a DataFrame to a worksheet, only sending rows that changed.
+
+    The authorized client and the worksheet handle are created once and
+    reused. The sink remembers what each sheet row holds (read from the sheet
+    on first use), so every write is a single batch update with just the new
+    or changed rows, plus blanks for rows a shorter frame no longer has.
+    Row i of the frame always lives on sheet row i + 2, under the header.
+    Rate-limit, server and network errors are retried with exponential
+    backoff; the wait happens outside the lock, and a retry is dropped if a
+    newer frame got written meanwhile.
+
+    `client_factory` returns a gspread-like client. Pass a fake one to run
+    without Google.
+    """
+
+    def __init__(self, workbook_name="Food Tracking", sheet_name="Receipts",
+                 client_factory=authorize, max_retries=5, backoff=1.0):
+        self.workbook_name = workbook_name
+        self.sheet_name = sheet_name
+        self.client_factory = client_factory
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._sheet = None
+        self._rows = None
+        self._submitted = 0
+        self._written = 0
+        self._queue = None
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def worksheet(self):
+        if self._sheet is None:
+            if self._client is None:
+                self._client = self.client_factory()
+            self._sheet = self._client.open(self.workbook_name).worksheet(self.sheet_name)
+        return self._sheet
+
+    def write(self, df):
+        """Write `df` (header + rows) now. Returns the number of rows sent."""
+        values = [[str(c) for c in df.columns]] + [[_cell(v) for v in row] for row in df.values.tolist()]
+        with self._lock:
+            self._submitted += 1
+            generation = self._submitted
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                if self._written > generation:
+                    return 0  # a newer frame went out while we were waiting
+                try:
+                    sent = self._send(values)
+                    self._written = generation
+                    return sent
+                except Exception as e:
+                    if not is_transient_error(e) or attempt == self.max_retries:
+                        raise
+                    error = e
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            print(f"Google Sheets write failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _send(self, values):
+        """Diff `values` against the known rows and send the changes. Holds the lock."""
+        sheet = self.worksheet()
+        if self._rows is None:
+            self._rows = [list(row) for row in sheet.get_all_values()]
+
+        updates = []
+        for i, row in enumerate(values):
+            known = self._rows[i] if i < len(self._rows) else None
+            if known is None or [str(v) for v in row] != [str(v) for v in known[:len(row)]]:
+                updates.append({'range': f'A{i + 1}', 'values': [row]})
+        # Blank out rows left over from a longer frame
+        for i in range(len(values), len(self._rows)):
+            if any(str(v) for v in self._rows[i]):
+                updates.append({'range': f'A{i + 1}', 'values': [[''] * len(self._rows[i])]})
+
+        if not updates:
+            return 0
+        if len(values) > sheet.row_count:
+            sheet.add_rows(len(values) - sheet.row_count)
+        sheet.batch_update(updates)
+
+        for update in updates:
+            i = int(update['range'][1:]) - 1
+            while len(self._rows) <= i:
+                self._rows.append([])
+            self._rows[i] = update['values'][0]
+        print(f"Sent {len(updates)} changed rows to Google Sheets.")
+        return len(updates)
+
+    def submit(self, df):
+        """Queue `df` for a background write and return immediately.
+
+        Only the newest frame matters (each one is a full snapshot), so frames
+        still waiting in the queue are replaced rather than written twice.
+        """
+        with self._worker_lock:
+            if self._worker is None:
+                self._queue = queue.Queue(maxsize=1)
+                self._worker = threading.Thread(target=self._drain, daemon=True)
+                self._worker.start()
+        while True:
+            try:
+                self._queue.put_nowait(df)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    pass
+
+    def flush(self):
+        """Block until queued writes are done."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _drain(self):
+        while True:
+            df = self._queue.get()
+            try:
+                self.write(df)
+            except Exception as e:
+                print(f"Background save to Google Sheets failed: {e}")
+            finally:
+                self._queue.task_done()
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sheets_sink(workbook_name="Food Tracking", sheet_name="Receipts"):
+    """Shared sink per worksheet, so the client is authorized once per process."""
+    key = (workbook_name, sheet_name)
+    with _sinks_lock:
+        if key not in _sinks:
+            _sinks[key] = SheetsSink(workbook_name, sheet_name)
+        return _sinks[key]
 
-    # Open your sheet
-    sheet = client.open(workbook_name).worksheet(sheet_name)
 
-    # Push the data (overwrite range)
-    sheet.update([df.columns.values.tolist()] + df.values.tolist())
+def save_to_google_sheets(df, workbook_name="Food Tracking", sheet_name="Receipts", background=False):
+    sink = get_sheets_sink(workbook_name, sheet_name)
+    if background:
+        sink.submit(df)
+        print("Data queued for Google Sheets.")
+        return
+    sink.write(df)
     print("Data saved to Google Sheets successfully.")
     return
 
@@ -23,4 +198,4 @@ if __name__ == '__main__':
     df = pd.read_csv('receipts/matched_products.csv')
 
     # Save to Google Sheets
-    save_to_google_sheets(df)
\ No newline at end of file
+    save_to_google_sheets(df)
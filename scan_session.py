@@ -0,0 +1,198 @@
+"""Live scanning: a phone streams camera frames, products come back once each.
+
+A ScanSession decodes at most one frame at a time. Frames that arrive while
+a decode is running are dropped, not queued, so however fast a phone sends,
+one connection never uses more than one decode worker and the server never
+falls behind the camera. Barcodes already seen in the session are ignored;
+each new one is looked up once and reported as an event, unless the lookup
+failed, in which case the next frame showing it tries again.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from decode_pool import PoolBusy, get_decode_pool
+from online_barcode_search import ProductRecord, is_not_found, lookup_products_batch
+
+# Scans nobody sent a frame to or read events from for this long are closed
+IDLE_TIMEOUT = 300
+MAX_SCANS = int(os.environ.get('FOOD_TRACKER_MAX_SCANS', 16))
+# Scans one browser session may have open; opening another closes its oldest,
+# so a phone that reloads mid-scan doesn't leave a slot taken until IDLE_TIMEOUT
+SCANS_PER_OWNER = int(os.environ.get('FOOD_TRACKER_SCANS_PER_SESSION', 1))
+# Frames are small; a slow one means the pool is swamped, so give up and drop it
+FRAME_TIMEOUT = 10
+
+# Runs frame decodes (waiting on the pool) and the product lookups after them
+scan_executor = ThreadPoolExecutor(max_workers=2 * MAX_SCANS)
+
+
+class ScanSession:
+    def __init__(self, owner, pool=None, lookup=None, on_products=None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.pool = pool or get_decode_pool()
+        self.lookup = lookup or lookup_products_batch
+        # Called with the new products' dicts, e.g. to store them
+        self.on_products = on_products
+
+        self.seen = set()
+        self.events = []
+        self.frames = 0
+        self.dropped = 0
+        self.decoded = 0
+        self.closed = False
+        self.last_active = time.monotonic()
+        self._busy = False
+        self._cond = threading.Condition()
+
+    def submit_frame(self, data):
+        """Start decoding `data` unless a frame is already being decoded.
+
+        Returns False if the frame was dropped.
+        """
+        with self._cond:
+            self.frames += 1
+            self.last_active = time.monotonic()
+            if self._busy or self.closed:
+                self.dropped += 1
+                return False
+            self._busy = True
+        scan_executor.submit(self._process, data)
+        return True
+
+    def _process(self, data):
+        try:
+            try:
+                barcodes, _ = self.pool.decode(data, timeout=FRAME_TIMEOUT)
+            except (PoolBusy, TimeoutError):
+                barcodes = None
+                with self._cond:
+                    self.dropped += 1
+            with self._cond:
+                self._busy = False
+                if barcodes is None:
+                    return
+                self.decoded += 1
+                new = [code for code in dict.fromkeys(b.data.decode('utf-8') for b in barcodes)
+                       if code not in self.seen]
+                self.seen.update(new)
+                for code in new:
+                    self._emit({'type': 'barcode', 'barcode': code})
+            if new:
+                self._resolve(new)
+        except Exception as e:
+            print(f"Scan {self.id}: frame failed: {e}")
+            with self._cond:
+                self._busy = False
+
+    def _resolve(self, codes):
+        try:
+            lookups = self.lookup(codes)
+        except Exception as e:
+            lookups = {code: {'error': str(e)} for code in codes}
+        products = []
+        with self._cond:
+            for code in codes:
+                result = lookups.get(code)
+                if is_not_found(result):
+                    self._emit({'type': 'not_found', 'barcode': code})
+                    continue
+                record = ProductRecord.from_lookup(code, result)
+                if record is None:
+                    # Timed out, HTTP 5xx, network trouble: forget the code so a later frame retries it
+                    self.seen.discard(code)
+                    self._emit({'type': 'error', 'barcode': code, 'error': result.get('error') or 'lookup failed'})
+                else:
+                    products.append(record.as_dict())
+                    self._emit({'type': 'product', 'product': products[-1]})
+        if products and self.on_products:
+            self.on_products(products)
+
+    def _emit(self, event):
+        # Caller holds self._cond
+        event['seq'] = len(self.events)
+        self.events.append(event)
+        self._cond.notify_all()
+
+    def wait_events(self, cursor, timeout):
+        """Events from index `cursor` on, waiting up to `timeout` seconds for one."""
+        with self._cond:
+            self.last_active = time.monotonic()
+            self._cond.wait_for(lambda: len(self.events) > cursor or self.closed, timeout)
+            return self.events[cursor:]
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        return self.summary()
+
+    def summary(self):
+        return {'scan_id': self.id, 'frames': self.frames, 'dropped': self.dropped,
+                'decoded': self.decoded, 'barcodes': sorted(self.seen), 'closed': self.closed}
+
+
+class ScanRegistry:
+    """Open scan sessions by id, closing the ones left idle."""
+
+    def __init__(self, max_scans=None, idle_timeout=IDLE_TIMEOUT, per_owner=None):
+        self.max_scans = max_scans or MAX_SCANS
+        self.per_owner = per_owner or SCANS_PER_OWNER
+        self.idle_timeout = idle_timeout
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    def create(self, owner, **kwargs):
+        """Open a scan for `owner`; None if MAX_SCANS are already open.
+
+        The owner's oldest scans are closed first to stay within `per_owner`.
+        """
+        with self._lock:
+            self._expire()
+            own = sorted((scan for scan in self._scans.values() if scan.owner == owner),
+                         key=lambda scan: scan.last_active)
+            for scan in own[:max(0, len(own) - self.per_owner + 1)]:
+                scan.close()
+                del self._scans[scan.id]
+            if len(self._scans) >= self.max_scans:
+                return None
+            scan = ScanSession(owner, **kwargs)
+            self._scans[scan.id] = scan
+            return scan
+
+    def get(self, scan_id, owner):
+        with self._lock:
+            self._expire()
+            scan = self._scans.get(scan_id)
+        if scan is None or scan.owner != owner:
+            return None
+        return scan
+
+    def close(self, scan_id):
+        with self._lock:
+            scan = self._scans.pop(scan_id, None)
+        return scan.close() if scan else None
+
+    def _expire(self):
+        now = time.monotonic()
+        for scan_id, scan in list(self._scans.items()):
+            if scan.closed or now - scan.last_active > self.idle_timeout:
+                scan.close()
+                del self._scans[scan_id]
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_scan_registry():
+    """Return the process-wide ScanRegistry, creating it on first use."""
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = ScanRegistry()
+    return _default_registry
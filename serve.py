@@ -0,0 +1,52 @@
+"""Production launcher for the food tracker server.
+
+    python serve.py                  # waitress on 0.0.0.0:5000
+    python serve.py --threads 64 --port 8000
+    python serve.py --dev            # Flask's development server, as before
+
+Every request gets its own worker thread, so a slow OpenFoodFacts, Google
+Translate or Sheets call only holds up the request that made it; other
+phones on the LAN keep being served. CPU-heavy barcode decoding runs in the
+decode process pool.
+
+The port is bound first and the heavy imports and decode workers are loaded
+in a background thread afterwards (see server.warm_up), so a restart is
+accepting requests well within a second. --lazy skips the warm-up and loads
+everything on first use instead.
+"""
+import argparse
+import os
+
+from server import app, start_warm_up
+
+THREADS = int(os.environ.get('FOOD_TRACKER_THREADS', 32))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the food tracker server.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--threads', type=int, default=THREADS,
+                        help='requests handled at once; most of their time is spent waiting on the network')
+    parser.add_argument('--dev', action='store_true', help="use Flask's development server")
+    parser.add_argument('--lazy', action='store_true',
+                        help='load dependencies on first use instead of warming up after start')
+    args = parser.parse_args()
+
+    if args.dev:
+        if not args.lazy:
+            start_warm_up()
+        app.run(host=args.host, port=args.port, threaded=True)
+        return
+
+    from waitress.server import create_server
+    server = create_server(app, host=args.host, port=args.port, threads=args.threads,
+                           connection_limit=max(100, 4 * args.threads), channel_timeout=120)
+    if not args.lazy:
+        start_warm_up()
+    print(f"Serving on http://{args.host}:{args.port} with {args.threads} threads")
+    server.run()
+
+
+if __name__ == '__main__':
+    main()
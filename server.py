@@ -1,34 +1,333 @@
-from flask import Flask, request, jsonify, render_template
-from PIL import Image
-from pyzbar.pyzbar import decode, ZBarSymbol
+from flask import Flask, Request, Response, g, request, jsonify, render_template, stream_with_context
+from werkzeug.utils import secure_filename
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import io
 import os
-from online_barcode_search import lookup_product_openfoodfacts
-from receipt_parser import get_items_from_receipt_text
-import pandas as pd
-from match_prices import fuzzy_match_prices
-from save_to_sheets import save_to_google_sheets
+import zipfile
+from decode_pool import PoolBusy, get_decode_pool
+from online_barcode_search import ProductRecord, is_not_found, lookup_products_batch
+from receipt_parser import extract_items, parse_receipt_stream, translated_frame
+from jobs import get_job_queue
+from product_cache import CACHE_DIR, MISS, get_product_cache
+from result_cache import get_result_cache, receipt_key
+from scan_session import get_scan_registry
+from storage import get_store
+from translation import get_translation_cache
+import metrics
+import json
+import threading
 import time
+import uuid
 
 
 app = Flask(__name__)
+matcher = None
+matcher_lock = threading.Lock()
 
-# Delet decoded_barcodes.csv on startup
-def delete_decoded_barcodes():
-    file_path = 'receipts/decoded_barcodes.csv'
-    if os.path.exists(file_path):
+SESSION_COOKIE = 'food_session'
+
+
+def current_session_id():
+    """Session the request belongs to. Stored rows are scoped by it."""
+    if 'session_id' not in g:
+        g.session_id = (request.headers.get('X-Session-Id') or request.cookies.get(SESSION_COOKIE)
+                        or uuid.uuid4().hex)
+    return g.session_id
+
+
+@app.after_request
+def remember_session(response):
+    if 'session_id' in g and request.cookies.get(SESSION_COOKIE) != g.session_id:
+        response.set_cookie(SESSION_COOKIE, g.session_id, samesite='Lax')
+    return response
+
+
+# FOOD_TRACKER_PROFILE=1 profiles requests sent with ?profile=1 or an
+# X-Profile: 1 header; =all profiles every request. Profiles are saved to
+# PROFILE_DIR and the top functions are printed.
+PROFILE = os.environ.get('FOOD_TRACKER_PROFILE', '0')
+PROFILE_DIR = os.path.join(CACHE_DIR, 'profiles')
+# cProfile allows one active profiler per process; other requests run unprofiled
+profile_lock = threading.Lock()
+
+
+def wants_profile():
+    if PROFILE == 'all':
+        return True
+    return PROFILE == '1' and '1' in (request.args.get('profile'), request.headers.get('X-Profile'))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if PROFILE != '0' and wants_profile() and profile_lock.acquire(blocking=False):
+        import cProfile
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def record_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profile_lock.release()
+        dump_profile(profiler)
+    if 'request_start' in g:
+        # Streamed responses (NDJSON) are timed up to their first byte
+        endpoint = request.endpoint or 'unknown'
+        metrics.observe('request', time.perf_counter() - g.request_start, endpoint=endpoint)
+        metrics.inc('requests', endpoint=endpoint, status=response.status_code)
+    return response
+
+
+def dump_profile(profiler):
+    import pstats
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}"
+                                     f"-{uuid.uuid4().hex[:6]}.prof")
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(20)
+    print(f"Profile of {request.method} {request.path} saved to {path}\n{out.getvalue()}")
+
+
+@metrics.register_collector
+def cache_stats():
+    product = get_product_cache().stats()
+    translation = get_translation_cache().stats()
+    results = get_result_cache().stats()
+    return {
+        'product_cache_hit_ratio': product['hit_rate'],
+        'product_cache_entries': product['entries'],
+        'translation_cache_hit_ratio': translation['hit_rate'],
+        'result_cache_hit_ratio': results['hit_rate'],
+        'result_cache_entries': results['entries'],
+    }
+
+
+def observe_decode(timings):
+    for stage, seconds in timings.items():
+        metrics.observe(f'decode_{stage}', seconds)
+
+
+# pandas, OpenCV/zbar, rapidfuzz and gspread are imported where they are
+# first used, so the server accepts requests before they have loaded.
+# warm_up() loads them (and starts the decode workers) in the background.
+def warm_up():
+    """Import the heavy dependencies and open shared clients ahead of use."""
+    start = time.perf_counter()
+    import match_prices  # noqa: F401  (pandas, numpy, rapidfuzz)
+    import save_to_sheets  # noqa: F401  (gspread, oauth2client)
+    get_store()
+    get_product_cache()
+    get_translation_cache()
+    get_result_cache()
+    get_decode_pool().warm_up()
+    print(f"Warmed up in {time.perf_counter() - start:.1f}s")
+
+
+def start_warm_up():
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
+class InMemoryRequest(Request):
+    """Keep uploaded files in memory instead of spooling them to temp files.
+
+    /upload_batch may send up to MAX_BATCH_BYTES; everything else is held to
+    MAX_CONTENT_LENGTH.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return io.BytesIO()
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'upload_batch':
+            return MAX_BATCH_BYTES
+        return super().max_content_length
+
+
+app.request_class = InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024
+
+
+@app.errorhandler(413)
+def too_large(e):
+    limit = request.max_content_length
+    return jsonify({'error': f'upload too large (limit {limit // (1024 * 1024)} MB)'}), 413
+
+# Set FOOD_TRACKER_ARCHIVE_DIR to keep a copy of every uploaded photo
+ARCHIVE_DIR = os.environ.get('FOOD_TRACKER_ARCHIVE_DIR')
+archive_executor = ThreadPoolExecutor(max_workers=1)
+# Seconds an upload may wait for its barcodes before the request gives up
+DECODE_TIMEOUT = float(os.environ.get('FOOD_TRACKER_DECODE_TIMEOUT', 30))
+
+
+def archive_upload(data, filename):
+    """Write an uploaded photo to ARCHIVE_DIR off the request thread."""
+    def write():
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(ARCHIVE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}-{secure_filename(filename)}")
+        with open(path, 'wb') as f:
+            f.write(data)
+    archive_executor.submit(write)
+
+
+def upload_bytes(file):
+    """The uploaded file's bytes, read from memory (archived if enabled)."""
+    if isinstance(file.stream, io.BytesIO):
+        data = file.stream.getvalue()
+    else:
+        data = file.read()
+    if ARCHIVE_DIR:
+        archive_upload(data, file.filename)
+    return data
+
+
+def decode_upload(data, wait=None):
+    """Barcode strings in a photo, reusing the result for copies seen before.
+
+    Returns (codes, timings, key, cached); codes is None if `data` isn't an
+    image. `key` identifies the photo (or an earlier copy with the same
+    barcodes) in the result cache. Raises PoolBusy/TimeoutError like
+    DecodePool.decode.
+    """
+    cache = get_result_cache()
+    start = time.perf_counter()
+    key, codes, phash = cache.get_image(data)
+    if codes is not MISS:
+        metrics.inc('result_cache_lookups', kind='image', outcome='hit')
+        elapsed = time.perf_counter() - start
+        return codes, {'cache': elapsed, 'total': elapsed}, key, True
+    metrics.inc('result_cache_lookups', kind='image', outcome='miss')
+    lookup_time = time.perf_counter() - start
+
+    decoded, timings = get_decode_pool().decode(data, timeout=DECODE_TIMEOUT, wait=wait)
+    observe_decode(timings)
+    timings['cache'] = lookup_time
+    if decoded is None:
+        return None, timings, key, False
+    codes = [b.data.decode('utf-8') for b in decoded]
+    similar = cache.similar(phash, codes) if phash is not None else None
+    if similar is not None:
+        # A recompressed copy of a photo already seen: store it under that key
+        metrics.inc('result_cache_lookups', kind='image', outcome='similar')
+        key = similar
+    else:
+        cache.put(key, codes, phash)
+    return codes, timings, key, False
+
+
+def store_once(key, session_id, write):
+    """Run write() unless this session already stored the result `key`.
+
+    The result is only recorded as stored if write() succeeds, so a failed
+    write is retried when the upload is resent. Returns whether it wrote.
+    """
+    cache = get_result_cache()
+    if not cache.mark_stored(key, session_id):
+        return False
+    try:
+        write()
+    except Exception:
+        cache.unmark_stored(key, session_id)
+        raise
+    return True
+
+
+def settled_codes(codes, lookups):
+    """The distinct codes whose lookup gave an answer (found or not found), not an error."""
+    return [code for code in dict.fromkeys(codes)
+            if is_not_found(lookups.get(code)) or 'error' not in lookups[code]]
+
+
+def store_codes_once(key, session_id, codes, products):
+    """Store the `products` rows of photo `key` for the `codes` this session hasn't stored yet.
+
+    Codes are claimed one by one, so a photo resent after a lookup failed
+    stores the missing products without repeating the others. Returns the
+    newly claimed codes.
+    """
+    cache = get_result_cache()
+    claimed = cache.claim_codes(key, session_id, codes)
+    rows = [p for p in products if p['barcode'] in claimed]
+    if rows:
         try:
-            os.remove(file_path)
-            print(f"Deleted existing file: {file_path}")
-        except Exception as e:
-            print(f"Error deleting file {file_path}: {e}")
+            get_store().add_barcodes(session_id, rows)
+        except Exception:
+            cache.release_codes(key, session_id, claimed)
+            raise
+    return claimed
+
+
+# Limits for /upload_batch, on the request body and on what a zip unpacks to
+MAX_BATCH_IMAGES = 100
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+# Threads that feed batch photos to the decode pool; the pool does the CPU work
+batch_executor = ThreadPoolExecutor(max_workers=8)
+
+
+def batch_images(files):
+    """(name, bytes) for every uploaded photo, unpacking .zip uploads."""
+    images = []
+    total = 0
+    for file in files:
+        if not file.filename:
+            continue
+        data = upload_bytes(file)
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                        continue
+                    total += info.file_size
+                    if total > MAX_BATCH_BYTES:
+                        raise ValueError('zip contents too large')
+                    images.append((info.filename, archive.read(info)))
+        else:
+            images.append((file.filename, data))
+        if len(images) > MAX_BATCH_IMAGES:
+            raise ValueError(f'at most {MAX_BATCH_IMAGES} images per batch')
+    return images
+
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage timings, request counts and cache hit rates for Prometheus."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/parse_receipt', methods=['POST'])
 def parse_receipt():
-    """Handles receipt text uploads from users."""
+    """Handles receipt text uploads from users.
+
+    JSON bodies ({"text": ...}) get a JSON list back. A text/plain body
+    (optionally chunked) is parsed while it streams in, and items are
+    streamed back as NDJSON as soon as they are parsed.
+    """
+    session_id = current_session_id()
+    receipt_id = uuid.uuid4().hex
+
+    if request.mimetype == 'text/plain':
+        def generate():
+            batch = []
+            for item in parse_receipt_stream(request.stream, output_csv=None):
+                batch.append(item)
+                if len(batch) >= 100:
+                    get_store().add_receipt_items(session_id, receipt_id, batch)
+                    batch = []
+                yield json.dumps(item) + '\n'
+            if batch:
+                get_store().add_receipt_items(session_id, receipt_id, batch)
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
     if not request.is_json:
         return jsonify({'error': 'Invalid input, JSON expected'}), 400
 
@@ -38,23 +337,73 @@ def parse_receipt():
     if not receipt_text:
         return jsonify({'error': 'No receipt text provided'}), 400
 
-    df = get_items_from_receipt_text(receipt_text)
-
+    # The same receipt pasted again is parsed from the result cache, and
+    # its lines are only stored once per session. Only the parse is cached:
+    # names are translated every time (from the translation cache), so
+    # offline fallbacks from a Google Translate outage don't stick.
+    cache = get_result_cache()
+    key = receipt_key(receipt_text)
+    extracted = cache.get(key)
+    cached = extracted is not MISS
+    metrics.inc('result_cache_lookups', kind='receipt', outcome='hit' if cached else 'miss')
+    if not cached:
+        with metrics.timed('receipt_parse'):
+            extracted = extract_items(receipt_text.split('\n'))
+        cache.put(key, extracted)
     # Convert DataFrame to list of dicts for JSON response
-    items = df.to_dict(orient='records')
+    items = translated_frame(extracted).to_dict(orient='records')
+    if not store_once(key, session_id,
+                      lambda: get_store().add_receipt_items(session_id, receipt_id, items)):
+        print("Receipt already stored for this session, not adding its lines again")
+
+    return jsonify({'items': items}), 200, {'X-Result-Cache': 'hit' if cached else 'miss'}
+
+def match_and_export(session_id, store=''):
+    """Match the session's products to receipt lines, write them to the sheet
+    and add the matched prices to the price history."""
+    global matcher
+    from match_prices import IncrementalMatcher
+    from price_history import get_price_history, rows_from_matches
+    from save_to_sheets import save_to_google_sheets
+    with matcher_lock:
+        if matcher is None:
+            matcher = IncrementalMatcher()
+    with metrics.timed('match'):
+        result_df = matcher.match(session_id, threshold=60, assignment='optimal')
+    get_store().save_matches(session_id, result_df)
+    get_price_history().append(rows_from_matches(result_df, store=store))
+    with metrics.timed('sheets_export'):
+        save_to_google_sheets(result_df)
+    return {'matched': int(result_df['matched_price'].notna().sum()),
+            'products': len(result_df),
+            'unmatched_receipt_lines': result_df.attrs.get('unmatched_receipt_lines', [])}
 
-    return jsonify({'items': items}), 200
 
 @app.route("/save_to_sheets", methods=["POST"])
 def save_to_sheets():
-    
-    try:
-        result_df = fuzzy_match_prices(threshold=60)
-        save_to_google_sheets(result_df)
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    """Queue a match + export for this session and return its job right away.
+
+    Clicking again while a save is still waiting joins that save instead of
+    queuing another. Poll /jobs/<job_id> for the outcome. An optional
+    {"store": ...} body names the shop for the price history.
+    """
+    session_id = current_session_id()
+    store = (request.get_json(silent=True) or {}).get('store', '')
+    # One save per session at a time, whatever the store: saves replace the session's matches.
+    # Not retried as a whole: SheetsSink.write already retries transient Sheets errors.
+    job = get_job_queue().submit(('save_to_sheets', session_id, store),
+                                 lambda: match_and_export(session_id, store), owner=session_id,
+                                 max_retries=0, serial=('save_to_sheets', session_id))
+    return jsonify({'status': job.status, 'job_id': job.id,
+                    'status_url': f'/jobs/{job.id}'}), 202
+
 
-    return jsonify({'status': 'success', 'message': 'Data saved to Google Sheets (stub)'}), 200
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None or job.owner != current_session_id():
+        return jsonify({'error': 'no such job'}), 404
+    return jsonify(job.to_dict()), 200
 
 
 @app.route("/upload", methods=["POST"])
@@ -67,60 +416,236 @@ def upload_file():
     if file.filename == "":
         return "No selected file", 400
     
-    file_path = os.path.join("img", file.filename)
-    file.save(file_path)
+    try:
+        product_codes, timings, key, cached = decode_upload(upload_bytes(file))
+    except PoolBusy:
+        return jsonify({'error': 'server busy decoding other photos, try again'}), 429, {'Retry-After': '2'}
+    except TimeoutError:
+        return jsonify({'error': 'decoding the photo took too long'}), 504
+    if product_codes is None:
+        return jsonify({'error': 'could not decode image'}), 400
 
-    print(f"File saved: {file_path}")
+    print(f"{'Cached' if cached else 'Decoded'} {len(product_codes)} barcodes in {timings['total'] * 1000:.0f} ms "
+          f"({', '.join(f'{k} {v * 1000:.0f}' for k, v in timings.items() if k != 'total')})")
 
+    # For each detected barcode, attempt a product lookup (best-effort)
+    with metrics.timed('lookup'):
+        lookups = lookup_products_batch(product_codes)
+    products = []
+    for product_code in product_codes:
+        print(product_code)
+        record = ProductRecord.from_lookup(product_code, lookups.get(product_code))
+        if record is not None:
+            products.append(record.as_dict())
 
-    # Decode image bytes into OpenCV image
-    #file is now at img/file.filename
-    img = Image.open('img/image.jpg')
+    if not products:
+        return jsonify({'error': 'no barcodes found'}), 400
 
-    if img is None:
-        return jsonify({'error': 'could not decode image'}), 400
+    # A photo sent again (or a copy of it) was already stored for this session,
+    # except for codes whose lookup failed last time
+    session_id = current_session_id()
+    if not store_codes_once(key, session_id, settled_codes(product_codes, lookups), products):
+        print("Photo already stored for this session, not adding its products again")
 
-    decoded_list = decode(img)
+    response = jsonify(products)
+    response.headers['Server-Timing'] = ', '.join(
+        f'{k};dur={v * 1000:.1f}' for k, v in timings.items())
+    response.headers['X-Result-Cache'] = 'hit' if cached else 'miss'
+    return response, 200
 
-    # For each detected barcode, attempt a product lookup (best-effort)
-    products_df = pd.DataFrame(columns=['barcode', "product_name", "size", "calories", "fat", "protein", "carbohydrates", "fiber", "sugars"])
-    for bcode in decoded_list:
-        product = []
-        product_code = bcode.data.decode("utf-8")
-        print(product_code)
-        product.append(product_code)
-        # simple numeric barcodes are the typical UPC/EAN formats
-        #product_info = lookup_product_openfoodfacts(code)
-        #b['product'] = product_info
+@app.route("/upload_batch", methods=["POST"])
+def upload_batch():
+    """Decode many photos (multipart "files", or a zip) in one request.
 
-        product_dict = lookup_product_openfoodfacts(product_code)
-        if not product_dict:
-            continue
+    Photos are decoded in parallel and streamed back as NDJSON, one
+    {"image", "barcodes", "ms"} line per photo as it finishes. Barcodes seen
+    in several photos are looked up once, the products of every code read
+    are stored in a single write, and the last line is {"products": [...], "not_found": [...]}.
+    Photos this session already uploaded are answered from the result cache
+    and their products are not stored again.
+    """
+    files = request.files.getlist("files") + request.files.getlist("file")
+    if not files:
+        return jsonify({'error': 'no files in request'}), 400
+    try:
+        images = batch_images(files)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+    if not images:
+        return jsonify({'error': 'no images in request'}), 400
+
+    session_id = current_session_id()
+    futures = {batch_executor.submit(decode_upload, data, DECODE_TIMEOUT): name
+               for name, data in images}
+    del images
+
+    def generate():
+        codes = {}
+        photos = []
+        claimed = []
+        cache = get_result_cache()
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    found, timings, key, cached = future.result()
+                except (PoolBusy, TimeoutError):
+                    yield json.dumps({'image': name, 'error': 'timed out waiting for the decoder'}) + '\n'
+                    continue
+                if found is None:
+                    yield json.dumps({'image': name, 'error': 'could not decode image'}) + '\n'
+                    continue
+                for code in found:
+                    codes.setdefault(code, name)
+                photos.append((key, found))
+                yield json.dumps({'image': name, 'barcodes': found, 'cached': cached,
+                                  'ms': round(timings['total'] * 1000, 1)}) + '\n'
+
+            with metrics.timed('lookup'):
+                lookups = lookup_products_batch(list(codes))
+            products, not_found = [], []
+            for code in codes:
+                record = ProductRecord.from_lookup(code, lookups.get(code))
+                if record is None:
+                    not_found.append(code)
+                else:
+                    products.append(record.as_dict())
+            by_code = {p['barcode']: p for p in products}
+            new_products = []
+            for key, found in photos:
+                # Codes this session already stored from this photo are skipped, and
+                # codes whose lookup failed are left for a resend
+                fresh = cache.claim_codes(key, session_id, settled_codes(found, lookups))
+                claimed.append((key, fresh))
+                # One row per code read, like /upload: two identical products are two rows
+                new_products += [by_code[code] for code in found if code in fresh and code in by_code]
+            if new_products:
+                get_store().add_barcodes(session_id, new_products)
+        except BaseException:
+            # Nothing was stored (a decode or lookup failed, or the client went
+            # away mid-stream): let a resent batch store these photos
+            for key, fresh in claimed:
+                cache.release_codes(key, session_id, fresh)
+            raise
+        print(f"Batch upload: {len(futures)} images, {len(codes)} unique barcodes, "
+              f"{len(products)} products")
+        yield json.dumps({'products': products, 'not_found': not_found}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def history_query_args():
+    """Filters shared by the /prices endpoints, from the query string."""
+    args = request.args
+    return {'metric': args.get('metric', 'price_per_kg'), 'name': args.get('name'),
+            'store': args.get('store'), 'since': args.get('since'), 'until': args.get('until'),
+            'by': args.get('by', 'name')}
+
+
+@app.route("/prices/trend")
+def price_trend():
+    """How a price metric moved: ?name=FARINA&metric=price_per_kg&period=month.
+
+    metric is price, price_per_kg, price_per_100kcal or price_per_g_protein;
+    filter with name (substring of the receipt name), barcode, store,
+    since/until (YYYY-MM-DD).
+    """
+    from price_history import get_price_history
+    start = time.perf_counter()
+    try:
+        rows = get_price_history().trend(period=request.args.get('period', 'month'),
+                                         barcode=request.args.get('barcode'), **history_query_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'trend': rows, 'ms': round((time.perf_counter() - start) * 1000, 2)}), 200
+
+
+@app.route("/prices/cheapest")
+def price_cheapest():
+    """Products with the lowest median metric: ?metric=price_per_g_protein&limit=10."""
+    from price_history import get_price_history
+    start = time.perf_counter()
+    try:
+        rows = get_price_history().cheapest(limit=request.args.get('limit', 10, type=int),
+                                            **history_query_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'cheapest': rows, 'ms': round((time.perf_counter() - start) * 1000, 2)}), 200
+
+
+# An events stream ends after this long; the page reconnects with its cursor
+SCAN_STREAM_SECONDS = 120
+
+
+@app.route("/scan", methods=["POST"])
+def scan_start():
+    """Open a live scan. Send frames to frame_url, read products from events_url."""
+    session_id = current_session_id()
+    scan = get_scan_registry().create(
+        session_id, on_products=lambda products: get_store().add_barcodes(session_id, products))
+    if scan is None:
+        return jsonify({'error': 'too many live scans open, try again later'}), 429, {'Retry-After': '5'}
+    return jsonify({'scan_id': scan.id, 'frame_url': f'/scan/{scan.id}/frame',
+                    'events_url': f'/scan/{scan.id}/events'}), 201
+
+
+@app.route("/scan/<scan_id>/frame", methods=["POST"])
+def scan_frame(scan_id):
+    """One camera frame (JPEG body, or multipart field "frame").
+
+    Answers straight away; "accepted" is false if the frame was dropped
+    because the previous one is still being decoded.
+    """
+    scan = get_scan_registry().get(scan_id, current_session_id())
+    if scan is None:
+        return jsonify({'error': 'no such scan'}), 404
+    frame = request.files.get('frame')
+    data = upload_bytes(frame) if frame else request.get_data()
+    if not data:
+        return jsonify({'error': 'empty frame'}), 400
+    accepted = scan.submit_frame(data)
+    metrics.inc('scan_frames', outcome='accepted' if accepted else 'dropped')
+    return jsonify({'accepted': accepted, 'seen': len(scan.seen)}), 202
+
+
+@app.route("/scan/<scan_id>/events")
+def scan_events(scan_id):
+    """NDJSON stream of the scan's events from ?cursor=N on.
+
+    Events are {"type": "barcode"|"product"|"not_found", "seq", ...}; a
+    {"type": "ping"} line is sent when nothing happened for a while. The
+    last line is {"type": "end", "cursor", "closed"}: reconnect with that
+    cursor unless the scan was closed.
+    """
+    scan = get_scan_registry().get(scan_id, current_session_id())
+    if scan is None:
+        return jsonify({'error': 'no such scan'}), 404
+    cursor = request.args.get('cursor', 0, type=int)
+
+    def generate():
+        position = cursor
+        deadline = time.monotonic() + SCAN_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            events = scan.wait_events(position, timeout=min(15, max(0, deadline - time.monotonic())))
+            position += len(events)
+            for event in events:
+                yield json.dumps(event) + '\n'
+            if not events:
+                if scan.closed:
+                    break
+                yield json.dumps({'type': 'ping'}) + '\n'
+        yield json.dumps({'type': 'end', 'cursor': position, 'closed': scan.closed}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route("/scan/<scan_id>", methods=["DELETE"])
+def scan_stop(scan_id):
+    if get_scan_registry().get(scan_id, current_session_id()) is None:
+        return jsonify({'error': 'no such scan'}), 404
+    return jsonify(get_scan_registry().close(scan_id)), 200
 
-        product.append(product_dict["product_name"])
-        num_servings = product_dict.get('quantity')  # Default to 1 if quantity is missing or zero
-        if not num_servings:
-            num_servings = 1
-        product.append(num_servings)
-
-        macro_values = product_dict.get('macros_per100', {})
-        product.append(macro_values.get('calories'))
-        product.append(macro_values.get('fat'))
-        product.append(macro_values.get('protein'))
-        product.append(macro_values.get('carbohydrates'))
-        product.append(macro_values.get('fiber'))
-        product.append(macro_values.get('sugars'))
-        products_df = pd.concat([products_df, pd.DataFrame([product], columns=products_df.columns)], ignore_index=True)
-
-    if products_df.empty:
-        return jsonify({'error': 'no barcodes found'}), 400
-    
-    # Save to CSV with append mode
-    file_exists = os.path.exists('receipts/decoded_barcodes.csv')
-    products_df.to_csv('receipts/decoded_barcodes.csv', mode='a', header=not file_exists, index=False)
-    
-    return jsonify(products_df.to_dict(orient='records')), 200
 
 if __name__ == '__main__':
-    delete_decoded_barcodes()
+    start_warm_up()
     app.run(host='0.0.0.0', port=5000)
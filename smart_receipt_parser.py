@@ -1,43 +1,29 @@
-import re
+from receipt_engine import parse as parse_receipt
 
 class SmartReceiptParser:
+    """Dict-style front end to receipt_engine.
+
+    Prices and item names used to be regexed separately and zipped, which
+    misaligned on quantity lines ("2 F. RATLLAT S/LACTOSA" with a unit price
+    and a total) and on payment lines. Both now come from the same pass.
+    """
     def __init__(self, receipt_text):
         
         self.receipt_text = receipt_text
-        self.cleanup_receipt_text()
         self.receipt_list = self.receipt_text.split()
+        self.items = parse_receipt(receipt_text)
 
 
     def parse(self):
-        # Extract prices using regex
-        prices = self.extract_prices()
-        #fix bad european decimal separator
-        prices = [price.replace(',', '.') for price in prices]
-        # Extract items using regex
-        items = self.extract_items()
-        
-        return  dict(zip(items, prices))
-
-    def cleanup_receipt_text(self):
-        #add more cleaning steps as needed, for example removing newlines, tabs, etc.
-        self.receipt_text = self.receipt_text.replace('.', ' ')
-        return 
+        # {item name: line total}, with "." as decimal separator
+        return dict(zip(self.extract_items(), self.extract_prices()))
 
     def extract_prices(self):
-        #prices = re.findall(r'\d+[,.]\d{0,2}', self.receipt_text)
-        prices = re.findall(r'\d+[,.]\d{1,2}', self.receipt_text)
-        return prices
+        return [f"{item['price']:.2f}" for item in self.items]
 
 
     def extract_items(self):
-        items = re.findall(r'[\S+ ]+', self.receipt_text)
-        extracted_items = []
-        for item in items:
-            if any(char.isalpha() for char in item):
-                #this is an item, but it needs to be cleaned
-                item = item.strip().strip('0123456789.,').strip()
-                extracted_items.append(item)
-        return extracted_items
+        return [item['original_name'] for item in self.items]
     
 if __name__ == '__main__':
     # Example usage
@@ -6,8 +6,8 @@ cd /d "%~dp0"
 REM Activate virtual environment
 call venv\Scripts\activate.bat
 
-REM Run the server
-python server.py
+REM Run the server (waitress; use "python serve.py --dev" for Flask's dev server)
+python serve.py %*
 
 REM Keep window open if there's an error
 if errorlevel 1 (
@@ -2,7 +2,12 @@
 document.getElementById("uploadForm").addEventListener("submit", async (event) => {
     event.preventDefault();
     
-    let fileInput = document.getElementById("fileInput").files[0];
+    let files = document.getElementById("fileInput").files;
+    if (files.length > 1 || (files.length === 1 && files[0].name.endsWith(".zip"))) {
+        await uploadBatch(files);
+        return;
+    }
+    let fileInput = files[0];
     if (!fileInput) return;
 
     let formData = new FormData();
@@ -17,7 +22,7 @@ document.getElementById("uploadForm").addEventListener("submit", async (event) =
             body: formData
         });
 
-        let result = await response.json();
+        let result = await readJson(response);
         
         if (response.ok) {
             document.getElementById("status").innerHTML = '<p class="status success">Barcode scanned successfully!</p>';
@@ -30,6 +35,183 @@ document.getElementById("uploadForm").addEventListener("submit", async (event) =
     }
 });
 
+// Error pages (a 413 from a proxy, say) are not JSON; don't let parsing them hide the error
+async function readJson(response) {
+    if ((response.headers.get("Content-Type") || "").includes("application/json")) {
+        return await response.json();
+    }
+    return { error: `${response.status} ${response.statusText}` };
+}
+
+// Send several photos (or a zip of them) in one request; results stream back as NDJSON
+async function uploadBatch(files) {
+    let formData = new FormData();
+    for (let file of files) {
+        formData.append("files", file);
+    }
+
+    let status = document.getElementById("status");
+    status.innerHTML = `<p class="status info">Uploading ${files.length} files...</p>`;
+    document.getElementById("barcodeResults").style.display = "none";
+
+    try {
+        let response = await fetch("/upload_batch", {
+            method: "POST",
+            body: formData
+        });
+        if (!response.ok) {
+            let result = await readJson(response);
+            status.innerHTML = `<p class="status error">Error: ${result.error || 'Unknown error'}</p>`;
+            return;
+        }
+
+        let reader = response.body.getReader();
+        let decoder = new TextDecoder();
+        let buffered = "";
+        let doneImages = 0;
+        while (true) {
+            let { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            let lines = buffered.split("\n");
+            buffered = lines.pop();
+            for (let line of lines) {
+                if (!line.trim()) continue;
+                let message = JSON.parse(line);
+                if (message.products) {
+                    let missing = message.not_found.length ? ` (${message.not_found.length} not found)` : "";
+                    status.innerHTML = `<p class="status success">Scanned ${message.products.length} products${missing}</p>`;
+                    displayBarcodeResults(message.products);
+                } else {
+                    doneImages += 1;
+                    status.innerHTML = `<p class="status info">Decoded ${doneImages} images, last: ${message.image}</p>`;
+                }
+            }
+        }
+    } catch (error) {
+        status.innerHTML = `<p class="status error">Error: ${error.message}</p>`;
+    }
+}
+
+// Live scan: stream small camera frames to the server; each product shows up once
+let liveScan = null;
+
+document.getElementById("liveScanButton").addEventListener("click", async () => {
+    if (liveScan) {
+        await stopLiveScan();
+    } else {
+        await startLiveScan();
+    }
+});
+
+async function startLiveScan() {
+    let status = document.getElementById("status");
+    let video = document.getElementById("liveVideo");
+    let stream;
+    try {
+        stream = await navigator.mediaDevices.getUserMedia({ video: { facingMode: "environment", width: 640 } });
+        let response = await fetch("/scan", { method: "POST" });
+        let scan = await response.json();
+        if (!response.ok) {
+            stream.getTracks().forEach(track => track.stop());
+            status.innerHTML = `<p class="status error">Error: ${scan.error || 'Unknown error'}</p>`;
+            return;
+        }
+        video.srcObject = stream;
+        video.style.display = "block";
+        await video.play();
+
+        liveScan = { scan: scan, stream: stream, products: [], sending: false,
+                     canvas: document.createElement("canvas") };
+        liveScan.timer = setInterval(() => sendFrame(liveScan), 150);
+        readScanEvents(liveScan);
+        document.getElementById("liveScanButton").innerText = "Stop live scan";
+        status.innerHTML = '<p class="status info">Scanning... point the camera at the barcodes</p>';
+    } catch (error) {
+        if (stream) stream.getTracks().forEach(track => track.stop());
+        status.innerHTML = `<p class="status error">Error: ${error.message}</p>`;
+    }
+}
+
+async function sendFrame(state) {
+    // Skip frames while the last one is uploading; the server drops frames
+    // that arrive while it is still decoding too
+    let video = document.getElementById("liveVideo");
+    if (state.sending || !video.videoWidth) return;
+    let scale = Math.min(1, 640 / video.videoWidth);
+    state.canvas.width = Math.round(video.videoWidth * scale);
+    state.canvas.height = Math.round(video.videoHeight * scale);
+    state.canvas.getContext("2d").drawImage(video, 0, 0, state.canvas.width, state.canvas.height);
+
+    state.sending = true;
+    try {
+        let frame = await new Promise(resolve => state.canvas.toBlob(resolve, "image/jpeg", 0.8));
+        await fetch(state.scan.frame_url, {
+            method: "POST",
+            headers: { "Content-Type": "image/jpeg" },
+            body: frame
+        });
+    } catch (error) {
+        console.log("Frame upload failed:", error);
+    } finally {
+        state.sending = false;
+    }
+}
+
+async function readScanEvents(state) {
+    let status = document.getElementById("status");
+    let cursor = 0;
+    while (liveScan === state) {
+        let response = await fetch(`${state.scan.events_url}?cursor=${cursor}`);
+        if (!response.ok) return;
+        let reader = response.body.getReader();
+        let decoder = new TextDecoder();
+        let buffered = "";
+        while (true) {
+            let { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            let lines = buffered.split("\n");
+            buffered = lines.pop();
+            for (let line of lines) {
+                if (!line.trim()) continue;
+                let event = JSON.parse(line);
+                if (event.type === "product") {
+                    state.products.push(event.product);
+                    displayBarcodeResults(state.products);
+                    status.innerHTML = `<p class="status success">Found ${event.product.product_name || event.product.barcode}</p>`;
+                } else if (event.type === "not_found") {
+                    status.innerHTML = `<p class="status info">Barcode ${event.barcode} not in OpenFoodFacts</p>`;
+                } else if (event.type === "error") {
+                    status.innerHTML = `<p class="status error">Lookup of ${event.barcode} failed (${event.error}), keep it in view to retry</p>`;
+                } else if (event.type === "end") {
+                    cursor = event.cursor;
+                    if (event.closed) return;
+                }
+            }
+        }
+    }
+}
+
+async function stopLiveScan() {
+    let state = liveScan;
+    liveScan = null;
+    clearInterval(state.timer);
+    state.stream.getTracks().forEach(track => track.stop());
+    document.getElementById("liveVideo").style.display = "none";
+    document.getElementById("liveScanButton").innerText = "Live scan";
+    try {
+        let response = await fetch(`/scan/${state.scan.scan_id}`, { method: "DELETE" });
+        let summary = await response.json();
+        if (response.ok) {
+            document.getElementById("status").innerHTML =
+                `<p class="status success">Live scan done: ${state.products.length} products from ${summary.decoded} frames</p>`;
+        }
+    } catch (error) {
+        document.getElementById("status").innerHTML = `<p class="status error">Error: ${error.message}</p>`;
+    }
+}
+
 // Handle paste event for images
 document.addEventListener("paste", async (event) => {
     let items = (event.clipboardData || event.originalEvent.clipboardData).items;
@@ -48,7 +230,7 @@ document.addEventListener("paste", async (event) => {
                     body: formData
                 });
 
-                let result = await response.json();
+                let result = await readJson(response);
                 
                 if (response.ok) {
                     document.getElementById("status").innerHTML = '<p class="status success">Barcode scanned successfully!</p>';
@@ -98,12 +280,45 @@ document.getElementById("parseButton").addEventListener("click", async () => {
 
 // Handle send to Google Sheets button click
 document.getElementById("sendSheetButton").addEventListener("click", async () => {
-    let response = await fetch("/save_to_sheets", {
-        method: "POST",
-    });
+    let status = document.getElementById("sendSheetStatus");
+    try {
+        let response = await fetch("/save_to_sheets", {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json"
+            },
+            body: JSON.stringify({ store: document.getElementById("storeInput").value.trim() })
+        });
+        let job = await response.json();
+        if (!response.ok) {
+            status.innerText = `Error: ${job.error || 'Unknown error'}`;
+            return;
+        }
+
+        // The save runs in the background; poll until it is done
+        status.innerText = "Saving to Google Sheets...";
+        while (job.status === "queued" || job.status === "running") {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            let poll = await fetch(`/jobs/${job.job_id}`);
+            job = await poll.json();
+            if (!poll.ok) {
+                status.innerText = `Error: ${job.error || 'Unknown error'}`;
+                return;
+            }
+            if (job.status === "running" && job.attempts > 1) {
+                status.innerText = `Saving to Google Sheets (attempt ${job.attempts})...`;
+            }
+        }
 
-    let result = await response.text();
-    document.getElementById("sendSheetStatus").innerText = result;
+        if (job.status === "done") {
+            let unmatched = job.result.unmatched_receipt_lines.length;
+            status.innerText = `Saved: ${job.result.matched}/${job.result.products} products matched, ${unmatched} receipt lines unmatched.`;
+        } else {
+            status.innerText = `Save failed: ${job.error}`;
+        }
+    } catch (error) {
+        status.innerText = `Error: ${error.message}`;
+    }
 });
 
 // Helper function to display barcode scan results
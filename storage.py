@@ -0,0 +1,215 @@
+import math
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+
+DB_PATH = os.environ.get('FOOD_TRACKER_DB', os.path.join('receipts', 'food_tracker.sqlite'))
+
+BARCODE_COLUMNS = ['barcode', 'product_name', 'size', 'calories', 'fat', 'protein',
+                   'carbohydrates', 'fiber', 'sugars']
+RECEIPT_COLUMNS = ['simple_name', 'price', 'original_name', 'quantity', 'unit_price']
+MATCH_COLUMNS = ['product_name', 'english_name', 'calories', 'protein', 'fat', 'portion_size',
+                 'num_servings', 'matched_price', 'match_score', 'matched_receipt_name']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS barcodes (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    barcode TEXT NOT NULL,
+    product_name TEXT,
+    size REAL,
+    calories REAL,
+    fat REAL,
+    protein REAL,
+    carbohydrates REAL,
+    fiber REAL,
+    sugars REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_barcodes_session ON barcodes (session_id, id);
+CREATE INDEX IF NOT EXISTS idx_barcodes_barcode ON barcodes (barcode);
+CREATE INDEX IF NOT EXISTS idx_barcodes_created ON barcodes (created_at);
+
+CREATE TABLE IF NOT EXISTS receipt_items (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    receipt_id TEXT NOT NULL,
+    simple_name TEXT,
+    price REAL,
+    original_name TEXT,
+    quantity INTEGER,
+    unit_price REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_receipt_items_session ON receipt_items (session_id, id);
+CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt ON receipt_items (receipt_id);
+CREATE INDEX IF NOT EXISTS idx_receipt_items_created ON receipt_items (created_at);
+
+CREATE TABLE IF NOT EXISTS matched_products (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    product_name TEXT,
+    english_name TEXT,
+    calories REAL,
+    protein REAL,
+    fat REAL,
+    portion_size REAL,
+    num_servings REAL,
+    matched_price REAL,
+    match_score INTEGER,
+    matched_receipt_name TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_matched_products_session ON matched_products (session_id);
+
+-- One row per incremental match: the names and score blocks it added
+DROP TABLE IF EXISTS match_state;
+CREATE TABLE IF NOT EXISTS match_deltas (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    config TEXT NOT NULL,
+    delta BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_match_deltas_session ON match_deltas (session_id, id);
+"""
+
+
+def _clean(value):
+    # pandas hands us NaN/numpy scalars; SQLite wants None and plain Python types
+    if value is None:
+        return None
+    # Values can only be pandas NaN/NA/NaT if something already imported pandas
+    pd = sys.modules.get('pandas')
+    if pd is not None:
+        try:
+            if pd.isna(value):
+                return None
+        except (TypeError, ValueError):
+            pass
+    value = value.item() if hasattr(value, 'item') else value
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+class Store:
+    """Embedded SQLite store for scanned barcodes, receipt lines and matches.
+
+    Replaces the CSV files the endpoints used to hand data over with. All
+    rows are scoped by a session id, so two phones scanning at once don't see
+    each other's products. Every thread gets its own connection; with WAL
+    mode readers never block behind a writer.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, table, columns, session_id, rows, extra=None, conn=None):
+        """Insert `rows`; in its own transaction unless `conn` is already in one."""
+        extra = extra or {}
+        names = ['session_id', *extra, *columns, 'created_at']
+        now = time.time()
+        values = [(session_id, *extra.values(), *(_clean(row.get(c)) for c in columns), now)
+                  for row in rows]
+        sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+        if conn is not None:
+            conn.executemany(sql, values)
+            return len(values)
+        conn = self._conn()
+        with conn:
+            conn.executemany(sql, values)
+        return len(values)
+
+    def _select(self, table, columns, session_id, since_id=0, where='', params=()):
+        sql = (f"SELECT id, {', '.join(columns)} FROM {table} "
+               f"WHERE session_id = ? AND id > ? {where} ORDER BY id")
+        rows = self._conn().execute(sql, (session_id, since_id, *params)).fetchall()
+        import pandas as pd
+        df = pd.DataFrame(rows, columns=['id', *columns])
+        return df.set_index('id')
+
+    def add_barcodes(self, session_id, products):
+        """Store decoded products (dicts keyed by BARCODE_COLUMNS)."""
+        return self._insert('barcodes', BARCODE_COLUMNS, session_id, products)
+
+    def barcodes(self, session_id, since_id=0):
+        """Products scanned in this session, indexed by row id."""
+        return self._select('barcodes', BARCODE_COLUMNS, session_id, since_id)
+
+    def add_receipt_items(self, session_id, receipt_id, items):
+        return self._insert('receipt_items', RECEIPT_COLUMNS, session_id, items,
+                            extra={'receipt_id': receipt_id})
+
+    def receipt_items(self, session_id, since_id=0, receipt_id=None):
+        """Receipt lines parsed in this session, indexed by row id."""
+        if receipt_id is None:
+            return self._select('receipt_items', RECEIPT_COLUMNS, session_id, since_id)
+        return self._select('receipt_items', RECEIPT_COLUMNS, session_id, since_id,
+                            where='AND receipt_id = ?', params=(receipt_id,))
+
+    def save_matches(self, session_id, matched_df):
+        """Replace this session's match results in one transaction.
+
+        Readers see either the old or the new matches, never none, and two
+        saves of the same session can't interleave their rows.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM matched_products WHERE session_id = ?', (session_id,))
+            return self._insert('matched_products', MATCH_COLUMNS, session_id,
+                                matched_df.to_dict(orient='records'), conn=conn)
+
+    def matches(self, session_id):
+        return self._select('matched_products', MATCH_COLUMNS, session_id)
+
+    def add_match_delta(self, session_id, config, delta):
+        """Persist what one IncrementalMatcher update added (names, score blocks).
+
+        Only the new rows and columns are written, so a save costs as much as
+        the change, not the whole history. Deltas made with another
+        preprocessing config are dropped.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM match_deltas WHERE session_id = ? AND config != ?',
+                         (session_id, config))
+            conn.execute('INSERT INTO match_deltas (session_id, config, delta, created_at) '
+                         'VALUES (?, ?, ?, ?)',
+                         (session_id, config, pickle.dumps(delta), time.time()))
+
+    def match_deltas(self, session_id, config):
+        """Saved matcher deltas for this config, oldest first."""
+        rows = self._conn().execute(
+            'SELECT delta FROM match_deltas WHERE session_id = ? AND config = ? ORDER BY id',
+            (session_id, config)).fetchall()
+        return [pickle.loads(row[0]) for row in rows]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide Store, creating it on first use."""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = Store()
+    return _default_store
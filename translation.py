@@ -0,0 +1,215 @@
+import asyncio
+import inspect
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from product_cache import CACHE_DIR
+
+# Set FOOD_TRACKER_OFFLINE=1 to never call Google Translate (tests, no network)
+OFFLINE = os.environ.get('FOOD_TRACKER_OFFLINE') == '1'
+# After a failed request, stay on the offline dictionary for this long
+RETRY_ONLINE_AFTER = 60
+
+# Word-by-word fallback for when Google Translate is unreachable. Only
+# covers words that keep showing up on our receipts and product labels.
+OFFLINE_DICTIONARY = {
+    ('ca', 'en'): {
+        'llet': 'milk', 'semi': 'semi', 'sense': 'without', 's/lactosa': 'lactose free',
+        'lactosa': 'lactose', 'farina': 'flour', 'blat': 'wheat', 'moro': 'corn',
+        'xocolata': 'chocolate', 'negre': 'dark', 'formatge': 'cheese', 'ratllat': 'grated',
+        'crema': 'cream', 'cacauet': 'peanut', 'proteina': 'protein', 'cafe': 'coffee',
+        'cafè': 'coffee', 'soluble': 'instant', 'fresc': 'fresh', 'coriandre': 'coriander',
+        'salmo': 'salmon', 'salmó': 'salmon', 'verdures': 'vegetables', 'pit': 'breast',
+        'pollastre': 'chicken', 'arros': 'rice', 'arròs': 'rice', 'iogurt': 'yogurt',
+        'oli': 'oil', 'oliva': 'olive', 'tonyina': 'tuna', 'pa': 'bread', 'ous': 'eggs',
+        'pernil': 'ham', 'cuit': 'cooked', 'tomaquet': 'tomato', 'tomàquet': 'tomato',
+        'llima': 'lime', 'safata': 'tray', 'mel': 'honey', 'flors': 'flowers',
+        'clara': 'egg white', 'liquida': 'liquid', 'líquida': 'liquid', 'minestra': 'vegetable mix',
+        'contracuixa': 'chicken thigh', 's/pell': 'skinless', 'higienic': 'toilet paper',
+        'compacte': 'compact', 'reboste': 'pantry', 'de': 'of', 'amb': 'with', 'i': 'and',
+    },
+    ('es', 'ca'): {
+        'leche': 'llet', 'harina': 'farina', 'trigo': 'blat', 'miel': 'mel', 'flores': 'flors',
+        'queso': 'formatge', 'rallado': 'ratllat', 'chocolate': 'xocolata', 'negro': 'negre',
+        'crema': 'crema', 'cacahuete': 'cacauet', 'proteina': 'proteina', 'proteína': 'proteina',
+        'cafe': 'cafè', 'café': 'cafè', 'fresco': 'fresc', 'cilantro': 'coriandre',
+        'salmon': 'salmó', 'salmón': 'salmó', 'verduras': 'verdures', 'pechuga': 'pit',
+        'pollo': 'pollastre', 'arroz': 'arròs', 'yogur': 'iogurt', 'aceite': 'oli',
+        'oliva': 'oliva', 'atun': 'tonyina', 'atún': 'tonyina', 'pan': 'pa', 'huevos': 'ous',
+        'jamon': 'pernil', 'jamón': 'pernil', 'cocido': 'cuit', 'tomate': 'tomàquet',
+        'lima': 'llima', 'sin': 'sense', 'lactosa': 'lactosa', 'maiz': 'blat de moro',
+        'maíz': 'blat de moro', 'de': 'de', 'con': 'amb', 'y': 'i',
+    },
+    ('es', 'en'): {
+        'leche': 'milk', 'harina': 'flour', 'trigo': 'wheat', 'miel': 'honey', 'flores': 'flowers',
+        'queso': 'cheese', 'rallado': 'grated', 'chocolate': 'chocolate', 'negro': 'dark',
+        'crema': 'cream', 'cacahuete': 'peanut', 'proteina': 'protein', 'proteína': 'protein',
+        'cafe': 'coffee', 'café': 'coffee', 'fresco': 'fresh', 'cilantro': 'coriander',
+        'salmon': 'salmon', 'salmón': 'salmon', 'verduras': 'vegetables', 'pechuga': 'breast',
+        'pollo': 'chicken', 'arroz': 'rice', 'yogur': 'yogurt', 'aceite': 'oil',
+        'oliva': 'olive', 'atun': 'tuna', 'atún': 'tuna', 'pan': 'bread', 'huevos': 'eggs',
+        'jamon': 'ham', 'jamón': 'ham', 'cocido': 'cooked', 'tomate': 'tomato',
+        'lima': 'lime', 'sin': 'without', 'lactosa': 'lactose', 'maiz': 'corn', 'maíz': 'corn',
+        'de': 'of', 'con': 'with', 'y': 'and',
+    },
+}
+
+_WORD = re.compile(r'\S+')
+
+
+def translate_offline(text, src, dest):
+    """Translate word by word with OFFLINE_DICTIONARY, keeping unknown words."""
+    words = OFFLINE_DICTIONARY.get((src, dest))
+    if not words:
+        return text
+
+    def replace(match):
+        word = match.group(0)
+        translated = words.get(word.lower())
+        if translated is None:
+            return word
+        return translated.upper() if word.isupper() else translated
+
+    return _WORD.sub(replace, text)
+
+
+class TranslationCache:
+    """Persistent (src, dest, text) -> translation cache backed by SQLite."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'translations.sqlite')
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory = {}
+
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                src TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                text TEXT NOT NULL,
+                translated TEXT NOT NULL,
+                PRIMARY KEY (src, dest, text)
+            )""")
+        self._conn.commit()
+
+    def get_many(self, texts, src, dest):
+        """Return {text: translation} for the texts already cached."""
+        found = {}
+        with self._lock:
+            missing = []
+            for text in texts:
+                key = (src, dest, text)
+                if key in self._memory:
+                    found[text] = self._memory[key]
+                else:
+                    missing.append(text)
+            for text in missing:
+                row = self._conn.execute(
+                    'SELECT translated FROM translations WHERE src = ? AND dest = ? AND text = ?',
+                    (src, dest, text)).fetchone()
+                if row is not None:
+                    found[text] = self._memory[(src, dest, text)] = row[0]
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, translations, src, dest):
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO translations (src, dest, text, translated) VALUES (?, ?, ?, ?)',
+                [(src, dest, text, translated) for text, translated in translations.items()])
+            self._conn.commit()
+            for text, translated in translations.items():
+                self._memory[(src, dest, text)] = translated
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+_translator = None
+_translator_lock = threading.Lock()
+_loop = None
+_offline_until = 0.0
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_translation_cache():
+    """Return the process-wide TranslationCache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TranslationCache()
+    return _cache
+
+
+def _translate_online(texts, src, dest):
+    """One googletrans call for the whole list; returns the translated strings.
+
+    Newer googletrans releases made Translator.translate a coroutine, so we
+    drive it on a private event loop when needed. The shared client is not
+    thread-safe, hence the lock around the call.
+    """
+    global _translator, _loop
+    with _translator_lock:
+        if _translator is None:
+            from googletrans import Translator
+            _translator = Translator()
+        result = _translator.translate(texts, src=src, dest=dest)
+        if inspect.isawaitable(result):
+            if _loop is None:
+                _loop = asyncio.new_event_loop()
+            result = _loop.run_until_complete(result)
+    return [r.text for r in result]
+
+
+def translate_batch(texts, src='es', dest='ca', cache=None):
+    """Translate a list of strings, returning translations in the same order.
+
+    Cached strings are answered locally and everything else goes to Google
+    Translate in a single request. If that fails (or FOOD_TRACKER_OFFLINE is
+    set) the offline dictionary is used instead, and keeps being used for
+    RETRY_ONLINE_AFTER seconds. Fallbacks are not cached so a later online
+    run can replace them.
+    """
+    global _offline_until
+    cache = cache or get_translation_cache()
+    unique = list(dict.fromkeys(str(t) for t in texts))
+    translations = cache.get_many(unique, src, dest)
+
+    missing = [t for t in unique if t not in translations]
+    if missing:
+        online = None
+        if not OFFLINE and time.monotonic() >= _offline_until:
+            try:
+                online = _translate_online(missing, src, dest)
+            except Exception as e:
+                print(f"Translation failed, using offline dictionary: {e}")
+                _offline_until = time.monotonic() + RETRY_ONLINE_AFTER
+        if online is not None and len(online) == len(missing):
+            fresh = dict(zip(missing, online))
+            cache.put_many(fresh, src, dest)
+            translations.update(fresh)
+        else:
+            translations.update((t, translate_offline(t, src, dest)) for t in missing)
+
+    return [translations[str(t)] for t in texts]
+
+
+def translate(text, src='es', dest='ca', cache=None):
+    return translate_batch([text], src=src, dest=dest, cache=cache)[0]